@@ -0,0 +1,156 @@
+import os
+from datetime import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+import models
+
+# Strategy used by crud.create_booking: first_fit, best_fit or least_loaded
+ALLOCATION_STRATEGY = os.getenv("ALLOCATION_STRATEGY", "best_fit")
+
+STRATEGIES = ("first_fit", "best_fit", "least_loaded")
+
+OPENING_TIME = time(9, 0)
+CLOSING_TIME = time(18, 0)
+MIN_CONFERENCE_TEAM = 3
+
+SLOT_HOURS_DETAIL = "Booking slot must be between 09:00 and 18:00."
+SLOT_ORDER_DETAIL = "End time must be after start time."
+USER_BUSY_DETAIL = "User already has a booking for this slot."
+TEAM_BUSY_DETAIL = "Team already has a booking for this slot."
+NO_ROOMS_DETAIL = "No rooms of this type exist."
+UNAVAILABLE_DETAIL = "No available room for the selected slot and type."
+TOO_SMALL_DETAIL = "No available conference room is large enough for the team."
+TOO_LARGE_DETAIL = "No conference room is large enough for the team."
+
+class Candidate(NamedTuple):
+    """A room of the requested type with its load for the requested slot"""
+    room_id: int
+    capacity: int
+    occupancy: int  # active bookings overlapping the slot
+    day_load: int   # active bookings on the room for the whole day
+
+def get_strategy(name: Optional[str] = None) -> str:
+    name = name or ALLOCATION_STRATEGY
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy {name!r}, expected one of {', '.join(STRATEGIES)}")
+    return name
+
+def seats(room_type: str, capacity: int) -> int:
+    """Concurrent bookings a room takes: shared desks per seat, other rooms one"""
+    return capacity if room_type == "shared" else 1
+
+def fits(room_type: str, candidate: Candidate, headcount: int = 1) -> bool:
+    if candidate.occupancy >= seats(room_type, candidate.capacity):
+        return False
+    return room_type != "conference" or candidate.capacity >= headcount
+
+def sort_key(strategy: str, room_type: str):
+    """Key ordering fitting candidates from most to least preferred"""
+    if strategy == "best_fit":
+        if room_type == "shared":
+            # Fill the fullest desk that still has a seat, keep emptier desks free
+            return lambda c: (c.capacity - c.occupancy, c.room_id)
+        # Smallest room that holds the headcount, keep large rooms for large teams
+        return lambda c: (c.capacity, c.room_id)
+    if strategy == "least_loaded":
+        return lambda c: (c.day_load, c.occupancy, c.room_id)
+    return lambda c: c.room_id
+
+def choose(strategy: str, room_type: str, candidates: List[Candidate], headcount: int = 1) -> Optional[Candidate]:
+    fitting = [c for c in candidates if fits(room_type, c, headcount)]
+    if not fitting:
+        return None
+    return min(fitting, key=sort_key(strategy, room_type))
+
+def rule_violation(room_type: str, user_id: Optional[int], team_id: Optional[int], headcount: int) -> Optional[str]:
+    """
+    The booking rules that do not depend on other bookings. Returns the
+    error detail, or None when the request is allowed.
+    """
+    # Shared desk: any user, one seat each
+    if room_type == "shared":
+        return None
+    # Conference: team only, team size >= 3
+    if room_type == "conference":
+        if not team_id:
+            return "Conference room requires a team."
+        if headcount < MIN_CONFERENCE_TEAM:
+            return f"Conference room requires a team of at least {MIN_CONFERENCE_TEAM} members."
+        return None
+    # Private: single user only
+    if room_type == "private":
+        return None if user_id else "Private room requires a user."
+    return "Invalid room type."
+
+def slot_violation(slot_start, slot_end, opening=OPENING_TIME, closing=CLOSING_TIME) -> Optional[str]:
+    """Error detail for a slot outside opening hours or ending before it starts; times or minutes alike"""
+    if slot_start < opening or slot_end > closing:
+        return SLOT_HOURS_DETAIL
+    if slot_start >= slot_end:
+        return SLOT_ORDER_DETAIL
+    return None
+
+class Rejected(Exception):
+    """Why allocate() refused a request; `unavailable` when it is valid but every fitting room is taken"""
+    def __init__(self, detail: str, status_code: int = 400, unavailable: bool = False):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.unavailable = unavailable
+
+def allocate(strategy: str, room_type: str, user_id: Optional[int], team_id: Optional[int],
+             user_busy: Callable[[], bool], team_busy: Callable[[], bool],
+             candidates: Callable[[], List[Candidate]], headcount: Callable[[], int]) -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    The allocation rules in order, without a database: (room_id, user_id,
+    team_id) of the booking, or raises Rejected with the first rule that
+    fails. Each input is only called once the rules before it pass, so
+    crud.allocate_stepwise backs them with queries and the simulator with
+    its in-memory state.
+    """
+    # Prevent double booking for user/team
+    if user_id and user_busy():
+        raise Rejected(USER_BUSY_DETAIL)
+    if team_id and team_busy():
+        raise Rejected(TEAM_BUSY_DETAIL)
+    rooms = candidates()
+    if not rooms:
+        raise Rejected(NO_ROOMS_DETAIL, status_code=404)
+    # Children <10 included in headcount
+    count = headcount() if room_type == "conference" and team_id else 1
+    detail = rule_violation(room_type, user_id, team_id, count)
+    if detail:
+        raise Rejected(detail)
+    # Rules that no cancellation can change are checked before availability,
+    # so only requests that could be booked later count as unavailable
+    if room_type == "conference" and not any(c.capacity >= count for c in rooms):
+        raise Rejected(TOO_LARGE_DETAIL)
+    if not any(fits(room_type, c) for c in rooms):
+        raise Rejected(UNAVAILABLE_DETAIL, unavailable=True)
+    chosen = choose(strategy, room_type, rooms, count)
+    if chosen is None:
+        raise Rejected(TOO_SMALL_DETAIL, unavailable=True)
+    # Conference rooms are booked by the team, everything else by the user
+    if room_type == "conference":
+        return chosen.room_id, None, team_id
+    return chosen.room_id, user_id, None
+
+def order_by(strategy: str, room_type: str, occupancy, day_load) -> list:
+    """The same preference as sort_key, as ORDER BY clauses over models.Room"""
+    if strategy == "best_fit":
+        if room_type == "shared":
+            return [models.Room.capacity - occupancy, models.Room.id]
+        return [models.Room.capacity, models.Room.id]
+    if strategy == "least_loaded":
+        return [day_load, occupancy, models.Room.id]
+    return [models.Room.id]
+
+def team_headcount_expr(team_id: int):
+    """Scalar subquery counting team members, children included"""
+    return select(func.count()).select_from(models.team_members).where(
+        models.team_members.c.team_id == team_id
+    ).scalar_subquery()
+
+def team_headcount(db: Session, team_id: int) -> int:
+    return db.execute(select(team_headcount_expr(team_id))).scalar()
@@ -0,0 +1,290 @@
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, select, text, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import models, allocation, tenants
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+ANALYTICS_FETCH_SIZE = 5000
+
+HOURLY = models.RoomUsageHourly.__table__
+DAILY = models.RoomUsageDaily.__table__
+
+def _minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+def hour_minutes(start: int, end: int) -> List[Tuple[int, int]]:
+    """Split [start, end) minutes into (hour, minutes in that hour)"""
+    result = []
+    for hour in range(start // 60, (end - 1) // 60 + 1):
+        minutes = min(end, (hour + 1) * 60) - max(start, hour * 60)
+        if minutes > 0:
+            result.append((hour, minutes))
+    return result
+
+def _upsert(db: Session, table, keys: Tuple[str, ...], rows: List[dict]):
+    """Add the non-key values of each row to the existing rollup row, creating it if needed"""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in rows[0] if name not in keys}
+        )
+        db.execute(stmt)
+        return
+    for row in rows:
+        values = {name: table.c[name] + value for name, value in row.items() if name not in keys}
+        result = db.execute(update(table).where(*(table.c[key] == row[key] for key in keys)).values(**values))
+        if result.rowcount == 0:
+            db.execute(table.insert().values(**row))
+
+def record_booking(db: Session, booking: models.Booking, created: bool):
+    """
+    Apply one booking or cancellation to the rollups, in the caller's
+    transaction so the rollups commit or roll back with the booking.
+    """
+    record_bookings(db, [booking], created)
+
+def record_bookings(db: Session, bookings: Iterable, created: bool):
+    """Apply many bookings or cancellations with one upsert per rollup table"""
+    if not ANALYTICS_ENABLED:
+        return
+    sign = 1 if created else -1
+    hourly = defaultdict(int)
+    daily = defaultdict(lambda: [0, 0])
+    for booking in bookings:
+        start, end = _minutes(booking.slot_start), _minutes(booking.slot_end)
+        for hour, minutes in hour_minutes(start, end):
+            hourly[(booking.room_id, booking.slot_date, hour)] += sign * minutes
+        totals = daily[(booking.room_id, booking.slot_date)]
+        totals[0] += sign * max(0, end - start)
+        totals[1] += 1
+    _upsert(db, HOURLY, ("room_id", "slot_date", "hour"), [
+        {"room_id": room_id, "slot_date": slot_date, "hour": hour, "booked_minutes": minutes}
+        for (room_id, slot_date, hour), minutes in hourly.items()
+    ])
+    _upsert(db, DAILY, ("room_id", "slot_date"), [{
+        "room_id": room_id,
+        "slot_date": slot_date,
+        "booked_minutes": booked,
+        "bookings": count if created else 0,
+        "cancellations": 0 if created else count,
+    } for (room_id, slot_date), (booked, count) in daily.items()])
+
+def _aggregate(rows: Iterable[tuple]) -> Tuple[List[dict], List[dict]]:
+    hourly = defaultdict(int)
+    daily = defaultdict(lambda: [0, 0, 0])
+    for room_id, slot_date, slot_start, slot_end, is_active in rows:
+        start, end = _minutes(slot_start), _minutes(slot_end)
+        totals = daily[(room_id, slot_date)]
+        totals[1] += 1
+        if not is_active:
+            totals[2] += 1
+            continue
+        totals[0] += max(0, end - start)
+        for hour, minutes in hour_minutes(start, end):
+            hourly[(room_id, slot_date, hour)] += minutes
+    return (
+        [{"room_id": r, "slot_date": d, "hour": h, "booked_minutes": m} for (r, d, h), m in hourly.items()],
+        [{"room_id": r, "slot_date": d, "booked_minutes": t[0], "bookings": t[1], "cancellations": t[2]}
+         for (r, d), t in daily.items()],
+    )
+
+def _numpy():
+    """NumPy if installed; it is optional and only imported for rebuilds, as it is slow to import"""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        return None
+    return numpy
+
+def _aggregate_numpy(rows: Iterable[tuple]) -> Tuple[List[dict], List[dict]]:
+    """Same result as _aggregate, one array pass per hour instead of a loop per booking"""
+    numpy = _numpy()
+    room_ids, days, starts, ends, active = [], [], [], [], []
+    for room_id, slot_date, slot_start, slot_end, is_active in rows:
+        room_ids.append(room_id)
+        days.append(slot_date.toordinal())
+        starts.append(_minutes(slot_start))
+        ends.append(_minutes(slot_end))
+        active.append(bool(is_active))
+    if not room_ids:
+        return [], []
+    starts, ends = numpy.array(starts, dtype=numpy.int64), numpy.array(ends, dtype=numpy.int64)
+    active = numpy.array(active, dtype=bool)
+    keys = (numpy.array(room_ids, dtype=numpy.int64) << 32) | numpy.array(days, dtype=numpy.int64)
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    groups = len(unique)
+    key_room, key_day = (unique >> 32).tolist(), (unique & 0xFFFFFFFF).tolist()
+    key_day = [date.fromordinal(day) for day in key_day]
+    booked = numpy.bincount(inverse, weights=numpy.where(active, numpy.maximum(ends - starts, 0), 0), minlength=groups)
+    bookings = numpy.bincount(inverse, minlength=groups)
+    cancellations = numpy.bincount(inverse, weights=~active, minlength=groups)
+    daily = [
+        {"room_id": key_room[i], "slot_date": key_day[i], "booked_minutes": int(booked[i]),
+         "bookings": int(bookings[i]), "cancellations": int(cancellations[i])}
+        for i in range(groups)
+    ]
+    hourly = []
+    for hour in range(int(starts.min()) // 60, (int(ends.max()) - 1) // 60 + 1):
+        minutes = numpy.minimum(ends, (hour + 1) * 60) - numpy.maximum(starts, hour * 60)
+        minutes = numpy.where(active & (minutes > 0), minutes, 0)
+        per_group = numpy.bincount(inverse, weights=minutes, minlength=groups)
+        for i in numpy.flatnonzero(per_group).tolist():
+            hourly.append({"room_id": key_room[i], "slot_date": key_day[i], "hour": hour, "booked_minutes": int(per_group[i])})
+    return hourly, daily
+
+def rebuild(db: Session, date_from: Optional[date] = None, date_to: Optional[date] = None,
+            vectorized: Optional[bool] = None) -> dict:
+    """
+    Recompute the rollups for a date range (everything when open-ended) from
+    the bookings table, in one transaction. Uses NumPy when it is installed
+    unless `vectorized` says otherwise.
+    """
+    if vectorized is None:
+        vectorized = _numpy() is not None
+    if db.get_bind().dialect.name == "postgresql":
+        # Bookings made during the rebuild wait to apply their increments until it commits
+        db.execute(text("LOCK TABLE room_usage_hourly, room_usage_daily IN EXCLUSIVE MODE"))
+    def in_range(column):
+        conditions = []
+        if date_from:
+            conditions.append(column >= date_from)
+        if date_to:
+            conditions.append(column <= date_to)
+        return and_(true(), *conditions)
+    rows = db.execute(
+        select(
+            models.Booking.room_id, models.Booking.slot_date, models.Booking.slot_start,
+            models.Booking.slot_end, models.Booking.is_active
+        ).where(in_range(models.Booking.slot_date)).execution_options(yield_per=ANALYTICS_FETCH_SIZE)
+    )
+    hourly, daily = (_aggregate_numpy if vectorized else _aggregate)(
+        row for batch in rows.partitions(ANALYTICS_FETCH_SIZE) for row in batch
+    )
+    # Only the current tenant's rooms; the rollup tables have no tenant column of their own
+    rooms = select(models.Room.id).where(models.Room.tenant_id == tenants.current())
+    db.execute(delete(HOURLY).where(in_range(HOURLY.c.slot_date), HOURLY.c.room_id.in_(rooms)))
+    db.execute(delete(DAILY).where(in_range(DAILY.c.slot_date), DAILY.c.room_id.in_(rooms)))
+    if hourly:
+        db.execute(HOURLY.insert(), hourly)
+    if daily:
+        db.execute(DAILY.insert(), daily)
+    db.commit()
+    return {"hourly_rows": len(hourly), "daily_rows": len(daily), "vectorized": vectorized}
+
+def _rooms(db: Session, room_id: Optional[int], room_type: Optional[str]) -> Dict[int, tuple]:
+    query = select(models.Room.id, models.Room.name, models.Room.room_type, models.Room.capacity)
+    if room_id:
+        query = query.where(models.Room.id == room_id)
+    if room_type:
+        query = query.where(models.Room.room_type == room_type)
+    return {row.id: (row.name, row.room_type.value, row.capacity) for row in db.execute(query)}
+
+def _group_of(group: str, room_id: int, room: tuple):
+    return room_id if group == "room" else room[1]
+
+def _groups(rooms: Dict[int, tuple], group: str) -> Dict[object, dict]:
+    """Room or room-type groups with their seat count, the utilization denominator"""
+    groups = {}
+    for room_id, room in rooms.items():
+        key = _group_of(group, room_id, room)
+        if key not in groups:
+            groups[key] = {"room_id": room_id, "name": room[0]} if group == "room" else {}
+            groups[key].update({"room_type": room[1], "seats": 0})
+        groups[key]["seats"] += allocation.seats(room[1], room[2])
+    return groups
+
+def _open_hours() -> List[int]:
+    return list(range(allocation.OPENING_TIME.hour, allocation.CLOSING_TIME.hour + (1 if allocation.CLOSING_TIME.minute else 0)))
+
+def heatmap(db: Session, date_from: date, date_to: date, group: str = "room",
+            room_id: Optional[int] = None, room_type: Optional[str] = None) -> dict:
+    """
+    Utilization by weekday (Monday first) and opening hour for each room or
+    room type: booked seat-minutes over available seat-minutes.
+    """
+    rooms = _rooms(db, room_id, room_type)
+    groups = _groups(rooms, group)
+    hours = _open_hours()
+    weekdays = [0] * 7
+    for offset in range((date_to - date_from).days + 1):
+        weekdays[(date_from + timedelta(days=offset)).weekday()] += 1
+    minutes = {key: [[0] * len(hours) for _ in range(7)] for key in groups}
+    if rooms:
+        rows = db.execute(
+            select(HOURLY.c.room_id, HOURLY.c.slot_date, HOURLY.c.hour, HOURLY.c.booked_minutes).where(
+                HOURLY.c.slot_date >= date_from, HOURLY.c.slot_date <= date_to,
+                HOURLY.c.room_id.in_(list(rooms)), HOURLY.c.hour >= hours[0], HOURLY.c.hour <= hours[-1]
+            )
+        )
+        for rid, slot_date, hour, booked in rows:
+            key = _group_of(group, rid, rooms[rid])
+            minutes[key][slot_date.weekday()][hour - hours[0]] += booked
+    result = []
+    for key, info in groups.items():
+        grid = [
+            [round(booked / (info["seats"] * 60 * weekdays[day]), 4) if weekdays[day] and info["seats"] else 0.0
+             for booked in minutes[key][day]]
+            for day in range(7)
+        ]
+        result.append({**info, "utilization": grid})
+    return {"date_from": date_from, "date_to": date_to, "hours": hours, group + "s": result}
+
+def peak_hours(db: Session, date_from: date, date_to: date, room_type: Optional[str] = None, limit: int = 5) -> dict:
+    """Opening hours ranked by utilization across all rooms (of a type)"""
+    rooms = _rooms(db, None, room_type)
+    seats = sum(allocation.seats(room[1], room[2]) for room in rooms.values())
+    days = (date_to - date_from).days + 1
+    query = select(HOURLY.c.hour, func.sum(HOURLY.c.booked_minutes)).where(
+        HOURLY.c.slot_date >= date_from, HOURLY.c.slot_date <= date_to
+    ).where(HOURLY.c.room_id.in_(list(rooms))).group_by(HOURLY.c.hour)
+    booked = dict(db.execute(query).all())
+    ranked = sorted(
+        ({"hour": hour, "booked_minutes": int(booked.get(hour) or 0),
+          "utilization": round((booked.get(hour) or 0) / (seats * 60 * days), 4) if seats else 0.0}
+         for hour in _open_hours()),
+        key=lambda item: (-item["booked_minutes"], item["hour"])
+    )
+    return {"date_from": date_from, "date_to": date_to, "room_type": room_type, "peak_hours": ranked[:limit]}
+
+def rates(db: Session, date_from: date, date_to: date, group: str = "room", room_type: Optional[str] = None) -> dict:
+    """
+    Bookings, cancellations, cancellation rate and utilization over the
+    opening hours per room or room type. Bookings have no check-in, so
+    no-shows are not tracked.
+    """
+    rooms = _rooms(db, None, room_type)
+    groups = _groups(rooms, group)
+    open_minutes = (_minutes(allocation.CLOSING_TIME) - _minutes(allocation.OPENING_TIME)) * ((date_to - date_from).days + 1)
+    totals = {key: [0, 0, 0] for key in groups}
+    if rooms:
+        rows = db.execute(
+            select(
+                DAILY.c.room_id, func.sum(DAILY.c.booked_minutes), func.sum(DAILY.c.bookings), func.sum(DAILY.c.cancellations)
+            ).where(
+                DAILY.c.slot_date >= date_from, DAILY.c.slot_date <= date_to, DAILY.c.room_id.in_(list(rooms))
+            ).group_by(DAILY.c.room_id)
+        )
+        for rid, booked, bookings, cancellations in rows:
+            total = totals[_group_of(group, rid, rooms[rid])]
+            total[0] += int(booked or 0)
+            total[1] += int(bookings or 0)
+            total[2] += int(cancellations or 0)
+    result = []
+    for key, info in groups.items():
+        booked, bookings, cancellations = totals[key]
+        result.append({
+            **info,
+            "bookings": bookings,
+            "cancellations": cancellations,
+            "cancellation_rate": round(cancellations / bookings, 4) if bookings else 0.0,
+            "utilization": round(booked / (info["seats"] * open_minutes), 4) if info["seats"] else 0.0,
+        })
+    return {"date_from": date_from, "date_to": date_to, group + "s": result}
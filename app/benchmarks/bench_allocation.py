@@ -0,0 +1,129 @@
+"""
+Benchmark for the room allocation strategies in allocation.py. Replays the
+same booking workload through crud.create_booking once per strategy, on a
+fresh database each time, and reports the acceptance rate and the mean
+allocation time. Team sizes vary, so conference rooms of different sizes
+make the difference between first-fit and best-fit visible.
+
+The workload is either generated (seeded) or read from a recorded JSONL file
+with one BookingCreate per line, e.g.
+    {"room_type": "conference", "team_id": 3, "slot_date": "2030-01-01",
+     "slot_start": "09:00:00", "slot_end": "10:00:00"}
+Generated workloads can be saved with --record for later runs.
+
+Usage:
+    python benchmarks/bench_allocation.py [--bookings 3000] [--workload recorded.jsonl]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time as timer
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_allocation_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from database import Base, SessionLocal, engine
+import allocation, crud, models, schemas
+
+CONFERENCE_CAPACITIES = (4, 4, 6, 8, 12, 20)
+SHARED_CAPACITY = 4
+
+def reset(users: int, teams: int, rooms: int, seed: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        room_rows = []
+        for i in range(rooms):
+            kind = ("private", "shared", "conference")[i % 3]
+            capacity = {"private": 1, "shared": SHARED_CAPACITY}.get(kind) or CONFERENCE_CAPACITIES[(i // 3) % len(CONFERENCE_CAPACITIES)]
+            room_rows.append({"room_type": models.RoomTypeEnum(kind), "capacity": capacity, "name": f"Room {i}"})
+        db.bulk_insert_mappings(models.Room, room_rows)
+        db.bulk_insert_mappings(models.User, [
+            {"name": f"user{i}", "email": f"user{i}@bench.test", "hashed_password": "x",
+             "age": 30, "gender": models.GenderEnum.other, "is_active": True, "is_admin": False}
+            for i in range(users)
+        ])
+        db.bulk_insert_mappings(models.Team, [{"name": f"team{i}"} for i in range(teams)])
+        memberships = []
+        for team_id in range(1, teams + 1):
+            size = rng.choice((3, 3, 4, 5, 6, 8, 10, 15))
+            memberships += [{"team_id": team_id, "user_id": user_id} for user_id in rng.sample(range(1, users + 1), size)]
+        db.execute(models.team_members.insert(), memberships)
+        db.commit()
+    finally:
+        db.close()
+
+def generate(bookings: int, users: int, teams: int, days: int, seed: int):
+    rng = random.Random(seed)
+    start = date.today() + timedelta(days=1)
+    for _ in range(bookings):
+        room_type = rng.choice(("private", "shared", "shared", "conference"))
+        hour = rng.randint(9, 16)
+        request = {
+            "room_type": room_type,
+            "slot_date": (start + timedelta(days=rng.randrange(days))).isoformat(),
+            "slot_start": time(hour, 0).isoformat(),
+            "slot_end": time(hour + rng.choice((1, 1, 2)), 0).isoformat(),
+        }
+        if room_type == "conference":
+            request["team_id"] = rng.randint(1, teams)
+        else:
+            request["user_id"] = rng.randint(1, users)
+        yield request
+
+def run(strategy: str, requests):
+    accepted = 0
+    elapsed = 0.0
+    db = SessionLocal()
+    try:
+        for request in requests:
+            t0 = timer.perf_counter()
+            try:
+                crud.create_booking(db, request, strategy)
+                accepted += 1
+            except crud.HTTPException:
+                db.rollback()
+            elapsed += timer.perf_counter() - t0
+    finally:
+        db.close()
+    return accepted, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--teams", type=int, default=40)
+    parser.add_argument("--rooms", type=int, default=36)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workload", help="recorded JSONL workload to replay instead of a generated one")
+    parser.add_argument("--record", help="write the generated workload to this JSONL file")
+    args = parser.parse_args()
+
+    if args.workload:
+        with open(args.workload) as f:
+            raw = [json.loads(line) for line in f if line.strip()]
+    else:
+        raw = list(generate(args.bookings, args.users, args.teams, args.days, args.seed))
+        if args.record:
+            with open(args.record, "w") as f:
+                f.writelines(json.dumps(request) + "\n" for request in raw)
+    requests = [schemas.BookingCreate(**request) for request in raw]
+
+    print(f"{'strategy':<14}{'accepted':>10}{'rate':>9}{'mean ms':>10}")
+    for strategy in allocation.STRATEGIES:
+        reset(args.users, args.teams, args.rooms, args.seed)
+        accepted, elapsed = run(strategy, requests)
+        rate = accepted / len(requests) * 100
+        print(f"{strategy:<14}{accepted:>10}{rate:>8.1f}%{elapsed / len(requests) * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark for POST /api/v1/bookings/ allocation: the stepwise path
+(crud.create_booking_stepwise) versus the single-statement conditional
+insert (crud.create_booking). Reports latency percentiles and the number of
+statements sent per booking; on a networked database each statement is a
+round trip.
+
+Usage:
+    python benchmarks/bench_booking.py [--bookings 2000] [--rooms 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time as timer
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_booking_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import event
+from database import Base, SessionLocal, engine
+import crud, models, schemas
+
+statements = [0]
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(*args, **kwargs):
+    statements[0] += 1
+
+@event.listens_for(engine, "commit")
+def count_commit(*args, **kwargs):
+    statements[0] += 1
+
+def reset(rooms: int, users: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        types = [models.RoomTypeEnum.private, models.RoomTypeEnum.shared]
+        db.bulk_insert_mappings(models.Room, [
+            {"room_type": types[i % 2], "capacity": 1 if i % 2 == 0 else 4, "name": f"Room {i}"}
+            for i in range(rooms)
+        ])
+        db.bulk_insert_mappings(models.User, [
+            {"name": f"user{i}", "email": f"user{i}@bench.test", "hashed_password": "x",
+             "age": 30, "gender": models.GenderEnum.other, "is_active": True, "is_admin": False}
+            for i in range(users)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def workload(bookings: int, users: int):
+    day = date.today() + timedelta(days=1)
+    for i in range(bookings):
+        hour = 9 + (i // users) % 9
+        yield schemas.BookingCreate(
+            room_type="private" if i % 3 else "shared",
+            user_id=(i % users) + 1,
+            slot_date=day + timedelta(days=i // (users * 9)),
+            slot_start=time(hour, 0),
+            slot_end=time(hour + 1, 0),
+        )
+
+def run(fn, requests):
+    latencies = []
+    statements[0] = 0
+    rejected = 0
+    db = SessionLocal()
+    try:
+        for request in requests:
+            t0 = timer.perf_counter()
+            try:
+                fn(db, request)
+            except crud.HTTPException:
+                db.rollback()
+                rejected += 1
+            latencies.append(timer.perf_counter() - t0)
+    finally:
+        db.close()
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return pick(0.5), pick(0.95), statements[0] / len(latencies), rejected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'path':<12}{'p50 ms':>10}{'p95 ms':>10}{'stmts/req':>12}{'rejected':>10}")
+    for name, fn in (("stepwise", crud.create_booking_stepwise), ("single", crud.create_booking)):
+        reset(args.rooms, args.users)
+        p50, p95, per_request, rejected = run(fn, list(workload(args.bookings, args.users)))
+        print(f"{name:<12}{p50:>10.2f}{p95:>10.2f}{per_request:>12.1f}{rejected:>10}")
+
+if __name__ == "__main__":
+    main()
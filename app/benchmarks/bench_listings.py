@@ -0,0 +1,119 @@
+"""
+Benchmark for the list endpoints: ORM hydration + pydantic validation versus
+the lean column-row path with FastJSONResponse.
+
+Usage:
+    python benchmarks/bench_listings.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time as timer
+import tracemalloc
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_listings_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from database import Base, SessionLocal, engine
+import crud, models, schemas
+from responses import FastJSONResponse
+
+def seed(rows: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        types = list(models.RoomTypeEnum)
+        db.bulk_insert_mappings(models.Room, [
+            {"id": i, "room_type": types[i % 3], "capacity": 4, "name": f"Room {i}"}
+            for i in range(1, rows + 1)
+        ])
+        start = date.today()
+        db.bulk_insert_mappings(models.Booking, [
+            {
+                "room_id": (i % rows) + 1,
+                "user_id": (i % 97) + 1,
+                "slot_date": start + timedelta(days=i // 500),
+                "slot_start": time(9 + i % 8, 0),
+                "slot_end": time(10 + i % 8, 0),
+                "is_active": True,
+            }
+            for i in range(rows)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def orm_rooms(db, rows):
+    rooms = crud.get_all_rooms(db)
+    content = [schemas.Room(
+        id=room.id,
+        room_type=room.room_type.value,
+        capacity=room.capacity,
+        name=room.name
+    ) for room in rooms]
+    # FastAPI re-validates the returned models against response_model
+    content = [schemas.Room(**item.dict()) for item in content]
+    return JSONResponse(jsonable_encoder(content)).body
+
+def lean_rooms(db, rows):
+    return FastJSONResponse(crud.get_all_room_rows(db)).body
+
+def orm_bookings(db, rows):
+    bookings = crud.get_bookings(db, limit=rows)
+    content = [schemas.Booking(
+        id=b.id, room_id=b.room_id, user_id=b.user_id, team_id=b.team_id,
+        slot_date=b.slot_date, slot_start=b.slot_start, slot_end=b.slot_end,
+        is_active=b.is_active
+    ) for b in bookings]
+    return JSONResponse(jsonable_encoder(content)).body
+
+def lean_bookings(db, rows):
+    return FastJSONResponse(crud.get_booking_rows(db, limit=rows)).body
+
+def measure(fn, rows: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            t0 = timer.perf_counter()
+            fn(db, rows)
+            timings.append(timer.perf_counter() - t0)
+        finally:
+            db.close()
+    timings.sort()
+    # Peak memory is taken on a separate run, tracemalloc skews timings
+    db = SessionLocal()
+    try:
+        tracemalloc.start()
+        fn(db, rows)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        db.close()
+    return timings[len(timings) // 2], peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    print(f"{'path':<16}{'median ms':>12}{'peak MiB':>12}")
+    for name, fn in (
+        ("rooms/orm", orm_rooms),
+        ("rooms/lean", lean_rooms),
+        ("bookings/orm", orm_bookings),
+        ("bookings/lean", lean_bookings),
+    ):
+        median, peak = measure(fn, args.rows, args.repeat)
+        print(f"{name:<16}{median * 1000:>12.1f}{peak / 2 ** 20:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark for worker cold start: how long `import main` takes and how long
+the startup handlers take until the app can serve, each measured in a fresh
+interpreter. Also lists the slowest imports (from `python -X importtime`).
+With --budget-ms it exits non-zero when the median import time is over
+budget, so it can run in CI.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 10] [--budget-ms 800]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+PROBE = """
+import time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app):
+    t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+def run_probe(env) -> tuple:
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=APP_DIR, env=env, check=True,
+                         capture_output=True, text=True).stdout.split()
+    return float(out[-2]) * 1000, float(out[-1]) * 1000
+
+def slowest_imports(env, top: int):
+    """Modules imported directly by main, by cumulative import time"""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=APP_DIR, env=env,
+                         check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # importtime indents nested imports by two spaces per level; main itself is level 0
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+
+    imports, startups = [], []
+    for _ in range(args.runs):
+        import_ms, startup_ms = run_probe(env)
+        imports.append(import_ms)
+        startups.append(startup_ms)
+    import_median = statistics.median(imports)
+    print(f"{'phase':<10}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, values in (("import", imports), ("startup", startups)):
+        print(f"{name:<10}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    print(f"\nslowest imports (cumulative ms):")
+    for cumulative, name in slowest_imports(env, args.top):
+        print(f"  {cumulative / 1000:>8.1f}  {name}")
+    if args.budget_ms is not None and import_median > args.budget_ms:
+        print(f"\nimport time {import_median:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Admin booking search: composable filters pushed into one SQL query,
+keyset paging and cheap totals.
+
+- Filters on room, room type, date range, status, user/team ids and
+  user/team names combine with AND. Each one uses an index: the
+  (room|user|team, slot_date) ones, or lower(name) for name prefixes.
+- Names match by prefix. On Postgres with pg_trgm installed, terms of
+  three characters or more match anywhere in the name, using the trigram
+  indexes models.py creates.
+- Pages are ordered newest slot first and continue from an opaque cursor,
+  so a deep page costs the same as the first one.
+- Totals are counted at most up to SEARCH_COUNT_EXACT_LIMIT rows; above
+  that Postgres' planner estimate is used. Totals are cached per filter
+  set for SEARCH_COUNT_TTL_SECONDS, and booking changes drop the tenant's.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select, text, type_coerce, String
+from sqlalchemy.orm import Session
+import crud, events, models, tenants
+
+SEARCH_COUNT_EXACT_LIMIT = int(os.getenv("SEARCH_COUNT_EXACT_LIMIT", "10000"))
+SEARCH_COUNT_TTL_SECONDS = float(os.getenv("SEARCH_COUNT_TTL_SECONDS", "30"))
+SEARCH_COUNT_MAX_KEYS = int(os.getenv("SEARCH_COUNT_MAX_KEYS", "1000"))
+# Shortest term matched anywhere in a name; trigram indexes cannot help below three characters
+TRIGRAM_MIN_LENGTH = 3
+
+STATUSES = ("active", "cancelled", "all")
+
+SEARCH_ROW_COLUMNS = crud.BOOKING_ROW_COLUMNS + (
+    type_coerce(models.Room.room_type, String).label("room_type"),
+    models.Room.name.label("room_name"),
+    models.User.name.label("user_name"),
+    models.Team.name.label("team_name"),
+)
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+_trigram: Dict[str, bool] = {}
+_trigram_lock = threading.Lock()
+
+def has_trigram(db: Session) -> bool:
+    """Whether the database can answer substring name searches from trigram indexes (checked once per database)"""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    url = str(bind.url)
+    if url not in _trigram:
+        found = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+        with _trigram_lock:
+            _trigram[url] = found
+    return _trigram[url]
+
+def _prefix_upper(term: str) -> Optional[str]:
+    """Smallest string above every string starting with `term` in code point order, None if there is none"""
+    term = term.rstrip(chr(sys.maxunicode))
+    if not term:
+        return None
+    return term[:-1] + chr(ord(term[-1]) + 1)
+
+def name_matches(column, term: str, trigram: bool, range_scan: bool):
+    """
+    Condition matching names containing `term` (trigram) or starting with it,
+    case-insensitively. Prefixes use the lower(name) index: on Postgres the
+    index has text_pattern_ops, which serves LIKE 'term%' directly. With
+    `range_scan` (SQLite, whose LIKE cannot use a BINARY index), a range
+    finds the rows. That range is exact under code point order, and LIKE
+    only drops the rows it over-matches.
+    """
+    term = term.lower()
+    if trigram and len(term) >= TRIGRAM_MIN_LENGTH:
+        return column.ilike(f"%{_escape_like(term)}%", escape="\\")
+    lowered = func.lower(column)
+    prefix = lowered.like(f"{_escape_like(term)}%", escape="\\")
+    if not range_scan:
+        return prefix
+    upper = _prefix_upper(term)
+    if upper is None:
+        return and_(lowered >= term, prefix)
+    return and_(lowered >= term, lowered < upper, prefix)
+
+def conditions(db: Session, room_id: Optional[int] = None, room_type: Optional[str] = None,
+               date_from: Optional[date] = None, date_to: Optional[date] = None, status: str = "active",
+               user_id: Optional[int] = None, team_id: Optional[int] = None,
+               user: Optional[str] = None, team: Optional[str] = None) -> list:
+    if status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(STATUSES)}.")
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    # Spelled out, so it reaches the count subquery too and leads the (tenant_id, slot_date, id) index
+    where = [models.Booking.tenant_id == tenants.current()]
+    if room_id is not None:
+        where.append(models.Booking.room_id == room_id)
+    if room_type is not None:
+        where.append(models.Booking.room_id.in_(select(models.Room.id).where(models.Room.room_type == room_type)))
+    if date_from is not None:
+        where.append(models.Booking.slot_date >= date_from)
+    if date_to is not None:
+        where.append(models.Booking.slot_date <= date_to)
+    if status != "all":
+        where.append(models.Booking.is_active == (status == "active"))
+    if user_id is not None:
+        where.append(models.Booking.user_id == user_id)
+    if team_id is not None:
+        where.append(models.Booking.team_id == team_id)
+    user, team = (user or "").strip(), (team or "").strip()
+    trigram = bool(user or team) and has_trigram(db)
+    range_scan = db.get_bind().dialect.name == "sqlite"
+    if user:
+        where.append(models.Booking.user_id.in_(select(models.User.id).where(
+            models.User.tenant_id == tenants.current(), name_matches(models.User.name, user, trigram, range_scan)
+        )))
+    if team:
+        where.append(models.Booking.team_id.in_(select(models.Team.id).where(
+            models.Team.tenant_id == tenants.current(), name_matches(models.Team.name, team, trigram, range_scan)
+        )))
+    return where
+
+def encode_cursor(row: dict) -> str:
+    return f"{row['slot_date'].isoformat()}~{row['id']}"
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        slot_date, booking_id = cursor.split("~")
+        return date.fromisoformat(slot_date), int(booking_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+class CountCache:
+    """
+    Totals per (tenant, filters) with a TTL. Booking changes bump the
+    tenant's generation, which is part of every key, so a write makes the
+    tenant's cached totals unreachable at once.
+    """
+    def __init__(self, ttl: float = SEARCH_COUNT_TTL_SECONDS, max_keys: int = SEARCH_COUNT_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._generations: Dict[str, int] = {}
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, filters: tuple) -> tuple:
+        tenant = tenants.current()
+        with self._lock:
+            return (tenant, self._generations.get(tenant, 0), filters)
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value: tuple):
+        with self._lock:
+            # Dropped if the tenant changed while counting
+            if self._generations.get(key[0], 0) != key[1]:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tenant: str):
+        with self._lock:
+            self._generations[tenant] = self._generations.get(tenant, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+counts = CountCache()
+
+def _on_bookings_changed(event):
+    counts.invalidate(tenants.current())
+
+events.subscribe(events.BookingChanged, _on_bookings_changed)
+events.subscribe(events.BookingsChanged, _on_bookings_changed)
+
+def _planner_estimate(db: Session, stmt) -> Optional[int]:
+    """Rows the Postgres planner expects `stmt` to return"""
+    compiled = stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    try:
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (LookupError, TypeError, ValueError):
+        return None
+
+def count(db: Session, where: list, filters: tuple) -> Tuple[int, bool]:
+    """(total, exact). Counts up to SEARCH_COUNT_EXACT_LIMIT rows, estimates above that"""
+    key = counts.key(filters)
+    cached = counts.get(key)
+    if cached is not None:
+        return cached
+    matching = select(models.Booking.id).where(*where)
+    limit = SEARCH_COUNT_EXACT_LIMIT
+    counted = db.execute(select(func.count()).select_from(matching.limit(limit + 1).subquery())).scalar()
+    if counted <= limit:
+        result = (counted, True)
+    else:
+        estimate = None
+        if db.get_bind().dialect.name == "postgresql":
+            estimate = _planner_estimate(db, matching)
+        result = (max(limit + 1, estimate or 0), False)
+    counts.set(key, result)
+    return result
+
+def search(db: Session, limit: int = 50, cursor: Optional[str] = None, with_total: bool = True, **filters) -> dict:
+    """
+    One page of bookings matching `filters` (see conditions()), newest slot
+    first, with the room, user and team names.
+    """
+    where = conditions(db, **filters)
+    stmt = select(*SEARCH_ROW_COLUMNS).join(models.Room, models.Room.id == models.Booking.room_id) \
+        .outerjoin(models.User, models.User.id == models.Booking.user_id) \
+        .outerjoin(models.Team, models.Team.id == models.Booking.team_id) \
+        .where(*where)
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            models.Booking.slot_date < after_date,
+            and_(models.Booking.slot_date == after_date, models.Booking.id < after_id)
+        ))
+    stmt = stmt.order_by(models.Booking.slot_date.desc(), models.Booking.id.desc()).limit(limit + 1)
+    rows: List[dict] = [dict(row._mapping) for row in db.execute(stmt)]
+    page = {"bookings": rows[:limit], "next_cursor": encode_cursor(rows[limit - 1]) if len(rows) > limit else None}
+    if with_total:
+        page["total"], page["total_exact"] = count(db, where, tuple(sorted(filters.items())))
+    return page
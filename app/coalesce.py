@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, Optional
+import events, tenants
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+# Seconds a finished result keeps answering identical calls; 0 shares in-flight calls only
+COALESCE_TTL_SECONDS = float(os.getenv("COALESCE_TTL_SECONDS", "0"))
+COALESCE_MAX_KEYS = int(os.getenv("COALESCE_MAX_KEYS", "10000"))
+# A caller waits this long for the shared call before running its own
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", "10"))
+
+class _Call:
+    __slots__ = ("scope", "done", "result", "error", "expires_at")
+
+    def __init__(self, scope: tuple):
+        self.scope = scope
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.expires_at: Optional[float] = None
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one evaluation: the first
+    caller runs it and the others wait for its result (or its exception).
+    With a TTL the result also answers later calls for a moment.
+
+    Every call belongs to a scope, here (tenant, slot date). Invalidating a
+    scope forgets its calls, finished or running, so a caller that arrives
+    after a write never gets a result computed before it. Callers already
+    waiting still share the running call, as they would have if it had
+    finished a moment earlier.
+    """
+    def __init__(self, ttl: float = COALESCE_TTL_SECONDS, max_keys: int = COALESCE_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._calls: "OrderedDict[Hashable, _Call]" = OrderedDict()
+        self._by_scope: Dict[tuple, set] = {}
+        self._stats: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, kind: str, name: str):
+        self._stats.setdefault(kind, Counter())[name] += 1
+
+    def _forget(self, key: Hashable):
+        call = self._calls.pop(key, None)
+        if call is not None:
+            keys = self._by_scope.get(call.scope)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_scope[call.scope]
+
+    def _join(self, kind: str, key: Hashable, scope: tuple):
+        """(call, owner); counts the call as run, coalesced or cached"""
+        with self._lock:
+            self._count(kind, "calls")
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and (call.expires_at is None or call.expires_at <= time.monotonic()):
+                self._forget(key)
+                call = None
+            if call is None:
+                call = _Call(scope)
+                self._calls[key] = call
+                self._by_scope.setdefault(scope, set()).add(key)
+                while len(self._calls) > self.max_keys:
+                    self._forget(next(iter(self._calls)))
+                self._count(kind, "executed")
+                return call, True
+            self._calls.move_to_end(key)
+            self._count(kind, "cached" if call.done.is_set() else "coalesced")
+            return call, False
+
+    def _finish(self, key: Hashable, call: _Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                if call.error is None and self.ttl > 0:
+                    call.expires_at = time.monotonic() + self.ttl
+                else:
+                    self._forget(key)
+        call.done.set()
+
+    def run(self, kind: str, key: Hashable, scope: tuple, fn: Callable[[], Any]) -> Any:
+        """
+        Return fn()'s result, sharing it with identical concurrent calls.
+        The result is handed to every caller as is, so it must not be
+        mutated and must not hold ORM objects bound to the owner's session.
+        """
+        if not COALESCE_ENABLED:
+            return fn()
+        key = (kind, key)
+        call, owner = self._join(kind, key, scope)
+        if not owner:
+            if call.done.wait(COALESCE_WAIT_SECONDS):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            with self._lock:
+                self._count(kind, "wait_timeouts")
+            return fn()
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    def invalidate(self, *scopes: tuple):
+        with self._lock:
+            for scope in scopes:
+                for key in list(self._by_scope.get(scope, ())):
+                    self._forget(key)
+
+    def invalidate_tenant(self, tenant: str):
+        with self._lock:
+            for scope in [scope for scope in self._by_scope if scope[0] == tenant]:
+                for key in list(self._by_scope.get(scope, ())):
+                    self._forget(key)
+
+    def stats(self) -> Dict[str, dict]:
+        """Per kind: calls, executed, coalesced (joined a running call), cached (within the TTL), wait_timeouts"""
+        with self._lock:
+            result = {}
+            for kind, counter in self._stats.items():
+                entry = {name: counter[name] for name in ("calls", "executed", "coalesced", "cached", "wait_timeouts")}
+                entry["saved_ratio"] = round((entry["coalesced"] + entry["cached"]) / entry["calls"], 4) if entry["calls"] else 0.0
+                result[kind] = entry
+            return {"enabled": COALESCE_ENABLED, "ttl_seconds": self.ttl, "in_flight_or_cached": len(self._calls), "kinds": result}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def clear(self):
+        with self._lock:
+            self._calls.clear()
+            self._by_scope.clear()
+
+flights = SingleFlight()
+
+def day_scope(slot_date: date) -> tuple:
+    """Scope of everything computed for one day; handlers run in the tenant of the event, see events.Bus"""
+    return (tenants.current(), slot_date)
+
+def _on_booking_changed(event: events.BookingChanged):
+    flights.invalidate(day_scope(event.slot_date))
+
+def _on_bookings_changed(event: events.BookingsChanged):
+    if event.slots is None:
+        flights.invalidate_tenant(tenants.current())
+        return
+    flights.invalidate(*{day_scope(date.fromisoformat(slot_date)) for slot_date, _ in event.slots})
+
+def _on_hold_changed(event: events.HoldChanged):
+    flights.invalidate(day_scope(event.slot_date))
+
+def _on_room_changed(event: events.RoomChanged):
+    flights.invalidate_tenant(tenants.current())
+
+events.subscribe(events.BookingChanged, _on_booking_changed)
+events.subscribe(events.BookingsChanged, _on_bookings_changed)
+events.subscribe(events.HoldChanged, _on_hold_changed)
+events.subscribe(events.RoomChanged, _on_room_changed)
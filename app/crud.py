@@ -1,10 +1,19 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from datetime import date, time, datetime
-from typing import List, Optional
-import models, schemas, security
+from sqlalchemy import event, text, and_, or_, func, select, exists, insert, update, delete, literal, null, String, Integer, Date, Time, Boolean, DateTime, type_coerce
+from datetime import date, time, datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+import os
+import models, schemas, security, allocation, analytics, events, deadlines, tenants
 from fastapi import HTTPException, status
 
+# Bookable hours, enforced by the bookings router
+from allocation import OPENING_TIME, CLOSING_TIME
+
+class RoomUnavailable(HTTPException):
+    """Raised when the request is valid but every matching room is taken"""
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
 # User CRUD
 
 def get_user(db: Session, user_id: int):
@@ -62,103 +71,248 @@ def create_team(db: Session, team: schemas.TeamCreate):
 
 # Booking CRUD
 
-def create_booking(db: Session, booking: schemas.BookingCreate):
-    # Prevent double booking for user/team
+def booking_changed(booking: models.Booking, room_type, action: str):
+    """
+    Called once a booking's creation or cancellation is committed. Caches
+    in every worker subscribe to the event (see events.py) to drop what
+    they derived from the booking.
+    """
+    events.publish(events.BookingChanged(
+        action=action,
+        booking_id=booking.id,
+        room_id=booking.room_id,
+        room_type=getattr(room_type, "value", room_type),
+        slot_date=booking.slot_date,
+        user_id=booking.user_id,
+        team_id=booking.team_id,
+    ))
+
+# Transaction-level advisory lock serialising change_seq assignment at commit (Postgres)
+CHANGE_SEQ_LOCK_KEY = 0x62636873
+
+def change_seq_value(db: Session):
+    """
+    Value to write as a changed booking's change_seq: NULL for now. The
+    session numbers its NULL rows just before it commits, see
+    _sequence_booking_changes.
+    """
+    db.info["booking_changes"] = True
+    return null()
+
+@event.listens_for(Session, "before_commit")
+def _sequence_booking_changes(session: Session):
+    """
+    Give the bookings this transaction changed their change_seq at commit
+    time, so the change feed cursor follows commit order: a transaction
+    that ran long (e.g. behind the analytics rebuild lock) still lands above
+    every change already visible. On Postgres the numbering and the commit
+    happen under one advisory lock, which is released only once the commit
+    is visible. SQLite serialises writers, so max + 1 is already in order.
+    Other transactions' NULL rows are invisible here, so only ours match.
+    """
+    if not session.info.pop("booking_changes", False):
+        return
+    session.flush()
+    pending = models.Booking.change_seq.is_(None)
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_SEQ_LOCK_KEY})
+        value = models.booking_change_seq.next_value()
+    else:
+        base, first = session.execute(select(
+            func.coalesce(func.max(models.Booking.change_seq), 0) + 1,
+            select(func.min(models.Booking.id)).where(pending).scalar_subquery()
+        )).one()
+        if first is None:
+            return
+        value = base + models.Booking.id - first
+    session.execute(update(models.Booking).where(pending).values(change_seq=value)
+                    .execution_options(synchronize_session=False))
+
+@event.listens_for(Session, "after_rollback")
+def _forget_booking_changes(session: Session):
+    session.info.pop("booking_changes", None)
+
+def _overlaps(booking: schemas.BookingBase):
+    return and_(
+        models.Booking.slot_date == booking.slot_date,
+        models.Booking.slot_start < booking.slot_end,
+        models.Booking.slot_end > booking.slot_start,
+        models.Booking.is_active == True
+    )
+
+def _hold_overlaps(booking: schemas.BookingBase):
+    """Unexpired holds on the slot; expired ones stop counting before the reaper removes them"""
+    return and_(
+        models.BookingHold.slot_date == booking.slot_date,
+        models.BookingHold.slot_start < booking.slot_end,
+        models.BookingHold.slot_end > booking.slot_start,
+        models.BookingHold.expires_at > datetime.utcnow()
+    )
+
+def _party_busy(booking: schemas.BookingBase, column: str, party_id: int):
+    """The user or team (column "user_id"/"team_id") already has a booking or hold overlapping the slot"""
+    return or_(
+        exists().where(getattr(models.Booking, column) == party_id, _overlaps(booking)),
+        exists().where(getattr(models.BookingHold, column) == party_id, _hold_overlaps(booking)),
+    )
+
+def _slot_load(booking: schemas.BookingBase):
+    """Correlated (occupancy, day_load) counts for models.Room, see allocation.Candidate"""
+    occupancy = select(func.count(models.Booking.id)).where(
+        models.Booking.room_id == models.Room.id, _overlaps(booking)
+    ).scalar_subquery() + select(func.count(models.BookingHold.id)).where(
+        models.BookingHold.room_id == models.Room.id, _hold_overlaps(booking)
+    ).scalar_subquery()
+    day_load = select(func.count(models.Booking.id)).where(
+        models.Booking.room_id == models.Room.id,
+        models.Booking.slot_date == booking.slot_date,
+        models.Booking.is_active == True
+    ).scalar_subquery()
+    return occupancy, day_load
+
+def get_room_candidates(db: Session, booking: schemas.BookingCreate) -> List[allocation.Candidate]:
+    """Every room of the requested type with its load (bookings and holds), in one query"""
+    occupancy, day_load = _slot_load(booking)
+    rows = db.execute(
+        select(models.Room.id, models.Room.capacity, occupancy, day_load)
+        .where(models.Room.room_type == booking.room_type)
+        .order_by(models.Room.id)
+    )
+    return [allocation.Candidate(*row) for row in rows]
+
+def allocation_select(booking: schemas.BookingCreate, strategy: str, *values):
+    """
+    SELECT of (room_id, user_id, team_id, slot_date, slot_start, slot_end,
+    *values) for the room the booking would get. It only yields a row when
+    the user/team has no overlapping booking or hold, the team is large
+    enough and a room of the type has capacity left.
+    """
+    room_type = booking.room_type
+    occupancy, day_load = _slot_load(booking)
+    conditions = [
+        # Spelled out: the tenant filter on ORM queries does not reach INSERT ... SELECT
+        models.Room.tenant_id == tenants.current(),
+        models.Room.room_type == room_type,
+        occupancy < (models.Room.capacity if room_type == "shared" else 1),
+    ]
     if booking.user_id:
-        existing = db.query(models.Booking).filter(
-            models.Booking.user_id == booking.user_id,
-            models.Booking.slot_date == booking.slot_date,
-            models.Booking.slot_start < booking.slot_end,
-            models.Booking.slot_end > booking.slot_start,
-            models.Booking.is_active == True
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="User already has a booking for this slot.")
+        conditions.append(~_party_busy(booking, "user_id", booking.user_id))
     if booking.team_id:
-        existing = db.query(models.Booking).filter(
-            models.Booking.team_id == booking.team_id,
-            models.Booking.slot_date == booking.slot_date,
-            models.Booking.slot_start < booking.slot_end,
-            models.Booking.slot_end > booking.slot_start,
-            models.Booking.is_active == True
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Team already has a booking for this slot.")
-
-    # Room allocation logic
-    rooms = get_rooms_by_type(db, booking.room_type)
-    if not rooms:
-        raise HTTPException(status_code=404, detail="No rooms of this type exist.")
-    # Find available room
-    available_rooms = get_available_rooms(db, booking.slot_date, booking.slot_start, booking.slot_end, booking.room_type)
-    if not available_rooms:
-        raise HTTPException(status_code=400, detail="No available room for the selected slot and type.")
-    # Shared desk: assign to desk with <4 users
-    if booking.room_type == "shared":
-        for room in available_rooms:
-            # Count current bookings for this desk/slot
-            count = db.query(models.Booking).filter(
-                models.Booking.room_id == room.id,
-                models.Booking.slot_date == booking.slot_date,
-                models.Booking.slot_start < booking.slot_end,
-                models.Booking.slot_end > booking.slot_start,
-                models.Booking.is_active == True
-            ).count()
-            if count < room.capacity:
-                db_booking = models.Booking(
-                    room_id=room.id,
-                    user_id=booking.user_id,
-                    team_id=None,
-                    slot_date=booking.slot_date,
-                    slot_start=booking.slot_start,
-                    slot_end=booking.slot_end,
-                    is_active=True
-                )
-                db.add(db_booking)
-                db.commit()
-                db.refresh(db_booking)
-                return db_booking
-        raise HTTPException(status_code=400, detail="No available shared desk for the selected slot.")
-    # Conference: team only, team size >= 3
-    elif booking.room_type == "conference":
-        if not booking.team_id:
-            raise HTTPException(status_code=400, detail="Conference room requires a team.")
-        team = get_team(db, booking.team_id)
-        if not team or len(team.members) < 3:
-            raise HTTPException(status_code=400, detail="Conference room requires a team of at least 3 members.")
+        conditions.append(~_party_busy(booking, "team_id", booking.team_id))
+    if room_type == "conference":
         # Children <10 included in headcount
-        db_booking = models.Booking(
-            room_id=available_rooms[0].id,
-            user_id=None,
-            team_id=booking.team_id,
-            slot_date=booking.slot_date,
-            slot_start=booking.slot_start,
-            slot_end=booking.slot_end,
-            is_active=True
-        )
-        db.add(db_booking)
-        db.commit()
-        db.refresh(db_booking)
-        return db_booking
-    # Private: single user only
-    elif booking.room_type == "private":
-        if not booking.user_id:
-            raise HTTPException(status_code=400, detail="Private room requires a user.")
-        db_booking = models.Booking(
-            room_id=available_rooms[0].id,
-            user_id=booking.user_id,
-            team_id=None,
-            slot_date=booking.slot_date,
-            slot_start=booking.slot_start,
-            slot_end=booking.slot_end,
-            is_active=True
-        )
-        db.add(db_booking)
-        db.commit()
-        db.refresh(db_booking)
-        return db_booking
+        headcount = allocation.team_headcount_expr(booking.team_id)
+        conditions.append(headcount >= allocation.MIN_CONFERENCE_TEAM)
+        conditions.append(models.Room.capacity >= headcount)
+    user_id = None if room_type == "conference" else booking.user_id
+    team_id = booking.team_id if room_type == "conference" else None
+    return select(
+        models.Room.id,
+        literal(user_id, Integer) if user_id else null(),
+        literal(team_id, Integer) if team_id else null(),
+        literal(booking.slot_date, Date),
+        literal(booking.slot_start, Time),
+        literal(booking.slot_end, Time),
+        *values
+    ).where(*conditions).order_by(*allocation.order_by(strategy, room_type, occupancy, day_load)).limit(1)
+
+def well_formed(booking: schemas.BookingCreate) -> bool:
+    """Requests the single-statement path can decide; the rest go stepwise for their error"""
+    return bool(
+        (booking.room_type == "private" and booking.user_id)
+        or (booking.room_type == "conference" and booking.team_id)
+        or (booking.room_type == "shared" and booking.user_id)
+    )
+
+def _conditional_insert(db: Session, booking: schemas.BookingCreate, strategy: str,
+                        before_commit: Optional[Callable[[models.Booking], None]] = None) -> Optional[models.Booking]:
+    """
+    Pick a room and insert the booking in one INSERT ... SELECT, so nothing
+    is inserted when any rule fails. Returns None in that case.
+    """
+    source = allocation_select(
+        booking, strategy, literal(True, Boolean), change_seq_value(db), literal(datetime.utcnow(), DateTime)
+    )
+    columns = [c.key for c in BOOKING_ROW_COLUMNS[1:]] + ["change_seq", "updated_at"]
+    stmt = insert(models.Booking.__table__).from_select(columns, source)
+    if db.get_bind().dialect.name == "postgresql":
+        # One round trip: the new row comes back with the INSERT
+        row = db.execute(stmt.returning(*BOOKING_ROW_COLUMNS)).first()
+        if row is None:
+            db.rollback()
+            return None
     else:
-        raise HTTPException(status_code=400, detail="Invalid room type.")
+        result = db.execute(stmt)
+        if result.rowcount != 1:
+            db.rollback()
+            return None
+        row = db.execute(select(*BOOKING_ROW_COLUMNS).where(models.Booking.id == result.lastrowid)).first()
+    db_booking = models.Booking(**row._mapping)
+    analytics.record_booking(db, db_booking, created=True)
+    if before_commit:
+        before_commit(db_booking)
+    db.commit()
+    return db_booking
+
+def create_booking(db: Session, booking: schemas.BookingCreate, strategy: Optional[str] = None,
+                   before_commit: Optional[Callable[[models.Booking], None]] = None):
+    """
+    Book a room with the single-statement insert, choosing among free rooms
+    with the allocation strategy (ALLOCATION_STRATEGY by default). When it
+    inserts nothing, the stepwise path works out which rule failed and raises
+    accordingly. The returned Booking is built from the inserted row, not
+    loaded into `db`. `before_commit(booking)` runs in the booking's
+    transaction, so its writes commit with it; if it raises, nothing is
+    committed and the caller must roll back.
+    """
+    strategy = allocation.get_strategy(strategy)
+    if well_formed(booking):
+        db_booking = _conditional_insert(db, booking, strategy, before_commit)
+        if db_booking is not None:
+            booking_changed(db_booking, booking.room_type, "created")
+            return db_booking
+    # The fallback costs several more queries; give up now if there is no time left for them
+    deadlines.check(db)
+    return create_booking_stepwise(db, booking, strategy, before_commit)
+
+def allocate_stepwise(db: Session, booking: schemas.BookingCreate, strategy: str) -> Tuple[int, Optional[int], Optional[int]]:
+    """Query-per-rule allocation: (room_id, user_id, team_id), or raises why the booking fails"""
+    try:
+        return allocation.allocate(
+            strategy, booking.room_type, booking.user_id, booking.team_id,
+            user_busy=lambda: db.execute(select(_party_busy(booking, "user_id", booking.user_id))).scalar(),
+            team_busy=lambda: db.execute(select(_party_busy(booking, "team_id", booking.team_id))).scalar(),
+            candidates=lambda: get_room_candidates(db, booking),
+            headcount=lambda: allocation.team_headcount(db, booking.team_id),
+        )
+    except allocation.Rejected as exc:
+        if exc.unavailable:
+            raise RoomUnavailable(exc.detail)
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+def create_booking_stepwise(db: Session, booking: schemas.BookingCreate, strategy: Optional[str] = None,
+                            before_commit: Optional[Callable[[models.Booking], None]] = None):
+    """Stepwise allocation and insert; also reports why a booking failed"""
+    room_id, user_id, team_id = allocate_stepwise(db, booking, allocation.get_strategy(strategy))
+    db_booking = models.Booking(
+        room_id=room_id,
+        user_id=user_id,
+        team_id=team_id,
+        slot_date=booking.slot_date,
+        slot_start=booking.slot_start,
+        slot_end=booking.slot_end,
+        is_active=True,
+        change_seq=change_seq_value(db)
+    )
+    db.add(db_booking)
+    db.flush()
+    analytics.record_booking(db, db_booking, created=True)
+    if before_commit:
+        before_commit(db_booking)
+    db.commit()
+    db.refresh(db_booking)
+    booking_changed(db_booking, booking.room_type, "created")
+    return db_booking
 
 def get_bookings(db: Session, skip: int = 0, limit: int = 100, user_id: int = None, team_id: int = None):
     q = db.query(models.Booking).filter(models.Booking.is_active == True)
@@ -168,46 +322,323 @@ def get_bookings(db: Session, skip: int = 0, limit: int = 100, user_id: int = No
         q = q.filter(models.Booking.team_id == team_id)
     return q.offset(skip).limit(limit).all()
 
+# Lean listing queries: plain column rows for the list endpoints, no ORM hydration
+
+ROOM_ROW_COLUMNS = (
+    models.Room.id,
+    type_coerce(models.Room.room_type, String).label("room_type"),
+    models.Room.capacity,
+    models.Room.name,
+)
+
+BOOKING_ROW_COLUMNS = (
+    models.Booking.id,
+    models.Booking.room_id,
+    models.Booking.user_id,
+    models.Booking.team_id,
+    models.Booking.slot_date,
+    models.Booking.slot_start,
+    models.Booking.slot_end,
+    models.Booking.is_active,
+)
+
+def booking_row(booking: models.Booking) -> dict:
+    """Shape an ORM booking like a BOOKING_ROW_COLUMNS row"""
+    return {
+        "id": booking.id,
+        "room_id": booking.room_id,
+        "user_id": booking.user_id,
+        "team_id": booking.team_id,
+        "slot_date": booking.slot_date,
+        "slot_start": booking.slot_start,
+        "slot_end": booking.slot_end,
+        "is_active": booking.is_active,
+    }
+
+def get_all_room_rows(db: Session) -> List[dict]:
+    rows = db.execute(select(*ROOM_ROW_COLUMNS).order_by(models.Room.id))
+    return [dict(row._mapping) for row in rows]
+
+def get_booking_rows(db: Session, skip: int = 0, limit: int = 100, user_id: int = None, team_id: int = None) -> List[dict]:
+    q = select(*BOOKING_ROW_COLUMNS).where(models.Booking.is_active == True)
+    if user_id:
+        q = q.where(models.Booking.user_id == user_id)
+    if team_id:
+        q = q.where(models.Booking.team_id == team_id)
+    rows = db.execute(q.order_by(models.Booking.id).offset(skip).limit(limit))
+    return [dict(row._mapping) for row in rows]
+
+# Change feed: bookings created or cancelled after a cursor
+
+
+CHANGE_ROW_COLUMNS = BOOKING_ROW_COLUMNS + (models.Booking.change_seq,)
+
+def get_booking_changes(db: Session, since: int = 0, limit: int = 500, user_id: int = None) -> Tuple[List[dict], int, bool]:
+    """
+    Bookings whose change_seq is above `since`, oldest change first. Returns
+    (rows, next cursor, has_more). With `user_id`, only that user's bookings
+    and their teams'. Sequence numbers are assigned in commit
+    order (see _sequence_booking_changes), so no transaction still running
+    can commit below the returned cursor.
+    """
+    q = select(*CHANGE_ROW_COLUMNS).where(models.Booking.change_seq > since)
+    if user_id:
+        # Conference bookings belong to the team, so members see those too
+        q = q.where(or_(models.Booking.user_id == user_id, models.Booking.team_id.in_(
+            select(models.team_members.c.team_id).where(models.team_members.c.user_id == user_id)
+        )))
+    rows = [dict(row._mapping) for row in db.execute(q.order_by(models.Booking.change_seq).limit(limit + 1))]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1]["change_seq"] if rows else since
+    return rows, cursor, has_more
+
 def cancel_booking(db: Session, booking_id: int):
     booking = db.query(models.Booking).filter(models.Booking.id == booking_id, models.Booking.is_active == True).first()
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found.")
     booking.is_active = False
+    booking.change_seq = change_seq_value(db)
+    analytics.record_booking(db, booking, created=False)
     db.commit()
     db.refresh(booking)
+    booking_changed(booking, booking.room.room_type, "cancelled")
     return booking
 
+# Bulk cancellation: one set-based UPDATE instead of a request per booking
+
+BULK_EVENT_MAX_KEYS = 200
+
+def _bulk_conditions(booking_ids: Optional[List[int]], room_id: Optional[int], team_id: Optional[int],
+                     user_id: Optional[int], date_from: Optional[date], date_to: Optional[date]) -> list:
+    conditions = []
+    if booking_ids is not None:
+        conditions.append(models.Booking.id.in_(booking_ids))
+    if room_id is not None:
+        conditions.append(models.Booking.room_id == room_id)
+    if team_id is not None:
+        conditions.append(models.Booking.team_id == team_id)
+    if user_id is not None:
+        conditions.append(models.Booking.user_id == user_id)
+    if date_from is not None:
+        conditions.append(models.Booking.slot_date >= date_from)
+    if date_to is not None:
+        conditions.append(models.Booking.slot_date <= date_to)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Give booking ids or at least one filter.")
+    return conditions + [models.Booking.is_active == True]
+
+def _release_holds_for(db: Session, room_id: Optional[int], team_id: Optional[int], user_id: Optional[int],
+                       date_from: Optional[date], date_to: Optional[date]) -> List[tuple]:
+    """
+    Delete the holds matching bulk-cancel filters, so they cannot be confirmed
+    into the slots just cleared (e.g. on a room taken out of service). Returns
+    (id, room_id, room_type, slot_date) of each, for HoldChanged.
+    """
+    conditions = []
+    for column, value in ((models.BookingHold.room_id, room_id), (models.BookingHold.team_id, team_id),
+                          (models.BookingHold.user_id, user_id)):
+        if value is not None:
+            conditions.append(column == value)
+    if date_from is not None:
+        conditions.append(models.BookingHold.slot_date >= date_from)
+    if date_to is not None:
+        conditions.append(models.BookingHold.slot_date <= date_to)
+    released = db.execute(select(
+        models.BookingHold.id, models.BookingHold.room_id, models.BookingHold.room_type, models.BookingHold.slot_date
+    ).where(*conditions)).all()
+    if released:
+        db.execute(delete(models.BookingHold).where(models.BookingHold.id.in_([row[0] for row in released]))
+                   .execution_options(synchronize_session=False))
+    return released
+
+def bulk_cancel_bookings(db: Session, booking_ids: Optional[List[int]] = None, room_id: Optional[int] = None,
+                         team_id: Optional[int] = None, user_id: Optional[int] = None,
+                         date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[dict]:
+    """
+    Cancel every active booking matching the ids or filters in one
+    transaction and return them as booking rows with their room type. On
+    Postgres this is a single UPDATE ... FROM rooms ... RETURNING; elsewhere
+    the matching ids are selected first and updated in the same transaction.
+    Each row gets its own change_seq at commit so the change feed sees them all.
+    Holds matching the filters are released in the same transaction; with
+    only booking ids there are no holds to match.
+    """
+    conditions = _bulk_conditions(booking_ids, room_id, team_id, user_id, date_from, date_to)
+    released = [] if booking_ids is not None else _release_holds_for(db, room_id, team_id, user_id, date_from, date_to)
+    now = datetime.utcnow()
+    columns = BOOKING_ROW_COLUMNS + (models.Room.room_type,)
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = update(models.Booking).where(models.Booking.room_id == models.Room.id, *conditions).values(
+            is_active=False, change_seq=change_seq_value(db), updated_at=now
+        ).returning(*columns).execution_options(synchronize_session=False)
+        rows = [dict(row._mapping) for row in db.execute(stmt)]
+    else:
+        ids = [row[0] for row in db.execute(select(models.Booking.id).where(*conditions).order_by(models.Booking.id))]
+        if not ids and not released:
+            return []
+        rows = []
+        if ids:
+            db.execute(update(models.Booking).where(models.Booking.id.in_(ids), models.Booking.is_active == True).values(
+                is_active=False, change_seq=change_seq_value(db), updated_at=now
+            ).execution_options(synchronize_session=False))
+            rows = [dict(row._mapping) for row in db.execute(
+                select(*columns).join(models.Room, models.Room.id == models.Booking.room_id).where(
+                    models.Booking.id.in_(ids), models.Booking.change_seq.is_(None), models.Booking.updated_at == now
+                ).order_by(models.Booking.id)
+            )]
+    for row in rows:
+        row["room_type"] = row["room_type"].value
+    analytics.record_bookings(db, [models.Booking(**{k: v for k, v in row.items() if k != "room_type"}) for row in rows], created=False)
+    db.commit()
+    if rows:
+        bookings_changed(rows, "cancelled")
+    _holds_released(released)
+    return rows
+
+def _holds_released(released: List[tuple]):
+    for hold_id, room_id, room_type, slot_date in released:
+        events.publish(events.HoldChanged(
+            action="released", hold_id=hold_id, room_id=room_id,
+            room_type=room_type.value if hasattr(room_type, 'value') else room_type, slot_date=slot_date
+        ))
+
+def bookings_changed(rows: List[dict], action: str):
+    """
+    One event for many booking rows. Key lists that would be too long are
+    sent as None (everything): over BULK_EVENT_MAX_KEYS entries, or the
+    longest lists until the event encodes below events.MAX_PAYLOAD_BYTES.
+    """
+    def keys(values):
+        values = sorted(values)
+        return values if len(values) <= BULK_EVENT_MAX_KEYS else None
+    event = events.BookingsChanged(
+        action=action,
+        count=len(rows),
+        user_ids=keys({row["user_id"] for row in rows if row["user_id"]}),
+        team_ids=keys({row["team_id"] for row in rows if row["team_id"]}),
+        room_ids=keys({row["room_id"] for row in rows}),
+        slots=keys({(row["slot_date"].isoformat(), row["room_type"]) for row in rows}),
+    )
+    fields = sorted(("user_ids", "team_ids", "room_ids", "slots"), key=lambda name: len(str(getattr(event, name))), reverse=True)
+    for name in fields:
+        if events.encoded_size(event) <= events.MAX_PAYLOAD_BYTES:
+            break
+        event = event._replace(**{name: None})
+    events.publish(event)
+
 def get_available_rooms(db: Session, slot_date: date, slot_start: time, slot_end: time, room_type: str):
-    # Get all rooms of type
-    rooms = get_rooms_by_type(db, room_type)
-    available = []
-    for room in rooms:
-        # For shared, check if < capacity
-        if room_type == "shared":
-            count = db.query(models.Booking).filter(
-                models.Booking.room_id == room.id,
-                models.Booking.slot_date == slot_date,
-                models.Booking.slot_start < slot_end,
-                models.Booking.slot_end > slot_start,
-                models.Booking.is_active == True
-            ).count()
-            if count < room.capacity:
-                available.append(room)
-        else:
-            overlap = db.query(models.Booking).filter(
-                models.Booking.room_id == room.id,
-                models.Booking.slot_date == slot_date,
-                models.Booking.slot_start < slot_end,
-                models.Booking.slot_end > slot_start,
-                models.Booking.is_active == True
-            ).count()
-            if overlap == 0:
-                available.append(room)
-    return available
+    """Rooms of the type with capacity left for the slot, counting bookings and live holds"""
+    slot = schemas.BookingCreate(room_type=room_type, slot_date=slot_date, slot_start=slot_start, slot_end=slot_end)
+    free = {c.room_id for c in get_room_candidates(db, slot) if allocation.fits(room_type, c)}
+    return [room for room in get_rooms_by_type(db, room_type) if room.id in free]
+
+# Earliest-available-slot search
+
+def _minutes(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+def _as_time(minutes: int) -> time:
+    return time(minutes // 60, minutes % 60)
+
+def free_gaps(intervals: List[tuple], capacity: int, day_start: int, day_end: int) -> List[tuple]:
+    """
+    Sweep the (start, end) minute intervals booked on one room for one day and
+    return the (start, end) gaps within [day_start, day_end) where fewer than
+    `capacity` bookings overlap. Intervals need not be sorted.
+    """
+    events = []
+    for start, end in intervals:
+        events.append((start, 1))
+        events.append((end, -1))
+    # Ends sort before starts at the same minute, back-to-back bookings do not overlap
+    events.sort()
+    gaps = []
+    occupied = 0
+    gap_start = day_start
+    for at, delta in events:
+        was_free = occupied < capacity
+        occupied += delta
+        is_free = occupied < capacity
+        if was_free and not is_free:
+            if min(at, day_end) > gap_start:
+                gaps.append((gap_start, min(at, day_end)))
+        elif is_free and not was_free:
+            gap_start = max(at, day_start)
+    if occupied < capacity and day_end > gap_start:
+        gaps.append((gap_start, day_end))
+    return gaps
+
+def find_earliest_slots(db: Session, room_type: str, duration: timedelta, date_from: date, date_to: date,
+                        earliest_start: Optional[time] = None, limit: int = 5) -> List[dict]:
+    """
+    First `limit` (room, start, end) candidates of `duration` within opening
+    hours, earliest first. Loads the rooms and the window's bookings in two
+    queries and scans each room's day once; shared desks are free while a
+    seat is left, other rooms only when nothing overlaps.
+    """
+    rooms = db.query(models.Room.id, models.Room.name, models.Room.capacity).filter(
+        models.Room.room_type == room_type
+    ).order_by(models.Room.id).all()
+    if not rooms:
+        raise HTTPException(status_code=404, detail="No rooms of this type exist.")
+    booked = {}
+    rows = db.query(
+        models.Booking.room_id, models.Booking.slot_date, models.Booking.slot_start, models.Booking.slot_end
+    ).filter(
+        models.Booking.room_id.in_([room.id for room in rooms]),
+        models.Booking.slot_date >= date_from,
+        models.Booking.slot_date <= date_to,
+        models.Booking.is_active == True
+    )
+    holds = db.query(
+        models.BookingHold.room_id, models.BookingHold.slot_date, models.BookingHold.slot_start, models.BookingHold.slot_end
+    ).filter(
+        models.BookingHold.room_id.in_([room.id for room in rooms]),
+        models.BookingHold.slot_date >= date_from,
+        models.BookingHold.slot_date <= date_to,
+        models.BookingHold.expires_at > datetime.utcnow()
+    )
+    for room_id, slot_date, slot_start, slot_end in list(rows) + list(holds):
+        booked.setdefault((room_id, slot_date), []).append((_minutes(slot_start), _minutes(slot_end)))
+
+    length = int(duration.total_seconds() // 60)
+    results = []
+    day = date_from
+    while day <= date_to and len(results) < limit:
+        deadlines.check(db)
+        day_start = _minutes(OPENING_TIME)
+        if day == date_from and earliest_start is not None:
+            day_start = max(day_start, _minutes(earliest_start))
+        day_end = _minutes(CLOSING_TIME)
+        found = []
+        for room in rooms:
+            seats = room.capacity if room_type == "shared" else 1
+            for start, end in free_gaps(booked.get((room.id, day), ()), seats, day_start, day_end):
+                if end - start >= length:
+                    found.append((start, room.id, room.name))
+        found.sort()
+        for start, room_id, name in found[:limit - len(results)]:
+            results.append({
+                "room_id": room_id,
+                "room_name": name,
+                "slot_date": day,
+                "slot_start": _as_time(start),
+                "slot_end": _as_time(start + length),
+            })
+        day += timedelta(days=1)
+    return results
 
 def get_all_rooms(db: Session):
     return db.query(models.Room).all()
 
+def get_bookings_for_date(db: Session, slot_date: date):
+    """Active bookings on the date, for the rooms status board"""
+    return db.query(models.Booking).filter(
+        models.Booking.slot_date == slot_date,
+        models.Booking.is_active == True
+    ).all()
+
 def create_room(db: Session, room: schemas.RoomBase):
     db_room = models.Room(
         room_type=room.room_type,
@@ -217,6 +648,7 @@ def create_room(db: Session, room: schemas.RoomBase):
     db.add(db_room)
     db.commit()
     db.refresh(db_room)
+    events.publish(events.RoomChanged(db_room.id, db_room.room_type.value))
     return db_room
 
 def update_room(db: Session, room_id: int, room: schemas.RoomBase):
@@ -228,6 +660,7 @@ def update_room(db: Session, room_id: int, room: schemas.RoomBase):
     db_room.name = room.name
     db.commit()
     db.refresh(db_room)
+    events.publish(events.RoomChanged(db_room.id, db_room.room_type.value))
     return db_room
 
 def delete_room(db: Session, room_id: int):
@@ -236,6 +669,7 @@ def delete_room(db: Session, room_id: int):
         raise HTTPException(status_code=404, detail="Room not found.")
     db.delete(db_room)
     db.commit()
+    events.publish(events.RoomChanged(room_id, db_room.room_type.value))
     return db_room
 
 def get_user_bookings(db: Session, user_id: int, skip: int = 0, limit: int = 100):
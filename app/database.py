@@ -1,10 +1,60 @@
-from sqlalchemy import create_engine
+import os
+import threading
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+# What the app does with the schema on startup: "create" missing tables, "check" they exist, or "skip"
+DB_SCHEMA_ON_STARTUP = os.getenv("DB_SCHEMA_ON_STARTUP", "create")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Create the engine on first use, so importing the app never touches the database"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                connect_args = {}
+                if DATABASE_URL.startswith("sqlite"):
+                    # Sync endpoints run in a threadpool; connections move between threads
+                    connect_args["check_same_thread"] = False
+                engine = create_engine(DATABASE_URL, connect_args=connect_args)
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+# Picks the engine of each new session when set, e.g. per tenant (see tenants.py)
+engine_router = None
+
+class _LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        if "bind" not in local_kw:
+            if engine_router is not None:
+                local_kw["bind"] = engine_router()
+            elif self.kw.get("bind") is None:
+                get_engine()
+        return super().__call__(**local_kw)
+
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
+
+def __getattr__(name):
+    # `from database import engine` keeps working, it just creates the engine then
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def init_schema(mode: str = DB_SCHEMA_ON_STARTUP):
+    """Run at startup: create missing tables, or only check that they exist"""
+    if mode == "create":
+        Base.metadata.create_all(bind=get_engine())
+    elif mode == "check":
+        missing = set(Base.metadata.tables) - set(inspect(get_engine()).get_table_names())
+        if missing:
+            raise RuntimeError(f"Database schema is missing tables: {', '.join(sorted(missing))}")
+    elif mode != "skip":
+        raise ValueError(f"Unknown DB_SCHEMA_ON_STARTUP {mode!r}, expected create, check or skip")
@@ -0,0 +1,78 @@
+import os
+import time
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+# Seconds a request may spend on the database; 0 disables the deadline
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "10"))
+# Tighter budget for availability searches and listings, looser one for admin maintenance
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "3"))
+MAINTENANCE_DEADLINE_SECONDS = float(os.getenv("MAINTENANCE_DEADLINE_SECONDS", "300"))
+# SQLite checks the deadline every this many virtual machine instructions
+SQLITE_PROGRESS_STEPS = int(os.getenv("SQLITE_PROGRESS_STEPS", "1000"))
+
+# Postgres SQLSTATE query_canceled, raised when statement_timeout fires
+QUERY_CANCELED = "57014"
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="The request ran out of time, try again shortly.",
+            headers={"Retry-After": "1"}
+        )
+
+def set_deadline(db: Session, seconds: Optional[float]):
+    """
+    Give the session `seconds` from now to finish its database work. Applies
+    to the open transaction right away and to every later one.
+    """
+    db.info["deadline"] = time.monotonic() + seconds if seconds and seconds > 0 else None
+    if db.in_transaction():
+        _apply(db, db.connection())
+
+def remaining(db: Session) -> Optional[float]:
+    """Seconds left before the session's deadline, or None when it has none"""
+    deadline = db.info.get("deadline")
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def check(db: Session):
+    """Raise DeadlineExceeded when the deadline has passed; call before starting expensive work"""
+    left = remaining(db)
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+def is_timeout(exc: DBAPIError) -> bool:
+    """Whether the database aborted a statement because of a deadline"""
+    if getattr(exc.orig, "pgcode", None) == QUERY_CANCELED:
+        return True
+    return exc.orig is not None and type(exc.orig).__name__ == "OperationalError" and "interrupted" in str(exc.orig)
+
+def _apply(db: Session, connection):
+    deadline = db.info.get("deadline")
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        if deadline is None:
+            return  # SET LOCAL ended with the previous transaction
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded()
+        # SET cannot take bind parameters; the value is an int we computed
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
+    elif dialect == "sqlite":
+        # No statement timeout in SQLite: a progress handler interrupts the running statement.
+        # Always set or clear it, since pooled connections are shared by sessions without deadlines.
+        raw = connection.connection
+        if deadline is None:
+            raw.set_progress_handler(None, 0)
+        else:
+            raw.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_PROGRESS_STEPS)
+
+@event.listens_for(Session, "after_begin")
+def _after_begin(session, transaction, connection):
+    _apply(session, connection)
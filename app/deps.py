@@ -1,9 +1,22 @@
 from database import SessionLocal
-from typing import Generator
+from typing import Callable, Generator
+from fastapi import Depends
+import deadlines
 
 def get_db() -> Generator:
     db = SessionLocal()
+    # Statements past the request's deadline are cancelled by the database (see deadlines.py)
+    deadlines.set_deadline(db, deadlines.REQUEST_DEADLINE_SECONDS)
     try:
         yield db
     finally:
         db.close()
+
+def with_deadline(seconds: float) -> Callable:
+    """
+    Route dependency replacing the default deadline of the request's session,
+    e.g. `dependencies=[Depends(deps.with_deadline(deadlines.SEARCH_DEADLINE_SECONDS))]`
+    """
+    def route_deadline(db=Depends(get_db)):
+        deadlines.set_deadline(db, seconds)
+    return route_deadline
@@ -0,0 +1,271 @@
+import glob
+import json
+import logging
+import os
+import select
+import socket
+import tempfile
+import threading
+import uuid
+from collections import defaultdict
+from datetime import date
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# "none" for a single worker, "unix" for workers on one host, "postgres" for workers sharing the database
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "none")
+INVALIDATION_BUS_DIR = os.getenv("INVALIDATION_BUS_DIR", os.path.join(tempfile.gettempdir(), "frejun-bus"))
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "frejun_invalidation")
+# Postgres NOTIFY rejects payloads of 8000 bytes or more; events must encode below this
+MAX_PAYLOAD_BYTES = 7900
+
+class RoomChanged(NamedTuple):
+    """A room was created, updated or deleted"""
+    room_id: int
+    room_type: Optional[str] = None
+
+class BookingChanged(NamedTuple):
+    """A booking was created or cancelled"""
+    action: str  # "created" or "cancelled"
+    booking_id: int
+    room_id: int
+    room_type: Optional[str]
+    slot_date: date
+    user_id: Optional[int] = None
+    team_id: Optional[int] = None
+
+class BookingsChanged(NamedTuple):
+    """
+    Many bookings changed at once (bulk cancellation). Each list holds the
+    affected keys, or is None when there were too many to list and
+    subscribers should treat everything as affected.
+    """
+    action: str
+    count: int
+    user_ids: Optional[List[int]]
+    team_ids: Optional[List[int]]
+    room_ids: Optional[List[int]]
+    slots: Optional[List[Tuple[str, str]]]  # (ISO slot date, room type)
+
+class HoldChanged(NamedTuple):
+    """A hold was created, released or expired; confirmations publish BookingChanged"""
+    action: str  # "created", "released" or "expired"
+    hold_id: int
+    room_id: int
+    room_type: Optional[str]
+    slot_date: date
+
+class UserRevoked(NamedTuple):
+    """A user's cached identity must not be reused, e.g. after a password change"""
+    user_id: int
+
+class FeedTokenRotated(NamedTuple):
+    """URLs issued for a calendar feed stop working"""
+    kind: str
+    scope_id: int
+
+EVENT_TYPES = {cls.__name__: cls for cls in (RoomChanged, BookingChanged, BookingsChanged, HoldChanged, UserRevoked, FeedTokenRotated)}
+
+def encode(event, origin: str) -> bytes:
+    """Events carry the publisher's tenant, since ids are only unique within a tenant"""
+    fields = {k: v.isoformat() if isinstance(v, date) else v for k, v in event._asdict().items()}
+    message = {"type": type(event).__name__, "origin": origin, "tenant": tenants.current(), "fields": fields}
+    return json.dumps(message).encode("utf-8")
+
+def encoded_size(event) -> int:
+    """Bytes the event takes on the wire, see MAX_PAYLOAD_BYTES"""
+    return len(encode(event, bus.origin))
+
+def _decode(payload: bytes):
+    message = json.loads(payload)
+    cls = EVENT_TYPES[message["type"]]
+    fields = message["fields"]
+    if "slot_date" in fields:
+        fields["slot_date"] = date.fromisoformat(fields["slot_date"])
+    return cls(**fields), message["origin"], message.get("tenant", tenants.DEFAULT_TENANT)
+
+def decode(payload: bytes):
+    """Returns (event, origin)"""
+    event, origin, _ = _decode(payload)
+    return event, origin
+
+class NoopTransport:
+    """Single worker: local delivery is all there is"""
+    def start(self, deliver: Callable[[bytes], None]):
+        pass
+
+    def send(self, payload: bytes):
+        pass
+
+    def stop(self):
+        pass
+
+class UnixSocketTransport:
+    """
+    Workers on one host: each binds a datagram socket in a shared directory
+    and sends to every other socket there. Sockets of dead workers are
+    removed on the first failed send.
+    """
+    def __init__(self, directory: str = INVALIDATION_BUS_DIR):
+        self.directory = directory
+        self.path = None
+        self._sock = None
+        self._thread = None
+
+    def start(self, deliver: Callable[[bytes], None]):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._thread = threading.Thread(target=self._listen, args=(self._sock, deliver), daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _listen(sock, deliver):
+        while True:
+            try:
+                payload = sock.recv(65536)
+            except OSError:
+                return  # closed by stop()
+            deliver(payload)
+
+    def send(self, payload: bytes):
+        if self._sock is None:
+            return
+        for path in glob.glob(os.path.join(self.directory, "*.sock")):
+            if path == self.path:
+                continue
+            try:
+                self._sock.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                logger.warning("Could not send invalidation to %s", path, exc_info=True)
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+class PostgresTransport:
+    """Workers sharing a Postgres database: NOTIFY on publish, LISTEN on a dedicated connection"""
+    def __init__(self, channel: str = INVALIDATION_CHANNEL):
+        self.channel = channel
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _listener_connection(self):
+        from database import get_engine
+        connection = get_engine().raw_connection()
+        # Held for the life of the listener, so keep it out of the pool
+        connection.detach()
+        connection.connection.autocommit = True
+        return connection
+
+    def start(self, deliver: Callable[[bytes], None]):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._listen, args=(deliver,), daemon=True)
+        self._thread.start()
+
+    def _listen(self, deliver):
+        while not self._stopped.is_set():
+            try:
+                connection = self._listener_connection()
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                    raw = connection.connection
+                    while not self._stopped.is_set():
+                        if select.select([raw], [], [], 1.0)[0]:
+                            raw.poll()
+                            while raw.notifies:
+                                deliver(raw.notifies.pop(0).payload.encode("utf-8"))
+                finally:
+                    connection.close()
+            except Exception:
+                # Events sent while reconnecting are missed; caches fall back to their TTLs
+                logger.warning("Invalidation listener lost its connection, reconnecting", exc_info=True)
+                self._stopped.wait(1.0)
+
+    def send(self, payload: bytes):
+        from database import get_engine
+        with get_engine().begin() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload.decode("utf-8")})
+
+    def stop(self):
+        self._stopped.set()
+
+def get_transport(name: str = INVALIDATION_BUS):
+    if name == "postgres":
+        return PostgresTransport()
+    if name == "unix":
+        return UnixSocketTransport()
+    if name == "none":
+        return NoopTransport()
+    raise ValueError(f"Unknown INVALIDATION_BUS {name!r}, expected none, unix or postgres")
+
+class Bus:
+    """
+    Typed invalidation events. publish() runs this worker's handlers right
+    away and sends the event to the other workers, whose handlers run on
+    their listener thread. Handlers must be cheap and thread-safe.
+    """
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.transport = NoopTransport()
+        self._handlers = defaultdict(list)
+
+    def subscribe(self, event_type, handler: Callable):
+        self._handlers[event_type].append(handler)
+
+    def publish(self, event):
+        self._dispatch(event)
+        try:
+            self.transport.send(encode(event, self.origin))
+        except Exception:
+            logger.warning("Could not broadcast %s", type(event).__name__, exc_info=True)
+
+    def _dispatch(self, event):
+        for handler in self._handlers[type(event)]:
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Invalidation handler %r failed", handler)
+
+    def _receive(self, payload: bytes):
+        try:
+            event, origin, tenant = _decode(payload)
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed invalidation event %r", payload[:200])
+            return
+        if origin != self.origin:
+            # Handlers key their caches by the current tenant
+            with tenants.use(tenant):
+                self._dispatch(event)
+
+    def start(self, transport=None):
+        self.transport = transport or get_transport()
+        self.transport.start(self._receive)
+
+    def stop(self):
+        self.transport.stop()
+        self.transport = NoopTransport()
+
+bus = Bus()
+
+def subscribe(event_type, handler: Callable):
+    bus.subscribe(event_type, handler)
+
+def publish(event):
+    bus.publish(event)
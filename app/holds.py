@@ -0,0 +1,308 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, cast, delete, func, insert, inspect, literal, select
+from sqlalchemy.orm import Session
+import allocation, analytics, crud, events, models, schemas, tenants, waitlist
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Holds: capacity reserved while the user confirms, released on timeout
+
+HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", "300"))
+HOLD_MAX_TTL_SECONDS = int(os.getenv("HOLD_MAX_TTL_SECONDS", "900"))
+HOLD_MAX_PER_USER = int(os.getenv("HOLD_MAX_PER_USER", "3"))
+# Seconds between sweeps for expired holds the heap does not know about, e.g. from a crashed worker; 0 disables
+HOLD_SWEEP_SECONDS = float(os.getenv("HOLD_SWEEP_SECONDS", "60"))
+
+HOLD_COLUMNS = ["room_id", "user_id", "team_id", "slot_date", "slot_start", "slot_end", "room_type", "expires_at", "created_by"]
+
+def hold_row(hold: models.BookingHold) -> dict:
+    return {
+        "id": hold.id,
+        "room_id": hold.room_id,
+        "room_type": hold.room_type.value if hasattr(hold.room_type, 'value') else hold.room_type,
+        "user_id": hold.user_id,
+        "team_id": hold.team_id,
+        "slot_date": hold.slot_date,
+        "slot_start": hold.slot_start,
+        "slot_end": hold.slot_end,
+        "expires_at": hold.expires_at,
+    }
+
+def _hold_changed(hold: models.BookingHold, action: str):
+    events.publish(events.HoldChanged(
+        action=action,
+        hold_id=hold.id,
+        room_id=hold.room_id,
+        room_type=hold.room_type.value if hasattr(hold.room_type, 'value') else hold.room_type,
+        slot_date=hold.slot_date,
+    ))
+
+def create_hold(db: Session, request: schemas.HoldCreate, created_by: int, strategy: Optional[str] = None) -> models.BookingHold:
+    """
+    Reserve a room for the slot with the same rules and strategy as
+    crud.create_booking. The hold counts against availability until it is
+    confirmed, released or expires.
+    """
+    strategy = allocation.get_strategy(strategy)
+    ttl = min(request.ttl_seconds or HOLD_TTL_SECONDS, HOLD_MAX_TTL_SECONDS)
+    if ttl <= 0:
+        raise HTTPException(status_code=400, detail="ttl_seconds must be positive.")
+    now = datetime.utcnow()
+    live = db.execute(select(func.count(models.BookingHold.id)).where(
+        models.BookingHold.created_by == created_by, models.BookingHold.expires_at > now
+    )).scalar()
+    if live >= HOLD_MAX_PER_USER:
+        raise HTTPException(status_code=429, detail=f"At most {HOLD_MAX_PER_USER} holds at a time.")
+    expires_at = now + timedelta(seconds=ttl)
+    room_type = models.RoomTypeEnum(request.room_type) if request.room_type in models.RoomTypeEnum.__members__ else None
+    hold_id = None
+    if crud.well_formed(request) and room_type is not None:
+        source = crud.allocation_select(
+            request, strategy,
+            # Cast so Postgres takes the literal as the enum type rather than text
+            cast(literal(room_type.name), models.BookingHold.__table__.c.room_type.type),
+            literal(expires_at, DateTime), literal(created_by, Integer)
+        )
+        stmt = insert(models.BookingHold.__table__).from_select(HOLD_COLUMNS, source)
+        if db.get_bind().dialect.name == "postgresql":
+            hold_id = db.execute(stmt.returning(models.BookingHold.id)).scalar()
+        else:
+            result = db.execute(stmt)
+            hold_id = result.lastrowid if result.rowcount == 1 else None
+    if hold_id is None:
+        # Nothing inserted: find out which rule failed (raises), or take the room it finds
+        db.rollback()
+        room_id, user_id, team_id = crud.allocate_stepwise(db, request, strategy)
+        hold = models.BookingHold(
+            room_id=room_id, room_type=room_type, user_id=user_id, team_id=team_id,
+            slot_date=request.slot_date, slot_start=request.slot_start, slot_end=request.slot_end,
+            expires_at=expires_at, created_by=created_by
+        )
+        db.add(hold)
+        db.commit()
+    else:
+        db.commit()
+        hold = db.get(models.BookingHold, hold_id)
+    reaper.schedule(hold.id, hold.expires_at, tenants.current())
+    _hold_changed(hold, "created")
+    return hold
+
+def _detach(db: Session, hold: models.BookingHold):
+    """Keep the hold's attributes readable after its row is deleted"""
+    if hold not in db:
+        return
+    if inspect(hold).expired_attributes:
+        db.refresh(hold)
+    db.expunge(hold)
+
+def get_hold(db: Session, hold_id: int) -> Optional[models.BookingHold]:
+    return db.get(models.BookingHold, hold_id)
+
+def get_user_holds(db: Session, created_by: int) -> List[models.BookingHold]:
+    return db.query(models.BookingHold).filter(
+        models.BookingHold.created_by == created_by,
+        models.BookingHold.expires_at > datetime.utcnow()
+    ).order_by(models.BookingHold.expires_at).all()
+
+def confirm_hold(db: Session, hold: models.BookingHold) -> models.Booking:
+    """
+    Turn the hold into a booking for the held room. The capacity is already
+    reserved, so there is no allocation; the conditional delete makes sure
+    the hold had not expired (or been confirmed) in the meantime.
+    """
+    _detach(db, hold)
+    taken = db.execute(delete(models.BookingHold).where(
+        models.BookingHold.id == hold.id, models.BookingHold.expires_at > datetime.utcnow()
+    ).execution_options(synchronize_session=False)).rowcount
+    if taken != 1:
+        db.rollback()
+        raise HTTPException(status_code=410, detail="Hold has expired.")
+    db_booking = models.Booking(
+        room_id=hold.room_id,
+        user_id=hold.user_id,
+        team_id=hold.team_id,
+        slot_date=hold.slot_date,
+        slot_start=hold.slot_start,
+        slot_end=hold.slot_end,
+        is_active=True,
+        change_seq=crud.change_seq_value(db)
+    )
+    db.add(db_booking)
+    db.flush()
+    analytics.record_booking(db, db_booking, created=True)
+    db.commit()
+    db.refresh(db_booking)
+    reaper.cancel(hold.id, tenants.current())
+    crud.booking_changed(db_booking, hold.room_type, "created")
+    return db_booking
+
+def release_hold(db: Session, hold: models.BookingHold) -> models.BookingHold:
+    _detach(db, hold)
+    db.execute(delete(models.BookingHold).where(models.BookingHold.id == hold.id).execution_options(synchronize_session=False))
+    db.commit()
+    reaper.cancel(hold.id, tenants.current())
+    _hold_changed(hold, "released")
+    return hold
+
+def expire_holds(db: Session, hold_ids: List[int], now: Optional[datetime] = None) -> List[models.BookingHold]:
+    """Delete the given holds that have expired; returns the deleted ones"""
+    now = now or datetime.utcnow()
+    expired = db.query(models.BookingHold).filter(
+        models.BookingHold.id.in_(hold_ids), models.BookingHold.expires_at <= now
+    ).all()
+    if expired:
+        for hold in expired:
+            db.expunge(hold)
+        db.execute(delete(models.BookingHold).where(
+            models.BookingHold.id.in_([hold.id for hold in expired]), models.BookingHold.expires_at <= now
+        ).execution_options(synchronize_session=False))
+        db.commit()
+    return expired
+
+class HoldReaper:
+    """
+    Expires holds from a min-heap of (expires_at, hold_id) on a background
+    thread, sleeping until the earliest one is due; no table scans. Each
+    worker reaps the holds it created plus those it found at startup. A
+    sweep every HOLD_SWEEP_SECONDS catches the rest, e.g. holds of a worker
+    that crashed. Expired holds stop counting against availability even
+    before they are reaped, so a late reap only delays cleanup. Holds are
+    keyed by (tenant, hold id) and reaped in their tenant.
+    """
+    def __init__(self):
+        self._heap = []
+        self._scheduled = set()
+        self._cancelled = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def schedule(self, hold_id: int, expires_at: datetime, tenant: str = tenants.DEFAULT_TENANT):
+        key = (tenant, hold_id)
+        with self._condition:
+            self._cancelled.discard(key)
+            self._scheduled.add(key)
+            heapq.heappush(self._heap, (expires_at, key))
+            # Wake the thread if this hold is now the earliest
+            if self._heap[0][1] == key:
+                self._condition.notify()
+
+    def cancel(self, hold_id: int, tenant: str = tenants.DEFAULT_TENANT):
+        """The hold is gone already (confirmed or released); skip it when it comes up"""
+        key = (tenant, hold_id)
+        with self._condition:
+            if key in self._scheduled:
+                self._cancelled.add(key)
+
+    def due(self, now: datetime) -> List[tuple]:
+        """Pop the (tenant, hold id) keys that are due"""
+        keys = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                _, key = heapq.heappop(self._heap)
+                self._scheduled.discard(key)
+                if key in self._cancelled:
+                    self._cancelled.discard(key)
+                else:
+                    keys.append(key)
+        return keys
+
+    def load(self, db: Session):
+        """Schedule the holds already in the table, e.g. left by a restarted worker"""
+        rows = db.execute(
+            select(models.BookingHold.id, models.BookingHold.expires_at, models.BookingHold.tenant_id)
+            .execution_options(all_tenants=True)
+        )
+        for hold_id, expires_at, tenant in rows:
+            self.schedule(hold_id, expires_at, tenant)
+
+    def _each_database(self, fn):
+        """Run fn(db) on the shared database, or on each known tenant's own schema or database"""
+        names = [tenants.DEFAULT_TENANT] if tenants.TENANT_ROUTING == "shared" else tenants.known()
+        for tenant in names:
+            with tenants.use(tenant):
+                db = SessionLocal()
+                try:
+                    fn(db)
+                except Exception:
+                    logger.exception("Hold maintenance failed for tenant %s", tenant)
+                finally:
+                    db.close()
+
+    def sweep(self, now: Optional[datetime] = None):
+        """Reap every expired hold in the table, whichever worker created it"""
+        now = now or datetime.utcnow()
+
+        def expired(db: Session):
+            by_tenant = {}
+            for hold_id, tenant in db.execute(
+                select(models.BookingHold.id, models.BookingHold.tenant_id)
+                .where(models.BookingHold.expires_at <= now).execution_options(all_tenants=True)
+            ):
+                by_tenant.setdefault(tenant, []).append(hold_id)
+            db.rollback()
+            for tenant, hold_ids in by_tenant.items():
+                self.reap(hold_ids, tenant)
+        self._each_database(expired)
+
+    def _run(self):
+        next_sweep = time.monotonic() + HOLD_SWEEP_SECONDS if HOLD_SWEEP_SECONDS > 0 else None
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    waits = []
+                    if self._heap:
+                        waits.append((self._heap[0][0] - datetime.utcnow()).total_seconds())
+                    if next_sweep is not None:
+                        waits.append(next_sweep - time.monotonic())
+                    if waits and min(waits) <= 0:
+                        break
+                    self._condition.wait(min(waits) if waits else None)
+                if self._stopping:
+                    return
+            if next_sweep is not None and time.monotonic() >= next_sweep:
+                self.sweep()
+                next_sweep = time.monotonic() + HOLD_SWEEP_SECONDS
+            keys = self.due(datetime.utcnow())
+            by_tenant = {}
+            for tenant, hold_id in keys:
+                by_tenant.setdefault(tenant, []).append(hold_id)
+            for tenant, hold_ids in by_tenant.items():
+                try:
+                    self.reap(hold_ids, tenant)
+                except Exception:
+                    logger.exception("Could not expire holds %s of tenant %s", hold_ids, tenant)
+
+    def reap(self, hold_ids: List[int], tenant: str = tenants.DEFAULT_TENANT):
+        with tenants.use(tenant):
+            db = SessionLocal()
+            try:
+                expired = expire_holds(db, hold_ids)
+                for hold in expired:
+                    _hold_changed(hold, "expired")
+                    # Freed capacity goes to the waitlist first
+                    waitlist.promote_waiters(db, hold.slot_date, hold.room_type.value, hold.slot_start, hold.slot_end)
+            finally:
+                db.close()
+
+    def start(self):
+        self._each_database(self.load)
+        with self._condition:
+            self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="hold-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+reaper = HoldReaper()
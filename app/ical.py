@@ -0,0 +1,238 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models, events, tenants
+from database import SessionLocal
+
+ICAL_CACHE_MAX_FEEDS = int(os.getenv("ICAL_CACHE_MAX_FEEDS", "1000"))
+# Feeds larger than this are streamed on every miss instead of being kept in memory
+ICAL_CACHE_MAX_BYTES = int(os.getenv("ICAL_CACHE_MAX_BYTES", str(256 * 1024)))
+ICAL_PAST_DAYS = int(os.getenv("ICAL_PAST_DAYS", "30"))
+ICAL_FETCH_SIZE = 500
+
+FEED_KINDS = ("users", "teams", "rooms")
+
+class FeedCache:
+    """
+    Version counter per feed scope, bumped when a booking in that scope
+    changes, plus an LRU of rendered bodies for small feeds. The ETag is
+    derived from the version, so a poll that matches needs no query at all.
+    """
+    def __init__(self, max_feeds: int = ICAL_CACHE_MAX_FEEDS):
+        self.max_feeds = max_feeds
+        # Distinguishes this process's versions from another worker's or an earlier run's
+        self._token = uuid.uuid4().hex[:8]
+        self._generation = 0
+        self._versions = {}
+        self._bodies: "OrderedDict[tuple, Tuple[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self, scope: tuple) -> str:
+        with self._lock:
+            version = self._versions.get(scope, 0)
+            return f'"{self._token}-{self._generation}-{version}"'
+
+    def get(self, scope: tuple, etag: str) -> Optional[bytes]:
+        with self._lock:
+            cached = self._bodies.get(scope)
+            if cached is None or cached[0] != etag:
+                return None
+            self._bodies.move_to_end(scope)
+            return cached[1]
+
+    def put(self, scope: tuple, etag: str, body: bytes):
+        with self._lock:
+            # Only keep the body if nothing changed while it was rendering
+            if f'"{self._token}-{self._generation}-{self._versions.get(scope, 0)}"' != etag:
+                return
+            self._bodies[scope] = (etag, body)
+            self._bodies.move_to_end(scope)
+            while len(self._bodies) > self.max_feeds:
+                self._bodies.popitem(last=False)
+
+    def invalidate(self, *scopes: tuple):
+        with self._lock:
+            for scope in scopes:
+                if scope[-1] is None:
+                    continue
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+                self._bodies.pop(scope, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self._bodies.clear()
+
+cache = FeedCache()
+
+def scope(kind: str, scope_id: Optional[int]) -> Tuple[str, str, Optional[int]]:
+    """Cache key of a feed; handlers run in the tenant of the event, see events.Bus"""
+    return (tenants.current(), kind, scope_id)
+
+def _on_booking_changed(event: events.BookingChanged):
+    cache.invalidate(scope("users", event.user_id), scope("teams", event.team_id), scope("rooms", event.room_id))
+
+def _on_bookings_changed(event: events.BookingsChanged):
+    scopes = {"users": event.user_ids, "teams": event.team_ids, "rooms": event.room_ids}
+    if any(ids is None for ids in scopes.values()):
+        cache.invalidate_all()
+        return
+    cache.invalidate(*(scope(kind, scope_id) for kind, ids in scopes.items() for scope_id in ids))
+
+def _on_room_changed(event: events.RoomChanged):
+    # Room names appear in every feed that has a booking there
+    cache.invalidate_all()
+
+class TokenVersions:
+    """
+    Token version per feed scope, loaded once so a poll is verified without
+    a query. Rotating a feed publishes FeedTokenRotated, which drops its
+    version here and on the other workers.
+    """
+    def __init__(self, max_feeds: int = ICAL_CACHE_MAX_FEEDS):
+        self.max_feeds = max_feeds
+        self._versions: "OrderedDict[tuple, int]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, db: Session, kind: str, scope_ids: Iterable[int]) -> Dict[int, int]:
+        result, missing = {}, []
+        with self._lock:
+            generation = self._generation
+            for scope_id in scope_ids:
+                version = self._versions.get(scope(kind, scope_id))
+                if version is None:
+                    missing.append(scope_id)
+                else:
+                    self._versions.move_to_end(scope(kind, scope_id))
+                    result[scope_id] = version
+        if missing:
+            loaded = dict(db.execute(select(models.FeedToken.scope_id, models.FeedToken.version).where(
+                models.FeedToken.kind == kind, models.FeedToken.scope_id.in_(missing)
+            )).all())
+            with self._lock:
+                for scope_id in missing:
+                    result[scope_id] = loaded.get(scope_id, 0)
+                    # A rotation while loading may have made the loaded version stale
+                    if generation == self._generation:
+                        self._versions[scope(kind, scope_id)] = result[scope_id]
+                while len(self._versions) > self.max_feeds:
+                    self._versions.popitem(last=False)
+        return result
+
+    def get(self, db: Session, kind: str, scope_id: int) -> int:
+        return self.get_many(db, kind, [scope_id])[scope_id]
+
+    def forget(self, feed_scope: tuple):
+        with self._lock:
+            self._generation += 1
+            self._versions.pop(feed_scope, None)
+
+token_versions = TokenVersions()
+
+def rotate_token(db: Session, kind: str, scope_id: int) -> int:
+    """Revoke every URL issued for the feed; returns the new token version"""
+    for attempt in range(2):
+        rotated = db.execute(update(models.FeedToken).where(
+            models.FeedToken.kind == kind, models.FeedToken.scope_id == scope_id
+        ).values(version=models.FeedToken.version + 1, rotated_at=datetime.utcnow()).execution_options(
+            synchronize_session=False
+        )).rowcount
+        if not rotated:
+            db.add(models.FeedToken(kind=kind, scope_id=scope_id, version=1))
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            # Another request created the row first; bump that one instead
+            db.rollback()
+            if attempt:
+                raise
+    version = db.execute(select(models.FeedToken.version).where(
+        models.FeedToken.kind == kind, models.FeedToken.scope_id == scope_id
+    )).scalar()
+    token_versions.forget(scope(kind, scope_id))
+    events.publish(events.FeedTokenRotated(kind, scope_id))
+    return version
+
+def _on_feed_token_rotated(event: events.FeedTokenRotated):
+    token_versions.forget(scope(event.kind, event.scope_id))
+
+events.subscribe(events.BookingChanged, _on_booking_changed)
+events.subscribe(events.BookingsChanged, _on_bookings_changed)
+events.subscribe(events.RoomChanged, _on_room_changed)
+events.subscribe(events.FeedTokenRotated, _on_feed_token_rotated)
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _stamp(day: date, at) -> str:
+    return datetime.combine(day, at).strftime("%Y%m%dT%H%M%S")
+
+def render(kind: str, scope_id: int, calendar_name: str) -> Iterator[bytes]:
+    """
+    Yield the feed in chunks. Uses its own session and fetches bookings in
+    batches, so a large room feed is never held in memory as a whole.
+    """
+    column = {
+        "users": models.Booking.user_id,
+        "teams": models.Booking.team_id,
+        "rooms": models.Booking.room_id,
+    }[kind]
+    dtstamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    yield (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//FreJun//Room Booking//EN\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        f"X-WR-CALNAME:{_escape(calendar_name)}\r\n"
+    ).encode("utf-8")
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(
+                models.Booking.id, models.Booking.slot_date, models.Booking.slot_start,
+                models.Booking.slot_end, models.Room.name, models.Room.room_type
+            ).join(models.Room, models.Room.id == models.Booking.room_id).where(
+                column == scope_id,
+                models.Booking.is_active == True,
+                models.Booking.slot_date >= date.today() - timedelta(days=ICAL_PAST_DAYS)
+            ).order_by(models.Booking.slot_date, models.Booking.slot_start).execution_options(yield_per=ICAL_FETCH_SIZE)
+        )
+        for batch in rows.partitions(ICAL_FETCH_SIZE):
+            chunk = []
+            for booking_id, slot_date, slot_start, slot_end, room_name, room_type in batch:
+                chunk.append(
+                    "BEGIN:VEVENT\r\n"
+                    f"UID:booking-{booking_id}@frejun-room-booking\r\n"
+                    f"DTSTAMP:{dtstamp}\r\n"
+                    f"DTSTART:{_stamp(slot_date, slot_start)}\r\n"
+                    f"DTEND:{_stamp(slot_date, slot_end)}\r\n"
+                    f"SUMMARY:{_escape(room_name)} ({room_type.value})\r\n"
+                    f"LOCATION:{_escape(room_name)}\r\n"
+                    "END:VEVENT\r\n"
+                )
+            yield "".join(chunk).encode("utf-8")
+    finally:
+        db.close()
+    yield b"END:VCALENDAR\r\n"
+
+def render_cached(kind: str, scope_id: int, calendar_name: str, etag: str) -> Iterator[bytes]:
+    """Stream the feed, keeping the body for next time if it stays small"""
+    parts, size = [], 0
+    for chunk in render(kind, scope_id, calendar_name):
+        if parts is not None:
+            size += len(chunk)
+            if size <= ICAL_CACHE_MAX_BYTES:
+                parts.append(chunk)
+            else:
+                parts = None
+        yield chunk
+    if parts is not None:
+        cache.put(scope(kind, scope_id), etag, b"".join(parts))
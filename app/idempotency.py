@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+from fastapi import HTTPException
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+class _Entry:
+    __slots__ = ("request_hash", "expires_at", "done", "status_code", "body", "detail")
+
+    def __init__(self, request_hash: str, expires_at: float):
+        self.request_hash = request_hash
+        self.expires_at = expires_at
+        self.done = threading.Event()
+        self.status_code: Optional[int] = None
+        self.body: Any = None
+        self.detail: Any = None
+
+class IdempotencyStore:
+    """
+    In-memory LRU of idempotency keys with a TTL. Each key remembers the hash
+    of the request that claimed it and, once finished, its response. Duplicate
+    requests arriving while the first one is still running wait for it instead
+    of re-entering the handler.
+    """
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _claim(self, key: str, request_hash: str) -> Tuple[_Entry, bool]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.done.is_set() and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                if len(self._entries) >= self.max_keys and not self._evict_finished():
+                    # Dropping an in-flight key would let its retry allocate a second time
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Too many idempotent requests in progress, try again shortly.",
+                        headers={"Retry-After": "1"}
+                    )
+                entry = _Entry(request_hash, now + self.ttl)
+                self._entries[key] = entry
+                return entry, True
+            self._entries.move_to_end(key)
+        if entry.request_hash != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request.")
+        return entry, False
+
+    def _evict_finished(self) -> bool:
+        """Drop the least recently used finished entry; call with the lock held"""
+        for key, entry in self._entries.items():
+            if entry.done.is_set():
+                del self._entries[key]
+                return True
+        return False
+
+    def _release(self, key: str, entry: _Entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def run(self, key: str, request_hash: str, handler: Callable[[], Any]) -> Tuple[int, Any, bool]:
+        """
+        Run handler once per key. Returns (status_code, body, replayed).
+        HTTPExceptions raised by the handler are remembered and re-raised on
+        replay; any other error frees the key so the client can retry.
+        """
+        while True:
+            entry, owner = self._claim(key, request_hash)
+            if owner:
+                break
+            if not entry.done.wait(IDEMPOTENCY_WAIT_SECONDS):
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress.")
+            if entry.status_code is None:
+                # The first request failed unexpectedly; take over the key
+                continue
+            if entry.detail is not None:
+                raise HTTPException(status_code=entry.status_code, detail=entry.detail)
+            return entry.status_code, entry.body, True
+
+        try:
+            body = handler()
+        except HTTPException as exc:
+            if exc.status_code >= 500:
+                self._release(key, entry)
+                raise
+            entry.status_code, entry.detail = exc.status_code, exc.detail
+            entry.done.set()
+            raise
+        except BaseException:
+            self._release(key, entry)
+            raise
+        entry.status_code, entry.body = 200, body
+        entry.done.set()
+        return 200, body, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def request_hash(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+store = IdempotencyStore()
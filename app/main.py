@@ -1,17 +1,20 @@
-from fastapi import FastAPI, Request
+import os
+from fastapi import BackgroundTasks, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi import Form, Query
 from starlette.middleware.sessions import SessionMiddleware
-import crud, schemas, security, models
+import crud, schemas, security, models, waitlist, sessions, events, holds, profiler, deadlines, tenants
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session as OrmSession
 from deps import get_db
 from fastapi import Depends
 
-from database import Base, engine
-from routers import bookings, rooms, auth
+import database
+from ratelimit import RateLimitMiddleware
+from routers import bookings, rooms, auth, calendar, admin
 
 app = FastAPI(
     title="FreJun Room Booking API",
@@ -29,6 +32,14 @@ app = FastAPI(
         {
             "name": "rooms",
             "description": "Room management operations"
+        },
+        {
+            "name": "calendar",
+            "description": "iCalendar feeds of bookings"
+        },
+        {
+            "name": "admin",
+            "description": "Administration and utilization analytics"
         }
     ]
 )
@@ -42,11 +53,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files and templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+# Mount static files and templates; neither touches the disk until the first request
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static"), check_dir=False), name="static")
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
+# Profiling sits inside rate limiting, so queueing for admission is not profiled
+app.add_middleware(profiler.ProfilerMiddleware)
+# Rate limiting sits inside the session middleware so it can key on the session user
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(SessionMiddleware, secret_key="supersecretkey")
+# Outermost, so everything the request does runs as its tenant
+app.add_middleware(tenants.TenantMiddleware)
+
+@app.exception_handler(DBAPIError)
+async def database_error(request: Request, exc: DBAPIError):
+    # Statements cancelled at the request deadline are a 503 like deadlines.check(); anything else stays a 500
+    if not deadlines.is_timeout(exc):
+        raise exc
+    error = deadlines.DeadlineExceeded()
+    return JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
 
 # Helper to get current user from session
 async def get_current_user_from_session(request: Request, db: OrmSession = Depends(get_db)):
@@ -93,13 +119,23 @@ def dashboard(request: Request, db: OrmSession = Depends(get_db), page: int = Qu
     user_id = request.session.get("user_id")
     if not user_id:
         return RedirectResponse("/login")
-    user = crud.get_user(db, user_id)
-    page_size = 10
-    bookings = crud.get_user_bookings(db, user_id, skip=(page-1)*page_size, limit=page_size)
-    return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "page": page})
+    # Principal and first page come from the server-side session cache
+    user = sessions.get_principal(db, user_id)
+    if user is None:
+        request.session.clear()
+        return RedirectResponse("/login")
+    page_size = sessions.DASHBOARD_PAGE_SIZE
+    if page == 1:
+        bookings = sessions.get_first_page(db, user_id)
+    else:
+        bookings = crud.get_user_bookings(db, user_id, skip=(page-1)*page_size, limit=page_size)
+    notifications = waitlist.pop_notifications(db, user_id)
+    return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "page": page, "notifications": notifications})
 
 @app.get("/logout")
 def logout(request: Request):
+    if request.session.get("user_id"):
+        events.publish(events.UserRevoked(request.session["user_id"]))
     request.session.clear()
     return RedirectResponse("/login")
 
@@ -108,7 +144,7 @@ def book_room(request: Request, db: OrmSession = Depends(get_db), room_type: str
     session_user_id = request.session.get("user_id")
     if not session_user_id:
         return RedirectResponse("/login")
-    user = crud.get_user(db, session_user_id)
+    user = sessions.get_principal(db, session_user_id)
     # Admin can book for others
     booking_user_id = user_id if (user.is_admin and user_id) else session_user_id
     booking_in = schemas.BookingCreate(
@@ -121,25 +157,29 @@ def book_room(request: Request, db: OrmSession = Depends(get_db), room_type: str
     try:
         crud.create_booking(db, booking_in)
         success = "Room booked successfully!"
-        bookings = crud.get_user_bookings(db, session_user_id)
+        bookings = sessions.get_first_page(db, session_user_id)
         return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "success": success})
     except Exception as e:
-        bookings = crud.get_user_bookings(db, session_user_id)
+        bookings = sessions.get_first_page(db, session_user_id)
         return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "error": str(e)})
 
 @app.post("/cancel")
-def cancel_booking(request: Request, db: OrmSession = Depends(get_db), booking_id: int = Form(...)):
+def cancel_booking(request: Request, background_tasks: BackgroundTasks, db: OrmSession = Depends(get_db), booking_id: int = Form(...)):
     user_id = request.session.get("user_id")
     if not user_id:
         return RedirectResponse("/login")
     try:
-        crud.cancel_booking(db, booking_id)
+        booking = crud.cancel_booking(db, booking_id)
+        background_tasks.add_task(
+            waitlist.promote_waiters_task,
+            booking.slot_date, booking.room.room_type.value, booking.slot_start, booking.slot_end
+        )
         success = "Booking cancelled successfully."
     except Exception as e:
         success = None
         error = str(e)
-    user = crud.get_user(db, user_id)
-    bookings = crud.get_user_bookings(db, user_id)
+    user = sessions.get_principal(db, user_id)
+    bookings = sessions.get_first_page(db, user_id)
     return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "success": success if success else None, "error": error if not success else None})
 
 @app.post("/change-password")
@@ -148,7 +188,7 @@ def change_password(request: Request, db: OrmSession = Depends(get_db), current_
     if not user_id:
         return RedirectResponse("/login")
     user = crud.get_user(db, user_id)
-    bookings = crud.get_user_bookings(db, user_id)
+    bookings = sessions.get_first_page(db, user_id)
     # Validate current password
     if not security.verify_password(current_password, user.hashed_password):
         return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "error": "Current password is incorrect."})
@@ -160,12 +200,35 @@ def change_password(request: Request, db: OrmSession = Depends(get_db), current_
     user.hashed_password = security.get_password_hash(new_password)
     db.commit()
     db.refresh(user)
+    events.publish(events.UserRevoked(user.id))
     success = "Password changed successfully."
     return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "bookings": bookings, "success": success})
 
-# Create tables and include routers
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+def init_database():
+    # Schema work happens once the worker starts serving, not on import
+    database.init_schema()
+
+@app.on_event("startup")
+def start_invalidation_bus():
+    events.bus.start()
+
+@app.on_event("startup")
+def start_hold_reaper():
+    holds.reaper.start()
+
+@app.on_event("startup")
+def install_profiler():
+    # Lets the profiler follow requests into the thread pool; no cost while it is off
+    profiler.install()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    holds.reaper.stop()
+    events.bus.stop()
 
 app.include_router(auth.router)
 app.include_router(bookings.router)
 app.include_router(rooms.router)
+app.include_router(calendar.router)
+app.include_router(admin.router)
@@ -1,9 +1,11 @@
 import enum
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Time, Enum, Boolean, Table
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Date, Time, Enum, Boolean, Table, Index, Sequence, UniqueConstraint, event, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import DateTime
 from sqlalchemy.sql import func
 from database import Base
+import tenants
 
 class GenderEnum(enum.Enum):
     male = "male"
@@ -15,6 +17,19 @@ class RoomTypeEnum(enum.Enum):
     conference = "conference"
     shared = "shared"
 
+class WaitlistStatusEnum(enum.Enum):
+    waiting = "waiting"
+    promoted = "promoted"
+    cancelled = "cancelled"
+
+# Change sequence for bookings, bumped on every create and cancel at commit (PostgreSQL;
+# other dialects derive the next value from max(change_seq))
+booking_change_seq = Sequence("booking_change_seq", metadata=Base.metadata)
+
+class TenantMixin:
+    """Rows owned by a tenant; ORM queries only see the current tenant's (see tenants.py)"""
+    tenant_id = Column(String(64), nullable=False, index=True, default=tenants.current)
+
 team_members = Table(
     "team_members",
     Base.metadata,
@@ -22,11 +37,14 @@ team_members = Table(
     Column("user_id", Integer, ForeignKey("users.id"))
 )
 
-class User(Base):
+class User(TenantMixin, Base):
     __tablename__ = "users"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "email", name="uq_users_tenant_email"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
+    email = Column(String, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     age = Column(Integer, nullable=False)
     gender = Column(Enum(GenderEnum), nullable=False)
@@ -34,23 +52,60 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-class Team(Base):
+class Team(TenantMixin, Base):
     __tablename__ = "teams"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     members = relationship("User", secondary=team_members)
 
-class Room(Base):
+# Name prefix search in the admin booking search (booking_search.py). On Postgres,
+# text_pattern_ops lets LIKE 'prefix%' use the index under any collation
+Index("ix_users_tenant_name_lower", User.tenant_id, func.lower(User.name).label("name_lower"),
+      postgresql_ops={"name_lower": "text_pattern_ops"})
+Index("ix_teams_tenant_name_lower", Team.tenant_id, func.lower(Team.name).label("name_lower"),
+      postgresql_ops={"name_lower": "text_pattern_ops"})
+
+def _create_trigram_index(table, connection, **kw):
+    """Substring search on names, only on Postgres where the pg_trgm extension is installed"""
+    if connection.dialect.name != "postgresql":
+        return
+    if connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is None:
+        return
+    # Qualified with the schema the table was created in (a tenant's, under schema_translate_map),
+    # so each schema gets its own index instead of resolving the table through search_path
+    schema = connection.get_execution_options().get("schema_translate_map", {}).get(table.schema, table.schema)
+    preparer = connection.dialect.identifier_preparer
+    fullname = preparer.quote(table.name)
+    if schema:
+        fullname = f"{preparer.quote_schema(schema)}.{fullname}"
+    index = preparer.quote(f"ix_{table.name}_name_trgm")
+    connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {index} ON {fullname} USING gin (name gin_trgm_ops)")
+
+for _table in (User.__table__, Team.__table__):
+    event.listen(_table, "after_create", _create_trigram_index)
+
+class Room(TenantMixin, Base):
     __tablename__ = "rooms"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "name", name="uq_rooms_tenant_name"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     room_type = Column(Enum(RoomTypeEnum), nullable=False)
     capacity = Column(Integer, nullable=False)
-    name = Column(String, nullable=False, unique=True)
+    name = Column(String, nullable=False)
     description = Column(String, nullable=True)
     bookings = relationship("Booking", back_populates="room")
 
-class Booking(Base):
+class Booking(TenantMixin, Base):
     __tablename__ = "bookings"
+    __table_args__ = (
+        # Overlap checks filter on one of these plus the date
+        Index("ix_bookings_room_date", "room_id", "slot_date"),
+        Index("ix_bookings_user_date", "user_id", "slot_date"),
+        Index("ix_bookings_team_date", "team_id", "slot_date"),
+        # Keyset paging of the admin booking search, newest slot first
+        Index("ix_bookings_tenant_date_id", "tenant_id", "slot_date", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -59,4 +114,78 @@ class Booking(Base):
     slot_start = Column(Time, nullable=False)
     slot_end = Column(Time, nullable=False)
     is_active = Column(Boolean, default=True)
+    change_seq = Column(BigInteger, nullable=True, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     room = relationship("Room", back_populates="bookings")
+
+class WaitlistEntry(TenantMixin, Base):
+    __tablename__ = "waitlist_entries"
+    __table_args__ = (
+        Index("ix_waitlist_queue", "slot_date", "room_type", "status", "priority"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=True)
+    room_type = Column(Enum(RoomTypeEnum), nullable=False)
+    slot_date = Column(Date, nullable=False)
+    slot_start = Column(Time, nullable=False)
+    slot_end = Column(Time, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    status = Column(Enum(WaitlistStatusEnum), nullable=False, default=WaitlistStatusEnum.waiting)
+    booking_id = Column(Integer, ForeignKey("bookings.id"), nullable=True)
+    notified = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RoomUsageHourly(Base):
+    """Booked minutes per room and hour, kept by analytics.py"""
+    __tablename__ = "room_usage_hourly"
+    __table_args__ = (
+        Index("ix_room_usage_hourly_date", "slot_date"),
+    )
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    slot_date = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+
+class RoomUsageDaily(Base):
+    """Per room and day: booked minutes of active bookings, bookings made and cancelled"""
+    __tablename__ = "room_usage_daily"
+    __table_args__ = (
+        Index("ix_room_usage_daily_date", "slot_date"),
+    )
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    slot_date = Column(Date, primary_key=True)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+    bookings = Column(Integer, nullable=False, default=0)
+    cancellations = Column(Integer, nullable=False, default=0)
+
+class BookingHold(TenantMixin, Base):
+    """Capacity reserved for a short time before the booking is confirmed, see holds.py"""
+    __tablename__ = "booking_holds"
+    __table_args__ = (
+        Index("ix_booking_holds_room_date", "room_id", "slot_date"),
+        Index("ix_booking_holds_user_date", "user_id", "slot_date"),
+        Index("ix_booking_holds_team_date", "team_id", "slot_date"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
+    room_type = Column(Enum(RoomTypeEnum), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=True)
+    slot_date = Column(Date, nullable=False)
+    slot_start = Column(Time, nullable=False)
+    slot_end = Column(Time, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+class FeedToken(TenantMixin, Base):
+    """Version mixed into a calendar feed's token; rotating it revokes the URLs issued so far (see ical.py)"""
+    __tablename__ = "feed_tokens"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "kind", "scope_id", name="uq_feed_tokens_tenant_scope"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(16), nullable=False)
+    scope_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+    rotated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
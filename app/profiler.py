@@ -0,0 +1,358 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Off unless enabled here or by an admin at runtime (per worker)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+# Fraction of requests to profile, and the latency (ms) above which a request is kept; 0 disables either
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_SLOW_MS = float(os.getenv("PROFILER_SLOW_MS", "0"))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_BUFFER_SIZE = int(os.getenv("PROFILER_BUFFER_SIZE", "50"))
+PROFILER_MAX_STATEMENTS = int(os.getenv("PROFILER_MAX_STATEMENTS", "500"))
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "100"))
+# Requests carrying this header are profiled while the profiler is enabled
+PROFILER_HEADER = os.getenv("PROFILER_HEADER", "x-profile").lower().encode("latin-1")
+
+EXEMPT_PREFIXES = ("/static", "/docs", "/redoc", "/openapi.json", "/api/v1/admin/profiler")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("profile", default=None)
+
+class Settings:
+    """Runtime switches, changed through the admin endpoints"""
+    def __init__(self):
+        self.enabled = PROFILER_ENABLED
+        self.sample_rate = PROFILER_SAMPLE_RATE
+        self.slow_ms = PROFILER_SLOW_MS
+
+    def as_dict(self) -> dict:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "slow_ms": self.slow_ms}
+
+settings = Settings()
+
+def _label(code) -> str:
+    filename = code.co_filename
+    for prefix in sys.path:
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+class Profile:
+    """Stack samples and SQL statements of one request"""
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.trigger = trigger  # "header", "sampled" or "slow"
+        self.started_at = datetime.utcnow()
+        self.t0 = time.perf_counter()
+        self.duration_ms = None
+        self.status_code = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.statements: List[dict] = []
+        self.dropped_statements = 0
+        self._labels: Dict[object, str] = {}
+
+    def add_sample(self, frame):
+        stack = []
+        while frame is not None and len(stack) < PROFILER_MAX_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _label(code)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def add_statement(self, statement: str, started: float, ended: float, rowcount: int = -1, error: Optional[str] = None):
+        if len(self.statements) >= PROFILER_MAX_STATEMENTS:
+            self.dropped_statements += 1
+            return
+        entry = {
+            "start_ms": round((started - self.t0) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+            "statement": statement[:2000],
+            "rowcount": rowcount,
+        }
+        if error:
+            entry["error"] = error
+        self.statements.append(entry)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "sql_statements": len(self.statements) + self.dropped_statements,
+            "sql_ms": round(sum(s["duration_ms"] for s in self.statements), 3),
+        }
+
+    def tree(self) -> dict:
+        root = {"name": "<request>", "samples": 0, "children": {}}
+        for stack, count in self.stacks.items():
+            node = root
+            node["samples"] += count
+            for label in stack:
+                node = node["children"].setdefault(label, {"name": label, "samples": 0, "children": {}})
+                node["samples"] += count
+
+        def finish(node):
+            children = sorted(node["children"].values(), key=lambda child: -child["samples"])
+            node["children"] = [finish(child) for child in children]
+            return node
+        return finish(root)
+
+    def hot(self, limit: int = 20) -> List[dict]:
+        """Functions by samples spent in the function itself"""
+        own = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+        return [{"name": name, "samples": count} for name, count in own.most_common(limit)]
+
+    def collapsed(self) -> str:
+        """Folded stacks, the input format of flamegraph.pl and speedscope"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def as_dict(self) -> dict:
+        result = self.summary()
+        result.update({
+            "interval_ms": PROFILER_INTERVAL_MS,
+            "hot": self.hot(),
+            "tree": self.tree(),
+            "sql": self.statements,
+            "sql_dropped": self.dropped_statements,
+        })
+        return result
+
+class Sampler:
+    """
+    One background thread that samples the stacks of the threads and event
+    loop tasks currently serving profiled requests. It only runs while at
+    least one request is being profiled.
+    """
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._threads: Dict[int, Profile] = {}
+        self._tasks: Dict[object, tuple] = {}  # task -> (profile, loop, loop thread id)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def track_thread(self, profile: Profile):
+        with self._lock:
+            self._threads[threading.get_ident()] = profile
+        self._ensure_running()
+
+    def untrack_thread(self):
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def track_task(self, profile: Profile):
+        task = asyncio.current_task()
+        if task is None:
+            return
+        with self._lock:
+            self._tasks[task] = (profile, asyncio.get_event_loop(), threading.get_ident())
+        self._ensure_running()
+
+    def untrack_task(self):
+        with self._lock:
+            self._tasks.pop(asyncio.current_task(), None)
+
+    def _ensure_running(self):
+        self._wake.set()
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                    self._thread.start()
+
+    def sample(self):
+        with self._lock:
+            threads = list(self._threads.items())
+            tasks = list(self._tasks.items())
+        if not threads and not tasks:
+            return False
+        frames = sys._current_frames()
+        for ident, profile in threads:
+            frame = frames.get(ident)
+            if frame is not None:
+                profile.add_sample(frame)
+        # Event loop threads are shared by many requests: credit the task that is running
+        for task, (profile, loop, ident) in tasks:
+            if asyncio.current_task(loop) is task and ident in frames:
+                profile.add_sample(frames[ident])
+        return True
+
+    def _run(self):
+        while True:
+            if not self.sample():
+                self._wake.clear()
+                with self._lock:
+                    idle = not self._threads and not self._tasks
+                if idle:
+                    self._wake.wait()
+                continue
+            time.sleep(self.interval)
+
+sampler = Sampler()
+
+class ProfilingExecutor(ThreadPoolExecutor):
+    """
+    Default executor for the event loop. Work submitted by a profiled
+    request (sync endpoints and dependencies go through run_in_threadpool)
+    is sampled on whichever worker thread picks it up.
+    """
+    def submit(self, fn, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return super().submit(fn, *args, **kwargs)
+
+        def run():
+            sampler.track_thread(profile)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                sampler.untrack_thread()
+        return super().submit(run)
+
+def install(loop=None):
+    """Route the loop's thread pool through ProfilingExecutor"""
+    (loop or asyncio.get_event_loop()).set_default_executor(ProfilingExecutor())
+
+_listening = False
+
+def _listen_sql():
+    """Record statements of profiled requests on every engine; installed on first use"""
+    global _listening
+    if _listening:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None and context is not None:
+            context._profile_started = time.perf_counter()
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        started = getattr(context, "_profile_started", None)
+        if profile is not None and started is not None:
+            profile.add_statement(statement, started, time.perf_counter(), cursor.rowcount)
+
+    @event.listens_for(Engine, "handle_error")
+    def handle_error(exception_context):
+        profile = _current.get()
+        context = exception_context.execution_context
+        started = getattr(context, "_profile_started", None)
+        if profile is not None and started is not None:
+            profile.add_statement(exception_context.statement or "", started, time.perf_counter(),
+                                  error=type(exception_context.original_exception).__name__)
+    _listening = True
+
+class ProfileStore:
+    """The last PROFILER_BUFFER_SIZE captured profiles"""
+    def __init__(self, size: int = PROFILER_BUFFER_SIZE):
+        self._profiles = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[Profile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+store = ProfileStore()
+
+def trigger(scope) -> Optional[str]:
+    """Why this request should be profiled, or None"""
+    for name, value in scope.get("headers", []):
+        if name == PROFILER_HEADER:
+            if value.lower() not in (b"", b"0", b"false"):
+                return "header"
+            break
+    if settings.sample_rate > 0 and random.random() < settings.sample_rate:
+        return "sampled"
+    if settings.slow_ms > 0:
+        return "slow"
+    return None
+
+class ProfilerMiddleware:
+    """
+    Samples the call stacks and records the SQL of selected requests. When
+    the profiler is disabled a request costs one attribute check. With a
+    latency threshold every request is sampled and only slow ones are kept,
+    so leave the threshold off unless investigating.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not settings.enabled or scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        reason = trigger(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        _listen_sql()
+        profile = Profile(scope["method"], scope["path"], reason)
+        token = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                if reason == "header":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", str(profile.id).encode("latin-1")))
+                    message = dict(message, headers=headers)
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after this and are sampled, but are not counted as latency
+                profile.duration_ms = round((time.perf_counter() - profile.t0) * 1000, 3)
+            await send(message)
+
+        sampler.track_task(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.untrack_task()
+            _current.reset(token)
+            if profile.duration_ms is None:
+                profile.duration_ms = round((time.perf_counter() - profile.t0) * 1000, 3)
+            if reason != "slow" or profile.duration_ms >= settings.slow_ms:
+                store.add(profile)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+import security, tenants
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Tokens per second and bucket size for each route class
+RATE_LIMIT_READ_RATE = float(os.getenv("RATE_LIMIT_READ_RATE", "20"))
+RATE_LIMIT_READ_BURST = float(os.getenv("RATE_LIMIT_READ_BURST", "40"))
+RATE_LIMIT_WRITE_RATE = float(os.getenv("RATE_LIMIT_WRITE_RATE", "5"))
+RATE_LIMIT_WRITE_BURST = float(os.getenv("RATE_LIMIT_WRITE_BURST", "10"))
+# Requests allowed in flight at once; keep at or below the DB pool size + overflow
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "15"))
+RATE_LIMIT_QUEUE_TIMEOUT = float(os.getenv("RATE_LIMIT_QUEUE_TIMEOUT", "2"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# "memory" keeps buckets per worker; "redis" shares them between workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+EXEMPT_PREFIXES = ("/static", "/docs", "/redoc", "/openapi.json")
+
+ROUTE_CLASSES = {
+    "read": (RATE_LIMIT_READ_RATE, RATE_LIMIT_READ_BURST),
+    "write": (RATE_LIMIT_WRITE_RATE, RATE_LIMIT_WRITE_BURST),
+}
+
+class MemoryBucketBackend:
+    """Token buckets held in this process, bounded by an LRU on bucket keys"""
+    blocking = False
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 when allowed, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [burst, now]
+                self._buckets[key] = bucket
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+class RedisBucketBackend:
+    """Token buckets shared by all workers, updated atomically by a Lua script"""
+    blocking = True
+    SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        import redis  # optional dependency, only needed for shared buckets
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: float, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        return float(self._script(keys=[f"ratelimit:{key}"], args=[rate, burst, now]))
+
+def get_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketBackend()
+    return MemoryBucketBackend()
+
+def route_class(method: str) -> str:
+    return "read" if method in ("GET", "HEAD", "OPTIONS") else "write"
+
+def principal(scope) -> str:
+    """Identify the caller without touching the database"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+                except JWTError:
+                    break
+                if payload.get("sub"):
+                    # Emails and user ids are only unique within a tenant
+                    return f"user:{tenants.current()}:{payload['sub']}"
+            break
+    session = scope.get("session") or {}
+    if session.get("user_id"):
+        return f"session:{tenants.current()}:{session['user_id']}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+class RateLimitMiddleware:
+    """
+    Admission control in front of the routes: a token bucket per
+    (principal, route class) and a global cap on requests in flight so a burst
+    cannot exhaust the database pool. Rejections carry Retry-After.
+    """
+    def __init__(self, app, backend=None, max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY,
+                 queue_timeout: float = RATE_LIMIT_QUEUE_TIMEOUT, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.backend = backend or get_backend()
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        klass = route_class(scope["method"])
+        rate, burst = ROUTE_CLASSES[klass]
+        key = f"{principal(scope)}:{klass}"
+        if self.backend.blocking:
+            wait = await run_in_threadpool(self.backend.take, key, rate, burst)
+        else:
+            wait = self.backend.take(key, rate, burst)
+        if wait > 0:
+            await self._reject(send, 429, "Rate limit exceeded.", wait)
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            await self._reject(send, 503, "Server is busy, try again shortly.", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._semaphore.release()
+
+    async def _reject(self, send, status_code: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
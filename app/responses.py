@@ -0,0 +1,27 @@
+import json
+from datetime import date, time, datetime
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+def _default(value: Any):
+    if isinstance(value, (date, time, datetime)):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for plain dict/list payloads that have already been shaped
+    for the client. Skips jsonable_encoder and response_model validation, and
+    uses orjson when it is installed.
+    """
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,217 @@
+from datetime import date, timedelta
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+import crud, models, schemas, security, deps, analytics, waitlist, profiler, deadlines, user_import, coalesce, booking_search
+from responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1/admin", tags=["admin"], dependencies=[Depends(security.is_admin)])
+
+ANALYTICS_DEFAULT_DAYS = 90
+
+def date_range(date_from: Optional[date], date_to: Optional[date]):
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    return date_from, date_to
+
+@router.get("/analytics/heatmap")
+def utilization_heatmap(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group: str = Query("room", regex="^(room|room_type)$"),
+    room_id: Optional[int] = None,
+    room_type: Optional[models.RoomTypeEnum] = None,
+    db: Session = Depends(deps.get_db)
+):
+    """Utilization by weekday and hour per room or room type (defaults to the last 90 days)"""
+    date_from, date_to = date_range(date_from, date_to)
+    return FastJSONResponse(analytics.heatmap(
+        db, date_from, date_to, group, room_id, room_type.value if room_type else None
+    ))
+
+@router.get("/analytics/peak-hours")
+def utilization_peak_hours(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    room_type: Optional[models.RoomTypeEnum] = None,
+    limit: int = Query(5, ge=1, le=24),
+    db: Session = Depends(deps.get_db)
+):
+    date_from, date_to = date_range(date_from, date_to)
+    return FastJSONResponse(analytics.peak_hours(db, date_from, date_to, room_type.value if room_type else None, limit))
+
+@router.get("/analytics/rates")
+def booking_rates(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group: str = Query("room", regex="^(room|room_type)$"),
+    room_type: Optional[models.RoomTypeEnum] = None,
+    db: Session = Depends(deps.get_db)
+):
+    """Bookings, cancellation rate and utilization per room or room type"""
+    date_from, date_to = date_range(date_from, date_to)
+    return FastJSONResponse(analytics.rates(db, date_from, date_to, group, room_type.value if room_type else None))
+
+@router.post("/analytics/rebuild", dependencies=[Depends(deps.with_deadline(deadlines.MAINTENANCE_DEADLINE_SECONDS))])
+def rebuild_rollups(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(deps.get_db)
+):
+    """Recompute the rollups from bookings, e.g. after a backfill; open-ended ranges rebuild everything"""
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    return FastJSONResponse(analytics.rebuild(db, date_from, date_to))
+
+@router.get("/bookings", response_model=schemas.BookingSearchPage, dependencies=[Depends(deps.with_deadline(deadlines.SEARCH_DEADLINE_SECONDS))])
+def search_bookings(
+    room_id: Optional[int] = None,
+    room_type: Optional[models.RoomTypeEnum] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: str = Query("active", regex="^(active|cancelled|all)$"),
+    user_id: Optional[int] = None,
+    team_id: Optional[int] = None,
+    user: Optional[str] = Query(None, min_length=1, max_length=100),
+    team: Optional[str] = Query(None, min_length=1, max_length=100),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    total: bool = True,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Bookings matching all the given filters, newest slot first. `user` and
+    `team` match names by prefix (or anywhere, on Postgres with pg_trgm).
+    Pass `next_cursor` back as `cursor` for the next page. `total` is exact
+    up to SEARCH_COUNT_EXACT_LIMIT and estimated above (`total_exact`
+    false); pass `total=false` to skip it.
+    """
+    return FastJSONResponse(booking_search.search(
+        db, limit=limit, cursor=cursor, with_total=total,
+        room_id=room_id, room_type=room_type.value if room_type else None, date_from=date_from, date_to=date_to,
+        status=status, user_id=user_id, team_id=team_id, user=user, team=team
+    ))
+
+@router.post("/bookings/cancel", response_model=schemas.BulkCancelResult, dependencies=[Depends(deps.with_deadline(deadlines.MAINTENANCE_DEADLINE_SECONDS))])
+def bulk_cancel_bookings(
+    request: schemas.BulkCancel,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Cancel all active bookings matching `booking_ids` and/or the filters
+    (room, team, user, date range) in one transaction, e.g. when a room goes
+    out of service. Waitlisted requests for the freed slots are promoted
+    afterwards.
+    """
+    if request.date_from and request.date_to and request.date_from > request.date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    rows = crud.bulk_cancel_bookings(
+        db, request.booking_ids, request.room_id, request.team_id, request.user_id, request.date_from, request.date_to
+    )
+    slots = sorted({(row["slot_date"], row["room_type"], row["slot_start"], row["slot_end"]) for row in rows})
+    if slots:
+        background_tasks.add_task(waitlist.promote_waiters_for_slots_task, slots)
+    return FastJSONResponse({"cancelled": len(rows), "bookings": rows})
+
+@router.post("/users/import", dependencies=[Depends(deps.with_deadline(deadlines.MAINTENANCE_DEADLINE_SECONDS))])
+def import_users(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, regex="^(csv|json|jsonl)$"),
+    stream: bool = False,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Create users from a CSV, JSON or JSON Lines file (name, email, password,
+    age, gender, is_admin). Rows that fail validation or whose email is
+    taken are reported with their row number; the rest are created. With
+    `stream=true` the response is JSON Lines: progress after each batch,
+    then the full report.
+    """
+    try:
+        fmt = format or user_import.detect_format(file.filename, file.content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def batches():
+        # Large imports take minutes: every batch's insert gets the maintenance budget of its own,
+        # however long hashing it took
+        return user_import.import_batches(
+            db, user_import.read_rows(file.file, fmt),
+            before_insert=lambda: deadlines.set_deadline(db, deadlines.MAINTENANCE_DEADLINE_SECONDS)
+        )
+
+    if stream:
+        def lines():
+            report = None
+            try:
+                for report in batches():
+                    yield json.dumps(report.as_dict(errors=False)) + "\n"
+            except ValueError as e:
+                # The status line has been sent already; report the error in the stream
+                yield json.dumps({"error": str(e)}) + "\n"
+                return
+            yield json.dumps(report.as_dict()) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    report = None
+    try:
+        for report in batches():
+            pass
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(report.as_dict())
+
+@router.get("/profiler")
+def profiler_status():
+    """Profiler settings of this worker and the profiles it has captured, newest first"""
+    return FastJSONResponse({
+        "settings": profiler.settings.as_dict(),
+        "profiles": [profile.summary() for profile in profiler.store.list()],
+    })
+
+@router.put("/profiler")
+def update_profiler(request: schemas.ProfilerSettings):
+    """
+    Switch profiling on or off for this worker. With `enabled`, requests
+    sending the X-Profile header are profiled, plus a `sample_rate`
+    fraction of all requests and, when `slow_ms` is set, every request that
+    takes longer than that.
+    """
+    for name, value in request.dict(exclude_unset=True).items():
+        if value is not None:
+            setattr(profiler.settings, name, value)
+    return FastJSONResponse(profiler.settings.as_dict())
+
+@router.get("/profiler/profiles/{profile_id}")
+def download_profile(profile_id: int, format: str = Query("json", regex="^(json|collapsed)$")):
+    """A captured profile: call tree, hottest functions and SQL timeline, or folded stacks for flame graphs"""
+    profile = profiler.store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed(), headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'
+        })
+    return FastJSONResponse(profile.as_dict(), headers={
+        "Content-Disposition": f'attachment; filename="profile-{profile_id}.json"'
+    })
+
+@router.delete("/profiler/profiles")
+def clear_profiles():
+    cleared = len(profiler.store.list())
+    profiler.store.clear()
+    return FastJSONResponse({"cleared": cleared})
+
+@router.get("/coalescing")
+def coalescing_stats():
+    """How many availability and status calls of this worker ran, and how many shared another call's result"""
+    return FastJSONResponse(coalesce.flights.stats())
+
+@router.delete("/coalescing/stats")
+def reset_coalescing_stats():
+    coalesce.flights.reset_stats()
+    return FastJSONResponse(coalesce.flights.stats())
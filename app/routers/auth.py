@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from deps import get_db
-import crud, schemas, security, models
+import crud, schemas, security, models, tenants
 from datetime import timedelta
 from typing import Any
 
@@ -29,7 +29,7 @@ def login_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordR
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
         "access_token": security.create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
+            data={"sub": user.email, "tenant": tenants.current()}, expires_delta=access_token_expires
         ),
         "token_type": "bearer",
     }
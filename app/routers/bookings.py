@@ -1,33 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date, time
-import crud, schemas, models, security, deps
+import allocation, crud, schemas, models, security, deps, idempotency, waitlist, holds, deadlines, tenants
+from responses import FastJSONResponse
 
 router = APIRouter(prefix="/api/v1/bookings", tags=["bookings"])
 
-@router.post("/", response_model=schemas.Booking)
-def book_room(
-    booking: schemas.BookingCreate,
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(security.get_current_user)
-):
+def validate_booking_request(booking: schemas.BookingCreate, current_user: models.User, db: Session):
     # Set the user_id from the authenticated user if not provided
     if not booking.user_id:
         booking.user_id = current_user.id
     # Only admins can book on behalf of others
     if booking.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to book for other users.")
+    # Ids from another tenant are not visible here
+    if booking.user_id != current_user.id and not crud.get_user(db, booking.user_id):
+        raise HTTPException(status_code=404, detail="User not found.")
+    if booking.team_id and not crud.get_team(db, booking.team_id):
+        raise HTTPException(status_code=404, detail="Team not found.")
     # Validate slot
-    if booking.slot_start < time(9, 0) or booking.slot_end > time(18, 0):
-        raise HTTPException(status_code=400, detail="Booking slot must be between 09:00 and 18:00.")
-    if booking.slot_start >= booking.slot_end:
-        raise HTTPException(status_code=400, detail="End time must be after start time.")
+    detail = allocation.slot_violation(booking.slot_start, booking.slot_end)
+    if detail:
+        raise HTTPException(status_code=400, detail=detail)
+
+@router.post("/", response_model=schemas.Booking)
+def book_room(
+    booking: schemas.BookingCreate,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    validate_booking_request(booking, current_user, db)
     # Business logic for room allocation is in crud.create_booking
-    db_booking = crud.create_booking(db, booking)
-    return db_booking
+    if not idempotency_key:
+        return FastJSONResponse(crud.booking_row(crud.create_booking(db, booking)))
+    # Retries with the same key replay the first result without re-allocating
+    status_code, body, replayed = idempotency.store.run(
+        f"{tenants.current()}:{current_user.id}:{idempotency_key}",
+        idempotency.request_hash(booking.json()),
+        lambda: crud.booking_row(crud.create_booking(db, booking))
+    )
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return FastJSONResponse(body, status_code=status_code, headers=headers)
 
-@router.get("/", response_model=List[schemas.Booking])
+@router.get("/", response_model=List[schemas.Booking], dependencies=[Depends(deps.with_deadline(deadlines.SEARCH_DEADLINE_SECONDS))])
 def get_bookings(
     skip: int = 0,
     limit: int = 100,
@@ -35,13 +52,114 @@ def get_bookings(
     current_user: models.User = Depends(security.get_current_user)
 ):
     if current_user.is_admin:
-        return crud.get_bookings(db, skip=skip, limit=limit)
+        rows = crud.get_booking_rows(db, skip=skip, limit=limit)
     else:
-        return crud.get_bookings(db, skip=skip, limit=limit, user_id=current_user.id)
+        rows = crud.get_booking_rows(db, skip=skip, limit=limit, user_id=current_user.id)
+    return FastJSONResponse(rows)
+
+@router.get("/changes", response_model=schemas.BookingChangeFeed)
+def get_booking_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Bookings created or cancelled after the `since` cursor. Pass the returned
+    `cursor` as `since` on the next call; keep paging while `has_more` is true.
+    Non-admins get their own bookings and their teams'.
+    """
+    user_id = None if current_user.is_admin else current_user.id
+    rows, cursor, has_more = crud.get_booking_changes(db, since=since, limit=limit, user_id=user_id)
+    return FastJSONResponse({"changes": rows, "cursor": cursor, "has_more": has_more})
+
+@router.post("/waitlist/", response_model=schemas.WaitlistEntry)
+def join_waitlist(
+    request: schemas.WaitlistCreate,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Books immediately if a room is free, otherwise queues the request. Queued
+    requests are promoted automatically when an overlapping booking is cancelled.
+    """
+    validate_booking_request(request, current_user, db)
+    if request.priority and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can set waitlist priority.")
+    return FastJSONResponse(waitlist.waitlist_row(waitlist.join_waitlist(db, request)))
+
+@router.get("/waitlist/", response_model=List[schemas.WaitlistEntry])
+def get_waitlist(
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    entries = waitlist.get_user_waitlist(db, current_user.id)
+    return FastJSONResponse([waitlist.waitlist_row(entry) for entry in entries])
+
+@router.delete("/waitlist/{entry_id}", response_model=schemas.WaitlistEntry)
+def leave_waitlist(
+    entry_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    entry = waitlist.get_waitlist_entry(db, entry_id)
+    if not entry or (not current_user.is_admin and entry.user_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Waitlist entry not found.")
+    return FastJSONResponse(waitlist.waitlist_row(waitlist.leave_waitlist(db, entry)))
+
+@router.post("/holds/", response_model=schemas.Hold)
+def hold_room(
+    request: schemas.HoldCreate,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Reserve a room for the slot for `ttl_seconds` (default 5 minutes) while
+    the user confirms. Held capacity is not offered to anyone else.
+    """
+    validate_booking_request(request, current_user, db)
+    return FastJSONResponse(holds.hold_row(holds.create_hold(db, request, current_user.id)))
+
+@router.get("/holds/", response_model=List[schemas.Hold])
+def get_holds(
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    return FastJSONResponse([holds.hold_row(hold) for hold in holds.get_user_holds(db, current_user.id)])
+
+def get_own_hold(db: Session, hold_id: int, current_user: models.User) -> models.BookingHold:
+    hold = holds.get_hold(db, hold_id)
+    if not hold or (not current_user.is_admin and hold.created_by != current_user.id):
+        raise HTTPException(status_code=404, detail="Hold not found.")
+    return hold
+
+@router.post("/holds/{hold_id}/confirm", response_model=schemas.Booking)
+def confirm_hold(
+    hold_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    hold = get_own_hold(db, hold_id, current_user)
+    return FastJSONResponse(crud.booking_row(holds.confirm_hold(db, hold)))
+
+@router.delete("/holds/{hold_id}", response_model=schemas.Hold)
+def release_hold(
+    hold_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    hold = holds.release_hold(db, get_own_hold(db, hold_id, current_user))
+    background_tasks.add_task(
+        waitlist.promote_waiters_task,
+        hold.slot_date, hold.room_type.value, hold.slot_start, hold.slot_end
+    )
+    return FastJSONResponse(holds.hold_row(hold))
 
 @router.delete("/{booking_id}", response_model=schemas.Booking)
 def cancel_booking(
     booking_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
@@ -51,4 +169,9 @@ def cancel_booking(
     # Only admin or owner can cancel
     if not current_user.is_admin and booking.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to cancel this booking.")
-    return crud.cancel_booking(db, booking_id)
+    booking = crud.cancel_booking(db, booking_id)
+    background_tasks.add_task(
+        waitlist.promote_waiters_task,
+        booking.slot_date, booking.room.room_type.value, booking.slot_start, booking.slot_end
+    )
+    return FastJSONResponse(crud.booking_row(booking))
@@ -0,0 +1,103 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+import crud, models, security, deps, ical
+from responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1/calendar", tags=["calendar"])
+
+ICAL_MEDIA_TYPE = "text/calendar; charset=utf-8"
+
+def _feed_url(request: Request, kind: str, scope_id: int, version: int) -> str:
+    token = security.create_feed_token(kind, scope_id, version)
+    return f"{request.base_url}api/v1/calendar/{kind}/{scope_id}.ics?token={token}"
+
+def _team_ids(db: Session, user_id: int) -> list:
+    return [row.team_id for row in db.query(models.team_members.c.team_id).filter(
+        models.team_members.c.user_id == user_id
+    )]
+
+@router.get("/feeds")
+def get_feed_urls(
+    request: Request,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """Subscription URLs for the current user's feed, their teams and every room"""
+    team_ids = _team_ids(db, current_user.id)
+    room_ids = [room["id"] for room in crud.get_all_room_rows(db)]
+    users = ical.token_versions.get_many(db, "users", [current_user.id])
+    teams = ical.token_versions.get_many(db, "teams", team_ids)
+    rooms = ical.token_versions.get_many(db, "rooms", room_ids)
+    return FastJSONResponse({
+        "user": _feed_url(request, "users", current_user.id, users[current_user.id]),
+        "teams": {team_id: _feed_url(request, "teams", team_id, teams[team_id]) for team_id in team_ids},
+        "rooms": {room_id: _feed_url(request, "rooms", room_id, rooms[room_id]) for room_id in room_ids},
+    })
+
+@router.post("/{kind}/{scope_id}/rotate")
+def rotate_feed_token(
+    kind: str,
+    scope_id: int,
+    request: Request,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Revoke every URL issued for a feed, e.g. after one leaked, and return
+    the new one. Users rotate their own feed and their teams'; admins any.
+    """
+    if kind not in ical.FEED_KINDS:
+        raise HTTPException(status_code=404, detail="Feed not found.")
+    if not current_user.is_admin:
+        allowed = (kind == "users" and scope_id == current_user.id) or (
+            kind == "teams" and scope_id in _team_ids(db, current_user.id)
+        )
+        if not allowed:
+            raise HTTPException(status_code=403, detail="Not authorized to rotate this feed.")
+    version = ical.rotate_token(db, kind, scope_id)
+    return FastJSONResponse({"url": _feed_url(request, kind, scope_id, version)})
+
+@router.get("/{kind}/{scope_id}.ics")
+def get_feed(
+    kind: str,
+    scope_id: int,
+    token: str = Query(...),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    iCalendar feed of active bookings for a user, team or room. The token
+    must be the one for the feed's current version (see rotate). Unchanged
+    feeds answer 304 from the ETag alone; small feeds are served from memory
+    and large ones are streamed.
+    """
+    if kind not in ical.FEED_KINDS:
+        raise HTTPException(status_code=404, detail="Feed not found.")
+    if not security.verify_feed_token(kind, scope_id, token, ical.token_versions.get(db, kind, scope_id)):
+        raise HTTPException(status_code=404, detail="Feed not found.")
+    scope = ical.scope(kind, scope_id)
+    etag = ical.cache.etag(scope)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    body = ical.cache.get(scope, etag)
+    if body is not None:
+        return Response(body, media_type=ICAL_MEDIA_TYPE, headers=headers)
+    if kind == "users":
+        owner = crud.get_user(db, scope_id)
+        name = owner and f"{owner.name} bookings"
+    elif kind == "teams":
+        owner = crud.get_team(db, scope_id)
+        name = owner and f"{owner.name} team bookings"
+    else:
+        owner = crud.get_room(db, scope_id)
+        name = owner and f"{owner.name} bookings"
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Feed not found.")
+    return StreamingResponse(
+        ical.render_cached(kind, scope_id, name, etag),
+        media_type=ICAL_MEDIA_TYPE,
+        headers=headers
+    )
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, Query, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import date, time, datetime
-import crud, schemas, models, security, deps
+from typing import List, Optional
+from datetime import date, time, datetime, timedelta
+import crud, schemas, models, security, deps, deadlines, coalesce, tenants
+from responses import FastJSONResponse
 
 router = APIRouter(prefix="/api/v1/rooms", tags=["rooms"])
 
@@ -15,7 +16,16 @@ def get_admin_user(current_user: models.User = Depends(security.get_current_user
         )
     return current_user
 
-@router.get("/available/", response_model=List[schemas.Room])
+def room_row(room: models.Room) -> dict:
+    """Shape an ORM room like schemas.Room without a pydantic round trip"""
+    return {
+        'id': room.id,
+        'room_type': room.room_type.value if hasattr(room.room_type, 'value') else room.room_type,
+        'capacity': room.capacity,
+        'name': room.name
+    }
+
+@router.get("/available/", response_model=List[schemas.Room], dependencies=[Depends(deps.with_deadline(deadlines.SEARCH_DEADLINE_SECONDS))])
 def available_rooms(
     slot_date: date = Query(...),
     slot_start: time = Query(...),
@@ -24,26 +34,51 @@ def available_rooms(
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    rooms = crud.get_available_rooms(db, slot_date, slot_start, slot_end, room_type)
-    return [schemas.Room(
-        id=room.id,
-        room_type=room.room_type.value if hasattr(room.room_type, 'value') else room.room_type,
-        capacity=room.capacity,
-        name=room.name
-    ) for room in rooms]
+    # Identical concurrent searches (e.g. at the top of the hour) share one evaluation
+    rows = coalesce.flights.run(
+        "available",
+        (tenants.current(), slot_date, slot_start, slot_end, room_type),
+        coalesce.day_scope(slot_date),
+        lambda: [room_row(room) for room in crud.get_available_rooms(db, slot_date, slot_start, slot_end, room_type)]
+    )
+    return FastJSONResponse(rows)
+
+@router.get("/search/", response_model=List[schemas.SlotCandidate], dependencies=[Depends(deps.with_deadline(deadlines.SEARCH_DEADLINE_SECONDS))])
+def search_slots(
+    room_type: str = Query(...),
+    duration_minutes: int = Query(..., gt=0, le=9 * 60),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    earliest_start: Optional[time] = Query(None),
+    limit: int = Query(5, ge=1, le=50),
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Earliest free (room, start, end) slots of at least `duration_minutes`
+    between `date_from` (default today) and `date_to` (default the day after).
+    When searching from today the earliest start defaults to the current time.
+    """
+    today = date.today()
+    date_from = date_from or today
+    date_to = date_to or date_from + timedelta(days=1)
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to must not be before date_from.")
+    if (date_to - date_from).days > 31:
+        raise HTTPException(status_code=400, detail="Search window cannot exceed 31 days.")
+    if earliest_start is None and date_from == today:
+        earliest_start = datetime.now().time().replace(second=0, microsecond=0)
+    slots = crud.find_earliest_slots(
+        db, room_type, timedelta(minutes=duration_minutes), date_from, date_to, earliest_start, limit
+    )
+    return FastJSONResponse(slots)
 
 @router.get("/", response_model=List[schemas.Room])
 def get_all_rooms(
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    rooms = crud.get_all_rooms(db)
-    return [schemas.Room(
-        id=room.id,
-        room_type=room.room_type.value if hasattr(room.room_type, 'value') else room.room_type,
-        capacity=room.capacity,
-        name=room.name
-    ) for room in rooms]
+    return FastJSONResponse(crud.get_all_room_rows(db))
 
 @router.post("/", response_model=schemas.Room)
 def create_room(
@@ -70,7 +105,7 @@ def delete_room(
 ):
     return crud.delete_room(db, room_id)
 
-@router.get("/status/", response_model=List[dict])
+@router.get("/status/", response_model=List[dict], dependencies=[Depends(deps.with_deadline(deadlines.SEARCH_DEADLINE_SECONDS))])
 def get_rooms_status(
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(security.get_current_user)
@@ -80,10 +115,16 @@ def get_rooms_status(
     considering all bookings. Used for the dashboard's 'Show Available Workspace Rooms' feature.
     """
     today = date.today()
+    rows = coalesce.flights.run(
+        "status", (tenants.current(), today), coalesce.day_scope(today), lambda: rooms_status(db, today)
+    )
+    return FastJSONResponse(rows)
+
+def rooms_status(db: Session, day: date) -> List[dict]:
     slot_start = time(9, 0)
     slot_end = time(18, 0)
     rooms = crud.get_all_rooms(db)
-    bookings = crud.get_bookings_for_date(db, today)
+    bookings = crud.get_bookings_for_date(db, day)
     booked_room_ids = set()
     for booking in bookings:
         if booking.is_active and not (booking.slot_end <= slot_start or booking.slot_start >= slot_end):
@@ -74,3 +74,67 @@ class Booking(BookingBase):
     is_active: bool
     class Config:
         from_attributes = True
+
+class WaitlistCreate(BookingCreate):
+    priority: int = 0
+
+class WaitlistEntry(BookingBase):
+    id: int
+    user_id: int
+    team_id: Optional[int] = None
+    room_type: str
+    priority: int
+    status: str
+    booking_id: Optional[int] = None
+
+class HoldCreate(BookingCreate):
+    ttl_seconds: Optional[int] = None
+
+class Hold(BookingBase):
+    id: int
+    room_id: int
+    room_type: str
+    user_id: Optional[int] = None
+    team_id: Optional[int] = None
+    expires_at: datetime
+
+class BulkCancel(BaseModel):
+    booking_ids: Optional[List[int]] = None
+    room_id: Optional[int] = None
+    team_id: Optional[int] = None
+    user_id: Optional[int] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+class BulkCancelResult(BaseModel):
+    cancelled: int
+    bookings: List[Booking]
+
+class BookingSearchRow(Booking):
+    room_type: str
+    room_name: str
+    user_name: Optional[str] = None
+    team_name: Optional[str] = None
+
+class BookingSearchPage(BaseModel):
+    bookings: List[BookingSearchRow]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_exact: Optional[bool] = None
+
+class ProfilerSettings(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)
+    slow_ms: Optional[float] = Field(None, ge=0)
+
+class SlotCandidate(BookingBase):
+    room_id: int
+    room_name: str
+
+class BookingChange(Booking):
+    change_seq: int
+
+class BookingChangeFeed(BaseModel):
+    changes: List[BookingChange]
+    cursor: int
+    has_more: bool
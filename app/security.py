@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -5,7 +7,7 @@ from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
-import crud, models, deps
+import crud, models, deps, tenants
 
 SECRET_KEY = "your-secret-key-keep-it-secret"
 ALGORITHM = "HS256"
@@ -35,6 +37,23 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_feed_token(kind: str, scope_id: int, version: int = 0) -> str:
+    """
+    Long-lived token for calendar feed URLs, since calendar apps cannot send
+    bearer tokens. It is valid until the feed's version is rotated (see
+    ical.rotate_token).
+    """
+    tenant = tenants.current()
+    # Feed URLs of the default tenant predate tenancy and keep working
+    message = f"{kind}:{scope_id}" if tenant == tenants.DEFAULT_TENANT else f"{tenant}:{kind}:{scope_id}"
+    # Version 0 is the token issued before any rotation
+    if version:
+        message += f":{version}"
+    return hmac.new(SECRET_KEY.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def verify_feed_token(kind: str, scope_id: int, token: str, version: int = 0) -> bool:
+    return hmac.compare_digest(create_feed_token(kind, scope_id, version), token or "")
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(deps.get_db)
@@ -47,7 +66,7 @@ def get_current_user(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        if email is None or payload.get("tenant", tenants.DEFAULT_TENANT) != tenants.current():
             raise credentials_exception
     except JWTError:
         raise credentials_exception
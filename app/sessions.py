@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import models, events, tenants
+
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+DASHBOARD_PAGE_SIZE = 10
+
+class Principal:
+    """Read-only snapshot of the fields the HTML pages need from a user"""
+    __slots__ = ("id", "name", "email", "age", "gender", "is_admin", "is_active")
+
+    def __init__(self, user: models.User):
+        self.id = user.id
+        self.name = user.name
+        self.email = user.email
+        self.age = user.age
+        self.gender = user.gender.value if hasattr(user.gender, 'value') else user.gender
+        self.is_admin = user.is_admin
+        self.is_active = user.is_active
+
+class SessionStore:
+    """Interface for server-side session data keyed by (tenant, user id)"""
+    def get(self, key: tuple) -> Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, key: tuple, value: dict):
+        raise NotImplementedError
+
+    def delete(self, key: tuple):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU with a TTL; entries are dicts filled lazily"""
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+store: SessionStore = InMemorySessionStore()
+
+def _key(user_id: int) -> tuple:
+    # User ids repeat across tenants that have their own database
+    return (tenants.current(), user_id)
+
+def _entry(user_id: int) -> dict:
+    entry = store.get(_key(user_id))
+    if entry is None:
+        entry = {}
+        store.set(_key(user_id), entry)
+    return entry
+
+def get_principal(db: Session, user_id: int) -> Optional[Principal]:
+    entry = _entry(user_id)
+    principal = entry.get("principal")
+    if principal is None:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is None:
+            return None
+        principal = entry["principal"] = Principal(user)
+    return principal
+
+def get_first_page(db: Session, user_id: int) -> List[dict]:
+    """First page of the user's active bookings, as shown on the dashboard"""
+    entry = _entry(user_id)
+    bookings = entry.get("bookings")
+    if bookings is None:
+        rows = db.execute(
+            select(
+                models.Booking.id, models.Booking.room_id, models.Booking.user_id, models.Booking.team_id,
+                models.Booking.slot_date, models.Booking.slot_start, models.Booking.slot_end, models.Booking.is_active
+            ).where(
+                models.Booking.user_id == user_id,
+                models.Booking.is_active == True
+            ).limit(DASHBOARD_PAGE_SIZE)
+        )
+        bookings = entry["bookings"] = [dict(row._mapping) for row in rows]
+    return bookings
+
+def invalidate_bookings(user_id: Optional[int]):
+    """Drop the cached bookings page but keep the principal"""
+    if not user_id:
+        return
+    entry = store.get(_key(user_id))
+    if entry is not None:
+        # Swap in a new dict so a render still loading the old page cannot repopulate it
+        store.set(_key(user_id), {"principal": entry["principal"]} if "principal" in entry else {})
+
+def invalidate_user(user_id: Optional[int]):
+    """Drop everything cached for a user, e.g. after a password change"""
+    if user_id:
+        store.delete(_key(user_id))
+
+def _on_booking_changed(event: events.BookingChanged):
+    invalidate_bookings(event.user_id)
+
+def _on_bookings_changed(event: events.BookingsChanged):
+    if event.user_ids is None:
+        store.clear()
+        return
+    for user_id in event.user_ids:
+        invalidate_bookings(user_id)
+
+def _on_user_revoked(event: events.UserRevoked):
+    invalidate_user(event.user_id)
+
+events.subscribe(events.BookingChanged, _on_booking_changed)
+events.subscribe(events.BookingsChanged, _on_bookings_changed)
+events.subscribe(events.UserRevoked, _on_user_revoked)
@@ -0,0 +1,265 @@
+"""
+Offline replay of booking requests against a room inventory, through the
+same allocation.allocate as crud.create_booking but with no database. Used for capacity planning:
+replay a recorded log, change the rooms or the strategy, compare the reports.
+
+The log is JSONL, one request per line:
+    {"room_type": "shared", "user_id": 4, "slot_date": "2030-01-01",
+     "slot_start": "09:00:00", "slot_end": "10:00:00", "id": "b1"}
+    {"op": "cancel", "id": "b1"}
+Lines without "op" are bookings. "id" is only needed for bookings that are
+cancelled later. Conference requests may carry "team_size"; otherwise the
+size comes from the team inventory.
+
+Usage:
+    python simulator.py requests.jsonl [--rooms rooms.json | --from-db]
+        [--teams teams.json] [--strategy best_fit] [--add-rooms shared:4:2] [--json]
+"""
+import argparse
+import json
+import sys
+import time as timer
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import allocation
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    _loads = json.loads
+
+# Rooms created by init_db.init_rooms: (room_type, capacity, count)
+DEFAULT_INVENTORY = (("private", 1, 8), ("conference", 10, 4), ("shared", 4, 3))
+
+_minute_cache: Dict[str, int] = {}
+
+def _minutes(value: str) -> int:
+    """'HH:MM[:SS]' to minutes after midnight, memoized since logs reuse few values"""
+    minutes = _minute_cache.get(value)
+    if minutes is None:
+        minutes = _minute_cache[value] = int(value[0:2]) * 60 + int(value[3:5])
+    return minutes
+
+class Simulator:
+    """
+    In-memory booking state: bookings indexed by (room, day), (user, day)
+    and (team, day), each a short list of [start, end] minute intervals.
+    Days are kept as the ISO strings from the log and never parsed.
+    """
+    def __init__(self, rooms: Iterable[Tuple[int, str, int]], team_sizes: Optional[Dict[int, int]] = None,
+                 strategy: Optional[str] = None):
+        self.strategy = allocation.get_strategy(strategy)
+        self.team_sizes = dict(team_sizes or {})
+        self.rooms_by_type: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.room_types: Dict[int, str] = {}
+        for room_id, room_type, capacity in rooms:
+            self.rooms_by_type[room_type].append((room_id, capacity))
+            self.room_types[room_id] = room_type
+        for rooms_of_type in self.rooms_by_type.values():
+            rooms_of_type.sort()
+        self._day_start = allocation.OPENING_TIME.hour * 60 + allocation.OPENING_TIME.minute
+        self._day_end = allocation.CLOSING_TIME.hour * 60 + allocation.CLOSING_TIME.minute
+        self._by_room = defaultdict(list)
+        self._by_user = defaultdict(list)
+        self._by_team = defaultdict(list)
+        self._bookings = {}
+        self.accepted = 0
+        self.cancelled = 0
+        self.rejected: Counter = Counter()
+        self.days = set()
+        self.booked_minutes: Counter = Counter()
+
+    @staticmethod
+    def _conflict(intervals: Optional[list], start: int, end: int) -> bool:
+        if intervals:
+            for interval in intervals:
+                if interval[0] < end and interval[1] > start:
+                    return True
+        return False
+
+    def book(self, room_type: str, user_id: Optional[int], team_id: Optional[int], day: str,
+             slot_start: str, slot_end: str, key=None, team_size: Optional[int] = None):
+        """Returns (room_id, None) when booked, else (None, error detail)"""
+        start, end = _minutes(slot_start), _minutes(slot_end)
+        self.days.add(day)
+        detail = allocation.slot_violation(start, end, self._day_start, self._day_end)
+        if detail:
+            return self._reject(detail)
+        try:
+            room_id, user_id, team_id = allocation.allocate(
+                self.strategy, room_type, user_id, team_id,
+                user_busy=lambda: self._conflict(self._by_user.get((user_id, day)), start, end),
+                team_busy=lambda: self._conflict(self._by_team.get((team_id, day)), start, end),
+                candidates=lambda: self._candidates(room_type, day, start, end),
+                headcount=lambda: team_size if team_size is not None else self.team_sizes.get(team_id, 0),
+            )
+        except allocation.Rejected as exc:
+            return self._reject(exc.detail)
+        interval = [start, end]
+        self._by_room[(room_id, day)].append(interval)
+        if user_id:
+            self._by_user[(user_id, day)].append(interval)
+        if team_id:
+            self._by_team[(team_id, day)].append(interval)
+        if key is not None:
+            self._bookings[key] = (room_id, user_id, team_id, day, interval)
+        self.accepted += 1
+        self.booked_minutes[room_type] += end - start
+        return room_id, None
+
+    def _candidates(self, room_type: str, day: str, start: int, end: int) -> List[allocation.Candidate]:
+        candidates = []
+        for room_id, capacity in self.rooms_by_type.get(room_type, ()):
+            intervals = self._by_room.get((room_id, day))
+            occupancy = 0
+            if intervals:
+                for interval in intervals:
+                    if interval[0] < end and interval[1] > start:
+                        occupancy += 1
+            candidates.append(allocation.Candidate(room_id, capacity, occupancy, len(intervals) if intervals else 0))
+        return candidates
+
+    def cancel(self, key) -> bool:
+        booking = self._bookings.pop(key, None)
+        if booking is None:
+            self.rejected["Booking not found."] += 1
+            return False
+        room_id, user_id, team_id, day, interval = booking
+        self._by_room[(room_id, day)].remove(interval)
+        if user_id:
+            self._by_user[(user_id, day)].remove(interval)
+        if team_id:
+            self._by_team[(team_id, day)].remove(interval)
+        self.cancelled += 1
+        self.booked_minutes[self.room_types[room_id]] -= interval[1] - interval[0]
+        return True
+
+    def _reject(self, detail: str):
+        self.rejected[detail] += 1
+        return None, detail
+
+    def apply(self, request: dict):
+        """Replay one decoded log line"""
+        if request.get("op") == "cancel":
+            return self.cancel(request.get("id"))
+        return self.book(
+            request.get("room_type"), request.get("user_id"), request.get("team_id"),
+            request["slot_date"], request["slot_start"], request["slot_end"],
+            request.get("id"), request.get("team_size")
+        )
+
+    def utilization(self) -> Dict[str, float]:
+        """Booked seat-minutes over open seat-minutes per room type, for the days seen"""
+        open_minutes = (self._day_end - self._day_start) * max(1, len(self.days))
+        result = {}
+        for room_type, rooms in self.rooms_by_type.items():
+            seat_minutes = sum(allocation.seats(room_type, capacity) for _, capacity in rooms) * open_minutes
+            result[room_type] = self.booked_minutes[room_type] / seat_minutes if seat_minutes else 0.0
+        return result
+
+    def report(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "accepted": self.accepted,
+            "rejected": sum(self.rejected.values()),
+            "cancelled": self.cancelled,
+            "rejections": dict(self.rejected.most_common()),
+            "days": len(self.days),
+            "utilization": {k: round(v, 4) for k, v in sorted(self.utilization().items())},
+        }
+
+def replay(simulator: Simulator, lines: Iterable) -> dict:
+    """Feed raw JSONL lines through the simulator and add throughput to its report"""
+    count = 0
+    t0 = timer.perf_counter()
+    for line in lines:
+        if not line.strip():
+            continue
+        simulator.apply(_loads(line))
+        count += 1
+    elapsed = timer.perf_counter() - t0
+    report = simulator.report()
+    report["requests"] = count
+    report["seconds"] = round(elapsed, 3)
+    report["requests_per_minute"] = int(count / elapsed * 60) if elapsed else 0
+    return report
+
+def default_rooms() -> List[Tuple[int, str, int]]:
+    rooms = []
+    for room_type, capacity, count in DEFAULT_INVENTORY:
+        rooms += [(len(rooms) + 1, room_type, capacity) for _ in range(count)]
+    return rooms
+
+def load_from_db() -> Tuple[List[Tuple[int, str, int]], Dict[int, int]]:
+    """Room inventory and team headcounts from DATABASE_URL"""
+    from sqlalchemy import func, select
+    import models
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        rooms = [
+            (room_id, room_type.value, capacity)
+            for room_id, room_type, capacity in db.execute(select(models.Room.id, models.Room.room_type, models.Room.capacity))
+        ]
+        team_sizes = dict(db.execute(
+            select(models.team_members.c.team_id, func.count()).group_by(models.team_members.c.team_id)
+        ).all())
+    finally:
+        db.close()
+    return rooms, team_sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="JSONL request log, '-' for stdin")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--rooms", help='JSON list of {"id", "room_type", "capacity"}')
+    source.add_argument("--from-db", action="store_true", help="read rooms and team sizes from DATABASE_URL")
+    parser.add_argument("--teams", help='JSON object of team id to headcount')
+    parser.add_argument("--strategy", choices=allocation.STRATEGIES, default=None)
+    parser.add_argument("--add-rooms", action="append", default=[], metavar="TYPE:CAPACITY:COUNT",
+                        help="what-if: add rooms to the inventory, e.g. shared:4:2")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    team_sizes = {}
+    if args.from_db:
+        rooms, team_sizes = load_from_db()
+    elif args.rooms:
+        with open(args.rooms) as f:
+            rooms = [(room["id"], room["room_type"], room["capacity"]) for room in json.load(f)]
+    else:
+        rooms = default_rooms()
+    if args.teams:
+        with open(args.teams) as f:
+            team_sizes.update({int(team_id): size for team_id, size in json.load(f).items()})
+    next_id = max((room[0] for room in rooms), default=0) + 1
+    for spec in args.add_rooms:
+        room_type, capacity, count = spec.split(":")
+        for _ in range(int(count)):
+            rooms.append((next_id, room_type, int(capacity)))
+            next_id += 1
+
+    simulator = Simulator(rooms, team_sizes, args.strategy)
+    if args.log == "-":
+        report = replay(simulator, sys.stdin.buffer)
+    else:
+        with open(args.log, "rb") as f:
+            report = replay(simulator, f)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"strategy      {report['strategy']}")
+    print(f"requests      {report['requests']} in {report['seconds']}s ({report['requests_per_minute']}/min)")
+    print(f"accepted      {report['accepted']}")
+    print(f"cancelled     {report['cancelled']}")
+    print(f"rejected      {report['rejected']}")
+    for detail, count in report["rejections"].items():
+        print(f"  {count:>10}  {detail}")
+    print(f"utilization   over {report['days']} day(s)")
+    for room_type, value in report["utilization"].items():
+        print(f"  {room_type:<12}{value * 100:>6.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, with_loader_criteria
+import database
+
+# Where a tenant's rows live: "shared" (one database, rows tagged with tenant_id),
+# "schema" (one Postgres schema per tenant) or "database" (one database per tenant)
+TENANT_ROUTING = os.getenv("TENANT_ROUTING", "shared")
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+# Comma separated allow-list; empty accepts any well-formed tenant id
+TENANTS = {tenant.strip() for tenant in os.getenv("TENANTS", "").split(",") if tenant.strip()}
+# Requests to <tenant>.<TENANT_BASE_DOMAIN> belong to that tenant
+TENANT_BASE_DOMAIN = os.getenv("TENANT_BASE_DOMAIN", "").lower()
+# TENANT_ROUTING=database: URL with a {tenant} placeholder, e.g. postgresql://db/frejun_{tenant}
+TENANT_DATABASE_URL = os.getenv("TENANT_DATABASE_URL", "")
+TENANT_SCHEMA_PREFIX = os.getenv("TENANT_SCHEMA_PREFIX", "tenant_")
+# Engines open at once and the pool of each, so connections stay under
+# TENANT_MAX_ENGINES * (TENANT_POOL_SIZE + TENANT_MAX_OVERFLOW) however many tenants there are
+TENANT_MAX_ENGINES = int(os.getenv("TENANT_MAX_ENGINES", "32"))
+TENANT_POOL_SIZE = int(os.getenv("TENANT_POOL_SIZE", "2"))
+TENANT_MAX_OVERFLOW = int(os.getenv("TENANT_MAX_OVERFLOW", "3"))
+
+TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("tenant", default=DEFAULT_TENANT)
+
+class UnknownTenant(ValueError):
+    pass
+
+def current() -> str:
+    """Tenant of the request (or task) being served"""
+    return _current.get()
+
+@contextmanager
+def use(tenant: str):
+    """Run a block as `tenant`, e.g. background work outside a request"""
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+def check(tenant: str) -> str:
+    if not TENANT_ID.match(tenant) or (TENANTS and tenant not in TENANTS and tenant != DEFAULT_TENANT):
+        raise UnknownTenant(tenant)
+    return tenant
+
+class EngineCache:
+    """
+    LRU of per-tenant engines. The least recently used engine is disposed
+    when the cache is full, closing its pooled connections; a tenant that
+    comes back gets a fresh engine.
+    """
+    def __init__(self, max_engines: int = TENANT_MAX_ENGINES):
+        self.max_engines = max_engines
+        self._engines: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant: str):
+        with self._lock:
+            item = self._engines.get(tenant)
+            if item is not None:
+                self._engines.move_to_end(tenant)
+                return item[0]
+            engine, owned = _create_engine(tenant)
+            self._engines[tenant] = (engine, owned)
+            evicted = []
+            while len(self._engines) > self.max_engines:
+                evicted.append(self._engines.popitem(last=False)[1])
+        for engine_, owned_ in evicted:
+            if owned_:
+                engine_.dispose()
+        return engine
+
+    def clear(self):
+        with self._lock:
+            engines, self._engines = list(self._engines.values()), OrderedDict()
+        for engine, owned in engines:
+            if owned:
+                engine.dispose()
+
+    def tenants(self) -> List[str]:
+        with self._lock:
+            return list(self._engines)
+
+    def __len__(self):
+        return len(self._engines)
+
+engines = EngineCache()
+
+def schema_name(tenant: str) -> str:
+    return f"{TENANT_SCHEMA_PREFIX}{tenant}"
+
+def _create_engine(tenant: str):
+    """(engine, owned): owned engines have their own pool and are disposed on eviction"""
+    if TENANT_ROUTING == "schema":
+        # Shares the main pool; each connection maps the tables into the tenant's schema
+        engine = database.get_engine().execution_options(schema_translate_map={None: schema_name(tenant)})
+        owned = False
+    elif TENANT_ROUTING == "database":
+        if "{tenant}" not in TENANT_DATABASE_URL:
+            raise RuntimeError("TENANT_ROUTING=database needs TENANT_DATABASE_URL with a {tenant} placeholder")
+        url = TENANT_DATABASE_URL.format(tenant=tenant)
+        if url.startswith("sqlite"):
+            engine = create_engine(url, connect_args={"check_same_thread": False})
+        else:
+            engine = create_engine(url, pool_size=TENANT_POOL_SIZE, max_overflow=TENANT_MAX_OVERFLOW, pool_pre_ping=True)
+        owned = True
+    else:
+        raise ValueError(f"Unknown TENANT_ROUTING {TENANT_ROUTING!r}, expected shared, schema or database")
+    if database.DB_SCHEMA_ON_STARTUP == "create":
+        if TENANT_ROUTING == "schema":
+            with engine.begin() as connection:
+                connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_name(tenant)}"'))
+        database.Base.metadata.create_all(bind=engine)
+    return engine, owned
+
+def engine_for(tenant: Optional[str] = None):
+    if TENANT_ROUTING == "shared":
+        return database.get_engine()
+    return engines.get(tenant or current())
+
+if TENANT_ROUTING != "shared":
+    database.engine_router = engine_for
+
+def known() -> List[str]:
+    """Tenants a worker can enumerate without a registry: the default, the allow-list and those it has served"""
+    return sorted({DEFAULT_TENANT} | TENANTS | set(engines.tenants()))
+
+@event.listens_for(Session, "do_orm_execute")
+def _tenant_criteria(state):
+    """Every ORM query, update and delete only sees the current tenant's rows"""
+    if not (state.is_select or state.is_update or state.is_delete):
+        return
+    if state.is_column_load or state.is_relationship_load or state.execution_options.get("all_tenants"):
+        return
+    import models
+    tenant = current()
+    state.statement = state.statement.options(
+        with_loader_criteria(models.TenantMixin, lambda cls: cls.tenant_id == tenant, include_aliases=True)
+    )
+
+def token_tenant(token: str) -> Optional[str]:
+    """Tenant a bearer token was issued for; tokens from before tenancy belong to the default tenant"""
+    from jose import JWTError, jwt
+    import security
+    try:
+        payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("tenant", DEFAULT_TENANT)
+
+def host_tenant(host: str) -> Optional[str]:
+    host = host.split(":", 1)[0].lower()
+    if TENANT_BASE_DOMAIN and host.endswith("." + TENANT_BASE_DOMAIN):
+        label = host[:-len(TENANT_BASE_DOMAIN) - 1]
+        if label and "." not in label:
+            return label
+    return None
+
+def resolve(scope) -> str:
+    """Tenant of a request from its bearer token or host; both must agree when both are given"""
+    by_token = by_host = None
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                by_token = token_tenant(token)
+        elif name == b"host":
+            by_host = host_tenant(value.decode("latin-1"))
+    if by_token and by_host and by_token != by_host:
+        raise PermissionError("Token belongs to another tenant.")
+    return check(by_token or by_host or DEFAULT_TENANT)
+
+class TenantMiddleware:
+    """Sets the tenant for everything the request does, including background tasks"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            tenant = resolve(scope)
+        except UnknownTenant:
+            await self._reject(send, 404, "Unknown tenant.")
+            return
+        except PermissionError as e:
+            await self._reject(send, 403, str(e))
+            return
+        token = _current.set(tenant)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+
+    async def _reject(self, send, status_code: int, detail: str):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
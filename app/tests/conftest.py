@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import database
+from database import Base
+
+@pytest.fixture(scope="session")
+def app_database():
+    """Tables in DATABASE_URL for tests that go through the app; importing the app no longer creates them"""
+    database.init_schema("create")
+
+@pytest.fixture
+def memory_db():
+    """Isolated in-memory SQLite session for crud-level tests"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
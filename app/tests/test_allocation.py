@@ -0,0 +1,56 @@
+from datetime import date, time
+
+import pytest
+
+import allocation, crud, models, schemas
+
+DAY = date(2030, 1, 1)
+
+def request(room_type, user_id=None, team_id=None, start=9, end=10):
+    return schemas.BookingCreate(
+        room_type=room_type, user_id=user_id, team_id=team_id,
+        slot_date=DAY, slot_start=time(start, 0), slot_end=time(end, 0)
+    )
+
+def test_choose_orders_fitting_candidates():
+    shared = [allocation.Candidate(1, 4, 0, 0), allocation.Candidate(2, 4, 3, 5), allocation.Candidate(3, 2, 2, 2)]
+    assert allocation.choose("first_fit", "shared", shared).room_id == 1
+    assert allocation.choose("best_fit", "shared", shared).room_id == 2
+    assert allocation.choose("least_loaded", "shared", shared).room_id == 1
+    rooms = [allocation.Candidate(1, 10, 0, 0), allocation.Candidate(2, 4, 0, 3), allocation.Candidate(3, 2, 0, 0)]
+    assert allocation.choose("best_fit", "conference", rooms, headcount=3).room_id == 2
+    assert allocation.choose("best_fit", "conference", rooms, headcount=11) is None
+    with pytest.raises(ValueError):
+        allocation.get_strategy("random")
+
+@pytest.fixture
+def offices(memory_db):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(5)
+    ]
+    memory_db.add_all(users)
+    memory_db.add_all([
+        models.Room(room_type=models.RoomTypeEnum.conference, capacity=10, name="Large"),
+        models.Room(room_type=models.RoomTypeEnum.conference, capacity=4, name="Small"),
+    ])
+    team = models.Team(name="team", members=users[:3])
+    crowd = models.Team(name="crowd", members=users)
+    memory_db.add_all([team, crowd])
+    memory_db.commit()
+    return memory_db, team, crowd
+
+@pytest.mark.parametrize("create", [crud.create_booking, crud.create_booking_stepwise])
+def test_best_fit_keeps_large_room_for_large_team(offices, create):
+    db, team, crowd = offices
+    booking = create(db, request("conference", team_id=team.id), "best_fit")
+    assert db.get(models.Room, booking.room_id).name == "Small"
+    booking = create(db, request("conference", team_id=crowd.id), "best_fit")
+    assert db.get(models.Room, booking.room_id).name == "Large"
+
+@pytest.mark.parametrize("create", [crud.create_booking, crud.create_booking_stepwise])
+def test_conference_room_must_hold_headcount(offices, create):
+    db, team, crowd = offices
+    create(db, request("conference", team_id=team.id), "first_fit")
+    with pytest.raises(crud.RoomUnavailable):
+        create(db, request("conference", team_id=crowd.id), "first_fit")
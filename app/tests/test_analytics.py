@@ -0,0 +1,56 @@
+from datetime import date, time
+
+import pytest
+from sqlalchemy import select
+
+import analytics, crud, models, schemas
+
+DAY = date(2030, 1, 7)  # a Monday
+
+def snapshot(db):
+    hourly = {(r.room_id, r.slot_date, r.hour): r.booked_minutes for r in db.execute(select(analytics.HOURLY)) if r.booked_minutes}
+    daily = {(r.room_id, r.slot_date): (r.booked_minutes, r.bookings, r.cancellations) for r in db.execute(select(analytics.DAILY))}
+    return hourly, daily
+
+@pytest.fixture
+def booked(memory_db):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(3)
+    ]
+    memory_db.add_all(users)
+    memory_db.add_all([
+        models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 1"),
+        models.Room(room_type=models.RoomTypeEnum.shared, capacity=2, name="Shared 1"),
+    ])
+    memory_db.commit()
+    for user, room_type, start, end in [
+        (users[0], "private", time(9, 30), time(11, 0)),
+        (users[1], "shared", time(9, 0), time(10, 0)),
+        (users[2], "shared", time(9, 0), time(12, 0)),
+    ]:
+        crud.create_booking(memory_db, schemas.BookingCreate(
+            room_type=room_type, user_id=user.id, slot_date=DAY, slot_start=start, slot_end=end
+        ))
+    crud.cancel_booking(memory_db, 3)
+    return memory_db
+
+@pytest.mark.parametrize("vectorized", [False, pytest.param(True, marks=pytest.mark.skipif(
+    analytics._numpy() is None, reason="numpy not installed"))])
+def test_rebuild_matches_incremental(booked, vectorized):
+    incremental = snapshot(booked)
+    assert incremental[1][(1, DAY)] == (90, 1, 0)
+    assert incremental[1][(2, DAY)] == (60, 2, 1)
+    assert incremental[0][(1, DAY, 9)] == 30 and incremental[0][(1, DAY, 10)] == 60
+    analytics.rebuild(booked, vectorized=vectorized)
+    assert snapshot(booked) == incremental
+
+def test_heatmap_and_rates(booked):
+    heatmap = analytics.heatmap(booked, DAY, DAY, "room_type")
+    shared = next(item for item in heatmap["room_types"] if item["room_type"] == "shared")
+    assert shared["seats"] == 2
+    assert shared["utilization"][0][0] == 0.5  # one of two seats, Monday 09:00
+    peak = analytics.peak_hours(booked, DAY, DAY, limit=1)["peak_hours"][0]
+    assert (peak["hour"], peak["booked_minutes"]) == (9, 90)
+    rates = {item["room_id"]: item for item in analytics.rates(booked, DAY, DAY)["rooms"]}
+    assert rates[2]["cancellation_rate"] == 0.5 and rates[1]["cancellations"] == 0
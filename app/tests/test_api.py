@@ -12,6 +12,8 @@ from database import SessionLocal
 
 client = TestClient(app)
 
+pytestmark = pytest.mark.usefixtures("app_database")
+
 @pytest.fixture
 def db():
     db = SessionLocal()
@@ -0,0 +1,57 @@
+from datetime import date, time
+
+import pytest
+from fastapi import HTTPException
+
+import crud, models, schemas
+
+DAY = date(2030, 1, 1)
+
+def request(room_type, user_id=None, team_id=None, start=9, end=10):
+    return schemas.BookingCreate(
+        room_type=room_type, user_id=user_id, team_id=team_id,
+        slot_date=DAY, slot_start=time(start, 0), slot_end=time(end, 0)
+    )
+
+@pytest.fixture
+def office(memory_db):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(4)
+    ]
+    memory_db.add_all(users)
+    memory_db.add_all([
+        models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"),
+        models.Room(room_type=models.RoomTypeEnum.shared, capacity=2, name="Shared Desk 1"),
+        models.Room(room_type=models.RoomTypeEnum.conference, capacity=10, name="Conference Room 1"),
+    ])
+    small = models.Team(name="small", members=users[:2])
+    big = models.Team(name="big", members=users[:3])
+    memory_db.add_all([small, big])
+    memory_db.commit()
+    return memory_db, users, small, big
+
+def test_single_statement_insert_books_and_blocks_overlap(office):
+    db, users, _, _ = office
+    booking = crud.create_booking(db, request("private", users[0].id))
+    assert booking.id and booking.room_id and booking.user_id == users[0].id
+    with pytest.raises(crud.RoomUnavailable):
+        crud.create_booking(db, request("private", users[1].id, start=9, end=11))
+    with pytest.raises(HTTPException) as exc:
+        crud.create_booking(db, request("shared", users[0].id))
+    assert exc.value.detail == "User already has a booking for this slot."
+
+def test_shared_desk_fills_to_capacity(office):
+    db, users, _, _ = office
+    crud.create_booking(db, request("shared", users[0].id))
+    crud.create_booking(db, request("shared", users[1].id))
+    with pytest.raises(crud.RoomUnavailable):
+        crud.create_booking(db, request("shared", users[2].id))
+
+def test_conference_requires_three_members(office):
+    db, users, small, big = office
+    with pytest.raises(HTTPException) as exc:
+        crud.create_booking(db, request("conference", team_id=small.id))
+    assert "at least 3 members" in exc.value.detail
+    booking = crud.create_booking(db, request("conference", team_id=big.id))
+    assert booking.team_id == big.id and booking.user_id is None
@@ -0,0 +1,114 @@
+from datetime import date, time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql, sqlite
+
+import booking_search, crud, models, tenants
+
+@pytest.fixture
+def bookings(memory_db):
+    names = ["Alice", "Albert", "Bob"]
+    users = [
+        models.User(name=name, email=f"{name.lower()}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for name in names
+    ]
+    team = models.Team(name="Platform_Team")
+    rooms = [
+        models.Room(name="P1", room_type=models.RoomTypeEnum.private, capacity=1),
+        models.Room(name="C1", room_type=models.RoomTypeEnum.conference, capacity=6),
+    ]
+    memory_db.add_all(users + rooms + [team])
+    memory_db.commit()
+    for i, user in enumerate(users):
+        for day in (1, 2, 3):
+            memory_db.add(models.Booking(
+                room_id=rooms[0].id, user_id=user.id, slot_date=date(2030, 1, day),
+                slot_start=time(9 + i), slot_end=time(10 + i), is_active=day != 3
+            ))
+    memory_db.add(models.Booking(room_id=rooms[1].id, team_id=team.id, slot_date=date(2030, 1, 1),
+                                 slot_start=time(14), slot_end=time(15)))
+    memory_db.commit()
+    booking_search.counts.clear()
+    return memory_db
+
+def ids(page):
+    return [row["id"] for row in page["bookings"]]
+
+def test_filters_combine_and_match_name_prefixes(bookings):
+    page = booking_search.search(bookings, user="al")
+    assert {row["user_name"] for row in page["bookings"]} == {"Alice", "Albert"}
+    assert (page["total"], page["total_exact"]) == (4, True)
+    page = booking_search.search(bookings, user="AL", date_from=date(2030, 1, 2), status="all")
+    assert {(row["user_name"], row["slot_date"].day) for row in page["bookings"]} == {
+        ("Alice", 2), ("Albert", 2), ("Alice", 3), ("Albert", 3)
+    }
+    assert booking_search.search(bookings, status="cancelled", room_type="private")["total"] == 3
+    page = booking_search.search(bookings, team="platform_")
+    assert [(row["team_name"], row["room_type"], row["room_name"]) for row in page["bookings"]] == [("Platform_Team", "conference", "C1")]
+    # "_" is matched literally, not as a wildcard
+    assert booking_search.search(bookings, team="platformx")["total"] == 0
+    assert booking_search.search(bookings, user="lice")["total"] == 0
+
+def test_keyset_pages_cover_every_row_once(bookings):
+    seen, cursor = [], None
+    while True:
+        page = booking_search.search(bookings, limit=2, cursor=cursor, status="all", with_total=False)
+        seen += page["bookings"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 10 and len({row["id"] for row in seen}) == 10
+    keys = [(row["slot_date"], row["id"]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+    with pytest.raises(HTTPException):
+        booking_search.search(bookings, cursor="not-a-cursor")
+
+def test_totals_are_bounded_and_cached_until_a_booking_changes(bookings, monkeypatch):
+    monkeypatch.setattr(booking_search, "SEARCH_COUNT_EXACT_LIMIT", 3)
+    page = booking_search.search(bookings, status="all")
+    assert (page["total"], page["total_exact"]) == (4, False)
+    monkeypatch.setattr(booking_search, "SEARCH_COUNT_EXACT_LIMIT", 100)
+    assert booking_search.search(bookings, status="all")["total"] == 4
+    crud.cancel_booking(bookings, 1)
+    assert (booking_search.search(bookings, status="all")["total"], booking_search.search(bookings)["total"]) == (10, 6)
+
+def test_other_tenants_bookings_are_not_found(bookings):
+    with tenants.use("acme"):
+        page = booking_search.search(bookings, status="all")
+    assert page["bookings"] == [] and page["total"] == 0
+
+def test_prefix_conditions_per_dialect(bookings):
+    def sql(dialect, term):
+        condition = booking_search.name_matches(models.User.name, term, False, dialect is sqlite)
+        return str(condition.compile(dialect=dialect.dialect()))
+    # Postgres: LIKE alone, served by the text_pattern_ops index; a range would follow the collation
+    assert "<" not in sql(postgresql, "mary-") and "LIKE" in sql(postgresql, "mary-")
+    assert "<" in sql(sqlite, "mary-")
+    # No code point above U+10FFFF: the range is open-ended
+    assert booking_search._prefix_upper("a" + chr(0x10FFFF)) == "b"
+    assert booking_search._prefix_upper(chr(0x10FFFF)) is None
+    assert booking_search.search(bookings, user=chr(0x10FFFF))["total"] == 0
+    assert booking_search.search(bookings, user="al" + chr(0x10FFFF))["total"] == 0
+
+def test_trigram_index_is_created_in_the_tables_schema():
+    statements = []
+
+    class Connection:
+        dialect = postgresql.dialect()
+
+        def execute(self, statement):
+            class Result:
+                def first(self):
+                    return (1,)
+            return Result()
+
+        def get_execution_options(self):
+            return {"schema_translate_map": {None: "tenant_acme"}}
+
+        def exec_driver_sql(self, statement):
+            statements.append(statement)
+    models._create_trigram_index(models.User.__table__, Connection())
+    assert statements == [
+        "CREATE INDEX IF NOT EXISTS ix_users_name_trgm ON tenant_acme.users USING gin (name gin_trgm_ops)"
+    ]
@@ -0,0 +1,91 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+import analytics, crud, events, models, schemas
+
+DAY = date(2030, 1, 1)
+
+@pytest.fixture
+def booked(memory_db):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(3)
+    ]
+    memory_db.add_all(users)
+    memory_db.add_all([
+        models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 1"),
+        models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 2"),
+    ])
+    memory_db.commit()
+    for hour in (9, 10, 11):
+        for user in users[:2]:
+            crud.create_booking(memory_db, schemas.BookingCreate(
+                room_type="private", user_id=user.id, slot_date=DAY, slot_start=time(hour, 0), slot_end=time(hour + 1, 0)
+            ), "first_fit")
+    return memory_db, users
+
+def test_bulk_cancel_by_filter(booked, monkeypatch):
+    db, users = booked
+    published = []
+    monkeypatch.setattr(events.bus, "publish", published.append)
+    before = db.execute(select(models.Booking.change_seq)).scalars().all()
+    rows = crud.bulk_cancel_bookings(db, room_id=1, date_from=DAY, date_to=DAY)
+    assert len(rows) == 3 and {row["room_id"] for row in rows} == {1}
+    assert all(row["room_type"] == "private" and not row["is_active"] for row in rows)
+    active = db.execute(select(models.Booking.room_id).where(models.Booking.is_active == True)).scalars().all()
+    assert active == [2, 2, 2]
+    seqs = db.execute(select(models.Booking.change_seq).where(models.Booking.room_id == 1)).scalars().all()
+    assert len(set(seqs)) == 3 and min(seqs) > max(before)
+    daily = db.execute(select(analytics.DAILY).where(analytics.DAILY.c.room_id == 1)).one()
+    assert (daily.booked_minutes, daily.bookings, daily.cancellations) == (0, 3, 3)
+    assert len(published) == 1
+    assert (published[0].count, published[0].room_ids, published[0].slots) == (3, [1], [(DAY.isoformat(), "private")])
+    # Already cancelled bookings are not reported again
+    assert crud.bulk_cancel_bookings(db, room_id=1) == []
+
+def test_bulk_cancel_by_ids_and_requires_a_filter(booked):
+    db, users = booked
+    rows = crud.bulk_cancel_bookings(db, booking_ids=[2, 4, 99])
+    assert [row["id"] for row in rows] == [2, 4]
+    with pytest.raises(HTTPException):
+        crud.bulk_cancel_bookings(db)
+
+def test_bulk_cancel_releases_holds_on_the_matching_rooms(booked, monkeypatch):
+    db, users = booked
+    expires_at = datetime.utcnow() + timedelta(minutes=5)
+    for room_id in (1, 2):
+        db.add(models.BookingHold(
+            room_id=room_id, room_type=models.RoomTypeEnum.private, user_id=users[2].id, slot_date=DAY,
+            slot_start=time(14, 0), slot_end=time(15, 0), expires_at=expires_at, created_by=users[2].id
+        ))
+    db.commit()
+    published = []
+    monkeypatch.setattr(events.bus, "publish", published.append)
+    crud.bulk_cancel_bookings(db, room_id=1)
+    assert db.execute(select(models.BookingHold.room_id)).scalars().all() == [2]
+    released = [event for event in published if isinstance(event, events.HoldChanged)]
+    assert [(event.action, event.room_id, event.room_type, event.slot_date) for event in released] == [
+        ("released", 1, "private", DAY)
+    ]
+    # A hold is released even when no booking matched
+    crud.bulk_cancel_bookings(db, room_id=2, date_from=DAY)
+    assert db.execute(select(models.BookingHold.id)).scalars().all() == []
+
+def test_bulk_event_stays_under_the_notify_limit(monkeypatch):
+    published = []
+    monkeypatch.setattr(events.bus, "publish", published.append)
+    rows = [{
+        "user_id": 100000 + i, "team_id": 200000 + i, "room_id": 300000 + i,
+        "slot_date": date(2030, 1, 1) + timedelta(days=i), "room_type": "conference",
+    } for i in range(crud.BULK_EVENT_MAX_KEYS)]
+    crud.bookings_changed(rows, "cancelled")
+    event = published[0]
+    assert events.encoded_size(event) <= events.MAX_PAYLOAD_BYTES
+    # The longest list goes first, the ones that fit are kept
+    assert event.slots is None and len(event.room_ids) == crud.BULK_EVENT_MAX_KEYS
+    # Small events are sent as they are
+    crud.bookings_changed(rows[:3], "cancelled")
+    assert published[1].slots == [(row["slot_date"].isoformat(), "conference") for row in rows[:3]]
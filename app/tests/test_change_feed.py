@@ -0,0 +1,75 @@
+from datetime import date, datetime, time
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+
+import crud, models, schemas
+from database import Base
+
+def book(db, user_id, hour):
+    return crud.create_booking(db, schemas.BookingCreate(
+        room_type="private", user_id=user_id, slot_date=date(2030, 1, 1),
+        slot_start=time(hour, 0), slot_end=time(hour + 1, 0)
+    ))
+
+def test_changes_since_cursor(memory_db):
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"))
+    memory_db.commit()
+    first, second = book(memory_db, 1, 9), book(memory_db, 2, 10)
+
+    rows, cursor, has_more = crud.get_booking_changes(memory_db, since=0, limit=1)
+    assert [r["id"] for r in rows] == [first.id] and has_more
+    rows, cursor, has_more = crud.get_booking_changes(memory_db, since=cursor)
+    assert [r["id"] for r in rows] == [second.id] and not has_more
+
+    crud.cancel_booking(memory_db, first.id)
+    rows, new_cursor, _ = crud.get_booking_changes(memory_db, since=cursor)
+    assert [(r["id"], r["is_active"]) for r in rows] == [(first.id, False)]
+    assert new_cursor > cursor
+    assert crud.get_booking_changes(memory_db, since=new_cursor)[0] == []
+
+def test_a_long_transaction_is_numbered_when_it_commits(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/feed.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    writer, reader = Session(), Session()
+    writer.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"))
+    writer.commit()
+    first = book(writer, 1, 9)
+    rows, cursor, _ = crud.get_booking_changes(reader, since=0)
+    assert [r["id"] for r in rows] == [first.id]
+    reader.rollback()
+    # The insert is made, then the transaction stays open well past any settle window
+    slow = models.Booking(room_id=1, user_id=2, slot_date=date(2030, 1, 1), slot_start=time(10, 0),
+                          slot_end=time(11, 0), is_active=True, change_seq=crud.change_seq_value(writer))
+    writer.add(slow)
+    writer.flush()
+    # Not numbered until it commits
+    assert writer.execute(select(models.Booking.change_seq).where(models.Booking.id == slow.id)).scalar() is None
+    writer.execute(update(models.Booking).where(models.Booking.id == slow.id).values(updated_at=datetime(2000, 1, 1)))
+    assert crud.get_booking_changes(reader, since=cursor) == ([], cursor, False)
+    reader.rollback()
+    writer.commit()
+    rows, new_cursor, _ = crud.get_booking_changes(reader, since=cursor)
+    assert [r["id"] for r in rows] == [slow.id] and new_cursor > cursor
+    writer.close()
+    reader.close()
+    engine.dispose()
+
+def test_members_see_their_teams_bookings(memory_db):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(4)
+    ]
+    memory_db.add_all(users)
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.conference, capacity=10, name="Conference"))
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"))
+    team = models.Team(name="team", members=users[:3])
+    memory_db.add(team)
+    memory_db.commit()
+    meeting = crud.create_booking(memory_db, schemas.BookingCreate(
+        room_type="conference", team_id=team.id, slot_date=date(2030, 1, 1), slot_start=time(9, 0), slot_end=time(10, 0)
+    ))
+    own = book(memory_db, users[0].id, 11)
+    assert [r["id"] for r in crud.get_booking_changes(memory_db, user_id=users[0].id)[0]] == [meeting.id, own.id]
+    assert crud.get_booking_changes(memory_db, user_id=users[3].id)[0] == []
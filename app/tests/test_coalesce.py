@@ -0,0 +1,105 @@
+import threading
+import time
+from datetime import date
+
+from fastapi import HTTPException
+
+import coalesce, events, tenants
+from coalesce import SingleFlight
+
+DAY = date(2030, 1, 1)
+SCOPE = ("default", DAY)
+
+def slow_call(release: threading.Event, calls: list, result="rooms"):
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return result
+    return fn
+
+def run_concurrently(flights, n, fn, key="k", scope=SCOPE):
+    results = [None] * n
+    def worker(i):
+        results[i] = flights.run("available", key, scope, fn)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def wait_for(predicate):
+    deadline = time.monotonic() + 5
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+def test_concurrent_identical_calls_share_one_evaluation():
+    flights = SingleFlight(ttl=0)
+    release, calls = threading.Event(), []
+    threads, results = run_concurrently(flights, 8, slow_call(release, calls))
+    wait_for(lambda: flights.stats()["kinds"].get("available", {}).get("calls") == 8)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ["rooms"] * 8
+    stats = flights.stats()["kinds"]["available"]
+    assert (stats["executed"], stats["coalesced"], stats["cached"]) == (1, 7, 0)
+    # Without a TTL the next call runs again
+    assert flights.run("available", "k", SCOPE, lambda: "again") == "again"
+
+def test_errors_reach_every_waiter_and_are_not_kept():
+    flights = SingleFlight(ttl=60)
+    release = threading.Event()
+    def fn():
+        release.wait(5)
+        raise HTTPException(status_code=503, detail="timeout")
+    errors = []
+    def worker():
+        try:
+            flights.run("available", "k", SCOPE, fn)
+        except HTTPException as exc:
+            errors.append(exc.status_code)
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flights.stats()["kinds"].get("available", {}).get("calls") == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == [503] * 3
+    assert flights.run("available", "k", SCOPE, lambda: "ok") == "ok"
+
+def test_ttl_serves_until_the_day_is_invalidated():
+    flights = SingleFlight(ttl=60)
+    assert flights.run("available", "k", SCOPE, lambda: 1) == 1
+    assert flights.run("available", "k", SCOPE, lambda: 2) == 1
+    flights.invalidate(("default", date(2030, 1, 2)))
+    assert flights.run("available", "k", SCOPE, lambda: 3) == 1
+    flights.invalidate(SCOPE)
+    assert flights.run("available", "k", SCOPE, lambda: 4) == 4
+    assert flights.stats()["kinds"]["available"]["cached"] == 2
+
+def test_call_running_during_a_write_is_not_shared_afterwards():
+    flights = SingleFlight(ttl=60)
+    release, calls = threading.Event(), []
+    threads, results = run_concurrently(flights, 1, slow_call(release, calls, "before"))
+    wait_for(lambda: calls)
+    flights.invalidate(SCOPE)
+    assert flights.run("available", "k", SCOPE, lambda: "after") == "after"
+    release.set()
+    threads[0].join()
+    assert results == ["before"]
+    # The stale result was not kept for the TTL either
+    assert flights.run("available", "k", SCOPE, lambda: "fresh") == "after"
+
+def test_booking_events_invalidate_their_tenant_and_day(monkeypatch):
+    flights = SingleFlight(ttl=60)
+    monkeypatch.setattr(coalesce, "flights", flights)
+    with tenants.use("acme"):
+        flights.run("available", "k", coalesce.day_scope(DAY), lambda: "acme")
+    flights.run("available", "k2", coalesce.day_scope(DAY), lambda: "default")
+    with tenants.use("acme"):
+        events.publish(events.BookingChanged("created", 1, 1, "private", DAY, 1))
+        assert flights.run("available", "k", coalesce.day_scope(DAY), lambda: "fresh") == "fresh"
+    assert flights.run("available", "k2", coalesce.day_scope(DAY), lambda: "stale") == "default"
+    events.publish(events.RoomChanged(1, "private"))
+    assert flights.run("available", "k2", coalesce.day_scope(DAY), lambda: "fresh") == "fresh"
@@ -0,0 +1,43 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import crud, deadlines, models
+
+ENDLESS = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c")
+COUNT_TO_10K = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 10000) SELECT count(*) FROM c")
+
+def test_no_deadline_by_default(memory_db):
+    assert deadlines.remaining(memory_db) is None
+    deadlines.check(memory_db)
+
+def test_sqlite_statement_is_interrupted_at_deadline(memory_db):
+    deadlines.set_deadline(memory_db, 0.1)
+    started = time.monotonic()
+    with pytest.raises(OperationalError) as error:
+        memory_db.execute(ENDLESS)
+    assert time.monotonic() - started < 2
+    assert deadlines.is_timeout(error.value)
+    memory_db.rollback()
+    with pytest.raises(deadlines.DeadlineExceeded):
+        deadlines.check(memory_db)
+
+def test_cleared_deadline_releases_the_connection(memory_db):
+    deadlines.set_deadline(memory_db, 0.05)
+    memory_db.execute(text("SELECT 1"))
+    memory_db.rollback()
+    time.sleep(0.1)
+    deadlines.set_deadline(memory_db, None)
+    assert memory_db.execute(COUNT_TO_10K).scalar() == 10000
+
+def test_crud_bails_out_when_time_is_up(memory_db):
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 1"))
+    memory_db.commit()
+    deadlines.set_deadline(memory_db, 0.01)
+    time.sleep(0.02)
+    with pytest.raises(deadlines.DeadlineExceeded) as error:
+        crud.find_earliest_slots(memory_db, "private", timedelta(hours=1), date(2030, 1, 1), date(2030, 1, 7))
+    assert error.value.status_code == 503
@@ -0,0 +1,39 @@
+import threading
+from datetime import date, time
+
+import crud, events, models, schemas
+
+def test_encode_roundtrip():
+    event = events.BookingChanged("created", 1, 2, "shared", date(2030, 1, 1), user_id=3)
+    assert events.decode(events.encode(event, "me")) == (event, "me")
+
+def test_unix_transport_reaches_other_workers(tmp_path):
+    sender, receiver = events.Bus(), events.Bus()
+    received, done = [], threading.Event()
+    def handler(event):
+        received.append(event)
+        done.set()
+    receiver.subscribe(events.UserRevoked, handler)
+    sender.start(events.UnixSocketTransport(str(tmp_path)))
+    receiver.start(events.UnixSocketTransport(str(tmp_path)))
+    try:
+        sender.publish(events.UserRevoked(7))
+        assert done.wait(5)
+        assert received == [events.UserRevoked(7)]
+    finally:
+        sender.stop()
+        receiver.stop()
+
+def test_crud_publishes_booking_events(memory_db, monkeypatch):
+    published = []
+    monkeypatch.setattr(events.bus, "publish", published.append)
+    user = models.User(name="u", email="u@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+    memory_db.add_all([user, models.Room(room_type=models.RoomTypeEnum.shared, capacity=2, name="Shared 1")])
+    memory_db.commit()
+    booking = crud.create_booking(memory_db, schemas.BookingCreate(
+        room_type="shared", user_id=user.id, slot_date=date(2030, 1, 1), slot_start=time(9, 0), slot_end=time(10, 0)
+    ))
+    crud.cancel_booking(memory_db, booking.id)
+    assert [(e.action, e.booking_id, e.room_type, e.user_id) for e in published] == [
+        ("created", booking.id, "shared", user.id), ("cancelled", booking.id, "shared", user.id)
+    ]
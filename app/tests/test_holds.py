@@ -0,0 +1,86 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+import crud, holds, models, schemas
+
+DAY = date(2030, 1, 1)
+
+def request(user_id, start=9, end=10, **extra):
+    return schemas.HoldCreate(
+        room_type="private", user_id=user_id, slot_date=DAY, slot_start=time(start, 0), slot_end=time(end, 0), **extra
+    )
+
+@pytest.fixture
+def office(memory_db):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(2)
+    ]
+    memory_db.add_all(users)
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 1"))
+    memory_db.commit()
+    return memory_db, users
+
+def test_hold_blocks_others_until_confirmed(office):
+    db, users = office
+    hold = holds.create_hold(db, request(users[0].id), users[0].id)
+    assert hold.expires_at > datetime.utcnow()
+    assert crud.get_available_rooms(db, DAY, time(9, 0), time(10, 0), "private") == []
+    with pytest.raises(crud.RoomUnavailable):
+        crud.create_booking(db, request(users[1].id))
+    with pytest.raises(crud.RoomUnavailable):
+        holds.create_hold(db, request(users[1].id), users[1].id)
+    with pytest.raises(HTTPException) as exc:
+        crud.create_booking(db, request(users[0].id))
+    assert exc.value.detail == "User already has a booking for this slot."
+    assert crud.find_earliest_slots(db, "private", timedelta(hours=1), DAY, DAY)[0]["slot_start"] == time(10, 0)
+
+    booking = holds.confirm_hold(db, hold)
+    assert (booking.room_id, booking.user_id, booking.is_active) == (hold.room_id, users[0].id, True)
+    assert db.get(models.BookingHold, hold.id) is None
+    with pytest.raises(HTTPException) as exc:
+        holds.confirm_hold(db, hold)
+    assert exc.value.status_code == 410
+
+def test_release_and_expiry_free_capacity(office):
+    db, users = office
+    holds.release_hold(db, holds.create_hold(db, request(users[0].id), users[0].id))
+    assert len(crud.get_available_rooms(db, DAY, time(9, 0), time(10, 0), "private")) == 1
+
+    hold = holds.create_hold(db, request(users[0].id), users[0].id)
+    hold.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    # Expired holds stop counting before they are reaped
+    assert len(crud.get_available_rooms(db, DAY, time(9, 0), time(10, 0), "private")) == 1
+    with pytest.raises(HTTPException):
+        holds.confirm_hold(db, db.get(models.BookingHold, hold.id))
+    assert [h.id for h in holds.expire_holds(db, [hold.id])] == [hold.id]
+    assert db.get(models.BookingHold, hold.id) is None
+
+def test_reaper_pops_holds_in_expiry_order():
+    reaper = holds.HoldReaper()
+    now = datetime.utcnow()
+    reaper.schedule(1, now + timedelta(seconds=30))
+    reaper.schedule(2, now - timedelta(seconds=5))
+    reaper.schedule(3, now - timedelta(seconds=10))
+    reaper.schedule(4, now - timedelta(seconds=1))
+    reaper.cancel(4)
+    assert reaper.due(now) == [("default", 3), ("default", 2)]
+    assert reaper.due(now + timedelta(minutes=1)) == [("default", 1)]
+
+def test_sweep_reaps_holds_the_heap_never_saw(office, monkeypatch):
+    db, users = office
+    monkeypatch.setattr(holds, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    stale = holds.create_hold(db, request(users[0].id), users[0].id)
+    live = holds.create_hold(db, request(users[1].id, start=10, end=11), users[1].id)
+    # Created by a worker that crashed: expired and not in this reaper's heap
+    stale.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    stale_id, live_id = stale.id, live.id
+    holds.HoldReaper().sweep()
+    db.expire_all()
+    assert db.get(models.BookingHold, stale_id) is None
+    assert db.get(models.BookingHold, live_id) is not None
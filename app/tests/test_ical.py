@@ -0,0 +1,52 @@
+import events, ical, models, security, tenants
+from ical import FeedCache, TokenVersions
+
+def test_etag_changes_only_for_affected_scope():
+    cache = FeedCache()
+    user, room = ("users", 1), ("rooms", 2)
+    user_etag, room_etag = cache.etag(user), cache.etag(room)
+    cache.invalidate(user, ("teams", None))
+    assert cache.etag(user) != user_etag
+    assert cache.etag(room) == room_etag
+
+def test_body_rendered_before_a_change_is_not_cached():
+    cache = FeedCache()
+    scope = ("rooms", 1)
+    stale = cache.etag(scope)
+    cache.invalidate(scope)
+    cache.put(scope, stale, b"old")
+    assert cache.get(scope, stale) is None
+    fresh = cache.etag(scope)
+    cache.put(scope, fresh, b"new")
+    assert cache.get(scope, fresh) == b"new"
+    cache.invalidate_all()
+    assert cache.get(scope, fresh) is None
+
+def test_rotating_a_feed_revokes_its_old_token(memory_db, monkeypatch):
+    versions = TokenVersions()
+    monkeypatch.setattr(ical, "token_versions", versions)
+    published = []
+    monkeypatch.setattr(events.bus, "publish", published.append)
+    old = security.create_feed_token("rooms", 1)
+    assert versions.get_many(memory_db, "rooms", [1, 2]) == {1: 0, 2: 0}
+    assert security.verify_feed_token("rooms", 1, old, versions.get(memory_db, "rooms", 1))
+    assert ical.rotate_token(memory_db, "rooms", 1) == 1
+    assert published == [events.FeedTokenRotated("rooms", 1)]
+    version = versions.get(memory_db, "rooms", 1)
+    assert version == 1
+    assert not security.verify_feed_token("rooms", 1, old, version)
+    assert security.verify_feed_token("rooms", 1, security.create_feed_token("rooms", 1, version), version)
+    assert ical.rotate_token(memory_db, "rooms", 1) == 2
+    # Other feeds, and the same feed in another tenant, keep their tokens
+    assert versions.get(memory_db, "rooms", 2) == 0
+    with tenants.use("acme"):
+        assert versions.get(memory_db, "rooms", 1) == 0
+
+def test_rotation_elsewhere_drops_the_cached_version(memory_db):
+    versions = TokenVersions()
+    assert versions.get(memory_db, "users", 1) == 0
+    memory_db.add(models.FeedToken(kind="users", scope_id=1, version=3))
+    memory_db.commit()
+    assert versions.get(memory_db, "users", 1) == 0
+    versions.forget(ical.scope("users", 1))
+    assert versions.get(memory_db, "users", 1) == 3
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import IdempotencyStore
+
+def test_replay_returns_first_result():
+    store = IdempotencyStore(ttl=60, max_keys=10)
+    calls = []
+    def handler():
+        calls.append(1)
+        return {"id": len(calls)}
+    assert store.run("1:k", "h", handler) == (200, {"id": 1}, False)
+    assert store.run("1:k", "h", handler) == (200, {"id": 1}, True)
+    assert len(calls) == 1
+
+def test_key_reuse_with_different_request_is_rejected():
+    store = IdempotencyStore(ttl=60, max_keys=10)
+    store.run("1:k", "h1", lambda: {})
+    with pytest.raises(HTTPException) as exc:
+        store.run("1:k", "h2", lambda: {})
+    assert exc.value.status_code == 422
+
+def test_client_errors_are_replayed():
+    store = IdempotencyStore(ttl=60, max_keys=10)
+    def handler():
+        raise HTTPException(status_code=400, detail="No available room")
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            store.run("1:k", "h", handler)
+        assert exc.value.detail == "No available room"
+
+def test_unexpected_errors_free_the_key():
+    store = IdempotencyStore(ttl=60, max_keys=10)
+    def boom():
+        raise RuntimeError("db down")
+    with pytest.raises(RuntimeError):
+        store.run("1:k", "h", boom)
+    assert store.run("1:k", "h", lambda: {"ok": True}) == (200, {"ok": True}, False)
+
+def test_concurrent_duplicates_wait_for_first():
+    store = IdempotencyStore(ttl=60, max_keys=10)
+    started = threading.Event()
+    calls = []
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return {"id": 7}
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.run("1:k", "h", slow)))
+    first.start()
+    started.wait()
+    results.append(store.run("1:k", "h", slow))
+    first.join()
+    assert len(calls) == 1
+    assert sorted(r[2] for r in results) == [False, True]
+
+def test_lru_eviction():
+    store = IdempotencyStore(ttl=60, max_keys=2)
+    for key in ("a", "b", "c"):
+        store.run(key, "h", lambda: {})
+    assert store.run("a", "h", lambda: {"new": True}) == (200, {"new": True}, False)
+
+def test_in_flight_keys_are_never_evicted():
+    store = IdempotencyStore(ttl=60, max_keys=2)
+    release, started = threading.Event(), threading.Event()
+    calls = []
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"id": 1}
+    first = threading.Thread(target=lambda: store.run("slow", "h", slow))
+    first.start()
+    started.wait()
+    store.run("a", "h", lambda: {})
+    # "a" is finished and makes room; "slow" stays
+    store.run("b", "h", lambda: {})
+    entry, owner = store._claim("slow", "h")
+    assert not owner
+    # Only in-flight keys left: new keys are turned away rather than dropping one
+    claimed = threading.Event()
+    second = threading.Thread(target=lambda: store.run("c", "h", lambda: claimed.set() or release.wait(5) or {}))
+    second.start()
+    claimed.wait(5)
+    with pytest.raises(HTTPException) as exc:
+        store.run("d", "h", lambda: {})
+    assert exc.value.status_code == 503
+    release.set()
+    first.join()
+    second.join()
+    assert store.run("slow", "h", slow)[2] is True
+    assert len(calls) == 1
@@ -0,0 +1,32 @@
+import json
+from datetime import date, time
+
+import crud, models
+from responses import FastJSONResponse
+
+def seed(db):
+    room = models.Room(room_type=models.RoomTypeEnum.shared, capacity=4, name="Shared Desk 1")
+    db.add(room)
+    db.commit()
+    db.add_all([
+        models.Booking(room_id=room.id, user_id=1, slot_date=date(2025, 6, 5), slot_start=time(9, 0), slot_end=time(10, 0), is_active=True),
+        models.Booking(room_id=room.id, user_id=2, slot_date=date(2025, 6, 5), slot_start=time(9, 0), slot_end=time(10, 0), is_active=True),
+        models.Booking(room_id=room.id, user_id=1, slot_date=date(2025, 6, 6), slot_start=time(9, 0), slot_end=time(10, 0), is_active=False),
+    ])
+    db.commit()
+    return room
+
+def test_room_rows_are_plain_dicts(memory_db):
+    room = seed(memory_db)
+    rows = crud.get_all_room_rows(memory_db)
+    assert rows == [{"id": room.id, "room_type": "shared", "capacity": 4, "name": "Shared Desk 1"}]
+
+def test_booking_rows_filter_and_serialize(memory_db):
+    seed(memory_db)
+    rows = crud.get_booking_rows(memory_db, user_id=1)
+    assert len(rows) == 1
+    body = json.loads(FastJSONResponse(rows).body)
+    assert body[0]["slot_date"] == "2025-06-05"
+    assert body[0]["slot_start"] == "09:00:00"
+    assert body[0]["is_active"] is True
+    assert len(crud.get_booking_rows(memory_db)) == 2
@@ -0,0 +1,81 @@
+import time
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import profiler
+
+def slow_function():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+def make_app():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False})
+    app = FastAPI()
+    app.add_middleware(profiler.ProfilerMiddleware)
+
+    @app.on_event("startup")
+    def install():
+        profiler.install()
+
+    def get_connection():
+        with engine.connect() as connection:
+            yield connection
+
+    @app.get("/work")
+    def work(connection=Depends(get_connection)):
+        connection.execute(text("SELECT 1"))
+        slow_function()
+        return {"ok": True}
+    return app
+
+def test_profile_tree_and_folded_stacks():
+    profile = profiler.Profile("GET", "/x", "header")
+    profile.stacks[("a", "b")] = 3
+    profile.stacks[("a", "c")] = 1
+    tree = profile.tree()
+    assert tree["samples"] == 4
+    assert [child["name"] for child in tree["children"][0]["children"]] == ["b", "c"]
+    assert profile.hot() == [{"name": "b", "samples": 3}, {"name": "c", "samples": 1}]
+    assert profile.collapsed() == "a;b 3\na;c 1\n"
+
+def test_store_is_bounded():
+    store = profiler.ProfileStore(size=2)
+    profiles = [profiler.Profile("GET", "/x", "sampled") for _ in range(3)]
+    for profile in profiles:
+        store.add(profile)
+    assert store.list() == [profiles[2], profiles[1]]
+    assert store.get(profiles[0].id) is None
+
+def test_header_profile_captures_stacks_and_sql(monkeypatch):
+    monkeypatch.setattr(profiler, "settings", profiler.Settings())
+    monkeypatch.setattr(profiler, "store", profiler.ProfileStore())
+    profiler.settings.enabled = True
+    with TestClient(make_app()) as client:
+        assert "x-profile-id" not in client.get("/work").headers
+        response = client.get("/work", headers={"X-Profile": "1"})
+    profile = profiler.store.get(int(response.headers["x-profile-id"]))
+    assert profile.status_code == 200 and profile.duration_ms >= 50
+    assert any("slow_function" in label for stack in profile.stacks for label in stack)
+    assert [statement["statement"] for statement in profile.statements] == ["SELECT 1"]
+
+def test_slow_threshold_keeps_only_slow_requests(monkeypatch):
+    monkeypatch.setattr(profiler, "settings", profiler.Settings())
+    monkeypatch.setattr(profiler, "store", profiler.ProfileStore())
+    profiler.settings.enabled = True
+    profiler.settings.slow_ms = 60000
+    with TestClient(make_app()) as client:
+        client.get("/work")
+        assert profiler.store.list() == []
+        profiler.settings.slow_ms = 1
+        client.get("/work")
+    assert [profile.trigger for profile in profiler.store.list()] == ["slow"]
+
+def test_disabled_profiler_ignores_header(monkeypatch):
+    monkeypatch.setattr(profiler, "settings", profiler.Settings())
+    monkeypatch.setattr(profiler, "store", profiler.ProfileStore())
+    with TestClient(make_app()) as client:
+        response = client.get("/work", headers={"X-Profile": "1"})
+    assert "x-profile-id" not in response.headers and profiler.store.list() == []
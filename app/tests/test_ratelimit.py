@@ -0,0 +1,91 @@
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import ratelimit, security, tenants
+from ratelimit import MemoryBucketBackend, RateLimitMiddleware, principal, route_class
+
+def test_bucket_allows_burst_then_reports_wait():
+    backend = MemoryBucketBackend()
+    assert [backend.take("u:write", rate=1, burst=2, now=0) for _ in range(2)] == [0, 0]
+    assert backend.take("u:write", rate=1, burst=2, now=0) == 1
+    assert backend.take("u:write", rate=1, burst=2, now=1) == 0
+
+def test_buckets_are_separate_per_key():
+    backend = MemoryBucketBackend()
+    assert backend.take("a:write", rate=1, burst=1, now=0) == 0
+    assert backend.take("a:write", rate=1, burst=1, now=0) > 0
+    assert backend.take("a:read", rate=1, burst=1, now=0) == 0
+    assert backend.take("b:write", rate=1, burst=1, now=0) == 0
+
+def test_route_classes():
+    assert route_class("GET") == "read"
+    assert route_class("POST") == "write"
+    assert route_class("DELETE") == "write"
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/rooms")
+    def rooms():
+        return {"ok": True}
+
+    @app.post("/bookings")
+    def book():
+        return {"ok": True}
+    return RateLimitMiddleware(app, backend=MemoryBucketBackend(), enabled=True)
+
+def bearer(sub):
+    return {"Authorization": f"Bearer {security.create_access_token({'sub': sub})}"}
+
+def test_middleware_rejects_over_the_limit_with_retry_after(monkeypatch):
+    monkeypatch.setitem(ratelimit.ROUTE_CLASSES, "write", (0.1, 2))
+    client = TestClient(make_app())
+    assert [client.post("/bookings", headers=bearer("a@x.com")).status_code for _ in range(2)] == [200, 200]
+    response = client.post("/bookings", headers=bearer("a@x.com"))
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Rate limit exceeded."}
+    assert response.headers["retry-after"] == "10"
+    # Reads have their own bucket, other users their own
+    assert client.get("/rooms", headers=bearer("a@x.com")).status_code == 200
+    assert client.post("/bookings", headers=bearer("b@x.com")).status_code == 200
+
+def test_middleware_answers_503_when_every_slot_is_taken():
+    release, started = threading.Event(), threading.Event()
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        started.set()
+        release.wait(5)
+        return {"ok": True}
+    middleware = RateLimitMiddleware(app, backend=MemoryBucketBackend(), max_concurrency=1, queue_timeout=0.05, enabled=True)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(TestClient(middleware).get("/slow").status_code))
+    thread.start()
+    try:
+        assert started.wait(5)
+        response = TestClient(middleware).get("/slow")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+    finally:
+        release.set()
+        thread.join()
+    assert results == [200]
+    assert TestClient(middleware).get("/slow").status_code == 200
+
+def test_principal_keys_by_bearer_user_then_session_then_ip():
+    token = security.create_access_token({"sub": "a@x.com"})
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    client = ("10.0.0.1", 1234)
+    assert principal({"headers": headers, "session": {"user_id": 5}, "client": client}) == f"user:{tenants.DEFAULT_TENANT}:a@x.com"
+    with tenants.use("acme"):
+        assert principal({"headers": headers, "client": client}) == "user:acme:a@x.com"
+    assert principal({"headers": [], "session": {"user_id": 5}, "client": client}) == f"session:{tenants.DEFAULT_TENANT}:5"
+    # A bad token is not trusted: the caller falls back to its session or address
+    bad = [(b"authorization", b"Bearer not-a-token")]
+    assert principal({"headers": bad, "session": {"user_id": 5}, "client": client}) == f"session:{tenants.DEFAULT_TENANT}:5"
+    assert principal({"headers": bad, "client": client}) == "ip:10.0.0.1"
+    assert principal({"headers": []}) == "ip:unknown"
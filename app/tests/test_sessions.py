@@ -0,0 +1,27 @@
+import time
+
+import models, sessions, tenants
+from sessions import InMemorySessionStore
+
+def test_store_expires_entries():
+    store = InMemorySessionStore(ttl=0.01, max_entries=10)
+    store.set(1, {"principal": "p"})
+    assert store.get(1) == {"principal": "p"}
+    time.sleep(0.02)
+    assert store.get(1) is None
+
+def test_booking_changes_keep_principal(memory_db):
+    user = models.User(name="Ann", email="ann@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+    memory_db.add(user)
+    memory_db.commit()
+    sessions.store.clear()
+
+    principal = sessions.get_principal(memory_db, user.id)
+    assert principal.name == "Ann" and principal.gender == "other"
+    assert sessions.get_first_page(memory_db, user.id) == []
+
+    key = (tenants.current(), user.id)
+    sessions.invalidate_bookings(user.id)
+    assert sessions.store.get(key) == {"principal": principal}
+    sessions.invalidate_user(user.id)
+    assert sessions.store.get(key) is None
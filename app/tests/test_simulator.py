@@ -0,0 +1,71 @@
+from datetime import date, time
+
+import pytest
+from fastapi import HTTPException
+
+import crud, models, schemas
+from simulator import Simulator, replay
+
+DAY = date(2030, 1, 1)
+
+REQUESTS = [
+    ("private", 1, None, 9, 10), ("private", 2, None, 9, 10), ("private", 3, None, 9, 11),
+    ("shared", 3, None, 12, 13), ("shared", 4, None, 12, 14), ("shared", 5, None, 13, 14),
+    ("shared", 1, None, 9, 10), ("conference", None, 1, 9, 10), ("conference", None, 2, 9, 10),
+    ("conference", None, 3, 9, 10), ("conference", None, 1, 10, 11), ("private", None, None, 15, 16),
+]
+
+@pytest.mark.parametrize("strategy", ["first_fit", "best_fit", "least_loaded"])
+def test_simulator_matches_crud(memory_db, strategy):
+    users = [
+        models.User(name=f"u{i}", email=f"u{i}@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        for i in range(6)
+    ]
+    memory_db.add_all(users)
+    rooms = [
+        models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 1"),
+        models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private 2"),
+        models.Room(room_type=models.RoomTypeEnum.shared, capacity=2, name="Shared 1"),
+        models.Room(room_type=models.RoomTypeEnum.shared, capacity=3, name="Shared 2"),
+        models.Room(room_type=models.RoomTypeEnum.conference, capacity=10, name="Large"),
+        models.Room(room_type=models.RoomTypeEnum.conference, capacity=4, name="Small"),
+    ]
+    memory_db.add_all(rooms)
+    teams = [
+        models.Team(name="four", members=users[:4]),
+        models.Team(name="six", members=users),
+        models.Team(name="two", members=users[:2]),
+    ]
+    memory_db.add_all(teams)
+    memory_db.commit()
+
+    simulator = Simulator(
+        [(room.id, room.room_type.value, room.capacity) for room in rooms],
+        {team.id: len(team.members) for team in teams},
+        strategy
+    )
+    for room_type, user_id, team_id, start, end in REQUESTS:
+        request = schemas.BookingCreate(
+            room_type=room_type, user_id=user_id, team_id=team_id,
+            slot_date=DAY, slot_start=time(start, 0), slot_end=time(end, 0)
+        )
+        try:
+            expected = (crud.create_booking(memory_db, request, strategy).room_id, None)
+        except HTTPException as exc:
+            memory_db.rollback()
+            expected = (None, exc.detail)
+        got = simulator.book(room_type, user_id, team_id, DAY.isoformat(), f"{start:02d}:00", f"{end:02d}:00")
+        assert got == expected
+
+def test_replay_cancels_and_reports():
+    simulator = Simulator([(1, "private", 1)])
+    report = replay(simulator, [
+        b'{"room_type": "private", "user_id": 1, "slot_date": "2030-01-01", "slot_start": "09:00:00", "slot_end": "18:00:00", "id": 1}',
+        b'{"room_type": "private", "user_id": 2, "slot_date": "2030-01-01", "slot_start": "10:00:00", "slot_end": "11:00:00"}',
+        b'{"op": "cancel", "id": 1}',
+        b'{"room_type": "private", "user_id": 2, "slot_date": "2030-01-01", "slot_start": "10:00:00", "slot_end": "11:00:00"}',
+        b'{"room_type": "private", "user_id": 3, "slot_date": "2030-01-01", "slot_start": "08:00:00", "slot_end": "09:00:00"}',
+    ])
+    assert report["requests"] == 5
+    assert (report["accepted"], report["cancelled"], report["rejected"]) == (2, 1, 2)
+    assert report["utilization"]["private"] == round(60 / 540, 4)
@@ -0,0 +1,34 @@
+from datetime import date, time, timedelta
+
+import crud, models
+
+def test_free_gaps_exclusive_room():
+    gaps = crud.free_gaps([(600, 660), (540, 570)], capacity=1, day_start=540, day_end=1080)
+    assert gaps == [(570, 600), (660, 1080)]
+
+def test_free_gaps_back_to_back_bookings_leave_no_gap():
+    assert crud.free_gaps([(540, 600), (600, 1080)], capacity=1, day_start=540, day_end=1080) == []
+
+def test_free_gaps_shared_desk_counts_seats():
+    booked = [(540, 660), (600, 720)]
+    assert crud.free_gaps(booked, capacity=2, day_start=540, day_end=1080) == [(540, 600), (660, 1080)]
+    assert crud.free_gaps(booked, capacity=3, day_start=540, day_end=1080) == [(540, 1080)]
+
+def test_free_gaps_respects_window_start():
+    assert crud.free_gaps([(540, 600)], capacity=1, day_start=720, day_end=1080) == [(720, 1080)]
+
+def test_find_earliest_slots(memory_db):
+    day = date(2030, 1, 1)
+    rooms = [models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name=f"Private Room {i}") for i in (1, 2)]
+    memory_db.add_all(rooms)
+    memory_db.commit()
+    memory_db.add_all([
+        models.Booking(room_id=rooms[0].id, user_id=1, slot_date=day, slot_start=time(9, 0), slot_end=time(17, 30), is_active=True),
+        models.Booking(room_id=rooms[1].id, user_id=2, slot_date=day, slot_start=time(9, 0), slot_end=time(12, 0), is_active=True),
+    ])
+    memory_db.commit()
+    slots = crud.find_earliest_slots(memory_db, "private", timedelta(minutes=45), day, day + timedelta(days=1), limit=2)
+    assert [(s["room_id"], s["slot_date"], s["slot_start"], s["slot_end"]) for s in slots] == [
+        (rooms[1].id, day, time(12, 0), time(12, 45)),
+        (rooms[0].id, day + timedelta(days=1), time(9, 0), time(9, 45)),
+    ]
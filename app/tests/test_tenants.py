@@ -0,0 +1,96 @@
+from datetime import date, time
+
+import pytest
+from fastapi import HTTPException
+
+import crud, events, models, schemas, security, tenants
+
+DAY = date(2030, 1, 1)
+
+def scope(host=None, token=None):
+    headers = []
+    if host:
+        headers.append((b"host", host.encode()))
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {"type": "http", "headers": headers}
+
+def add_office(db, tenant):
+    with tenants.use(tenant):
+        user = models.User(name="u", email="u@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        room = models.Room(name="P1", room_type=models.RoomTypeEnum.private, capacity=1)
+        db.add_all([user, room])
+        db.commit()
+        return user.id, room.id
+
+def test_rows_are_scoped_to_the_current_tenant(memory_db):
+    acme_user, acme_room = add_office(memory_db, "acme")
+    globex_user, globex_room = add_office(memory_db, "globex")
+    with tenants.use("acme"):
+        assert [r.id for r in memory_db.query(models.Room).all()] == [acme_room]
+        assert crud.get_user(memory_db, globex_user) is None
+        assert crud.get_user_by_email(memory_db, "u@x.com").id == acme_user
+    with tenants.use("globex"):
+        assert [r.id for r in memory_db.query(models.Room).all()] == [globex_room]
+    assert memory_db.query(models.Room).execution_options(all_tenants=True).count() == 2
+
+def test_allocation_only_picks_rooms_of_the_tenant(memory_db):
+    add_office(memory_db, "acme")
+    globex_user, globex_room = add_office(memory_db, "globex")
+    request = schemas.BookingCreate(
+        room_type="private", user_id=globex_user, slot_date=DAY, slot_start=time(9, 0), slot_end=time(10, 0)
+    )
+    with tenants.use("globex"):
+        assert crud.create_booking(memory_db, request).room_id == globex_room
+        other = models.User(name="v", email="v@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other)
+        memory_db.add(other)
+        memory_db.commit()
+        # globex's only private room is taken; acme's free one must not be used
+        with pytest.raises(HTTPException):
+            crud.create_booking(memory_db, request.copy(update={"user_id": other.id}))
+
+def test_resolve_from_host_and_token(monkeypatch):
+    monkeypatch.setattr(tenants, "TENANT_BASE_DOMAIN", "rooms.test")
+    token = security.create_access_token({"sub": "u@x.com", "tenant": "acme"})
+    assert tenants.resolve(scope(host="acme.rooms.test")) == "acme"
+    assert tenants.resolve(scope(token=token)) == "acme"
+    assert tenants.resolve(scope(host="rooms.test")) == tenants.DEFAULT_TENANT
+    assert tenants.resolve(scope(host="acme.rooms.test", token=token)) == "acme"
+    with pytest.raises(PermissionError):
+        tenants.resolve(scope(host="globex.rooms.test", token=token))
+    with pytest.raises(tenants.UnknownTenant):
+        tenants.resolve(scope(host="Bad!.rooms.test"))
+
+def test_events_are_handled_in_the_publishing_tenant():
+    seen = []
+    bus = events.Bus()
+    bus.subscribe(events.UserRevoked, lambda event: seen.append((tenants.current(), event.user_id)))
+    with tenants.use("acme"):
+        payload = events.encode(events.UserRevoked(7), "other-worker")
+    bus._receive(payload)
+    assert seen == [("acme", 7)]
+
+def test_engine_cache_disposes_least_recently_used(monkeypatch):
+    created, disposed = [], []
+
+    class FakeEngine:
+        def __init__(self, tenant):
+            self.tenant = tenant
+
+        def dispose(self):
+            disposed.append(self.tenant)
+
+    def create(tenant):
+        created.append(tenant)
+        return FakeEngine(tenant), True
+    monkeypatch.setattr(tenants, "_create_engine", create)
+    cache = tenants.EngineCache(max_engines=2)
+    a = cache.get("a")
+    cache.get("b")
+    assert cache.get("a") is a
+    cache.get("c")
+    assert disposed == ["b"]
+    assert len(cache) == 2
+    cache.get("b")
+    assert created == ["a", "b", "c", "b"]
+    assert disposed == ["b", "a"]
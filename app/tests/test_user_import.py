@@ -0,0 +1,50 @@
+import io
+
+import models, security, user_import
+
+CSV = (
+    "name,email,password,age,gender,is_admin\n"
+    "Ann,ann@x.com,secret1,30,female,\n"
+    "Bob,bob@x.com,secret2,41,male,true\n"
+    "Dup,ann@x.com,secret3,30,female,\n"
+    "Old,old@x.com,secret4,30,other,\n"
+    "Bad,not-an-email,secret5,30,other,\n"
+)
+
+def test_import_reports_row_errors_and_creates_the_rest(memory_db):
+    memory_db.add(models.User(name="Old", email="old@x.com", hashed_password="x", age=30, gender=models.GenderEnum.other))
+    memory_db.commit()
+    progress, inserts = [], []
+    reports = user_import.import_batches(
+        memory_db, user_import.read_rows(io.BytesIO(CSV.encode()), "csv"), batch_size=2, workers=1,
+        before_insert=lambda: inserts.append(1)
+    )
+    for report in reports:
+        progress.append(report.rows)
+    report = report.as_dict()
+    assert (report["rows"], report["created"], report["failed"]) == (5, 2, 3)
+    # Only the first batch had new users to insert
+    assert inserts == [1]
+    assert [(e["row"], e["error"]) for e in report["errors"]] == [
+        (3, "Duplicate of row 1"),
+        (4, "Email already registered"),
+        (5, "email: value is not a valid email address"),
+    ]
+    assert progress == [2, 5]
+    bob = memory_db.query(models.User).filter_by(email="bob@x.com").one()
+    assert bob.is_admin and bob.age == 41 and security.verify_password("secret2", bob.hashed_password)
+
+def test_jsonl_import_hashes_in_a_process_pool(memory_db):
+    lines = b"".join(
+        b'{"name": "U%d", "email": "u%d@x.com", "password": "pw%d", "age": 20, "gender": "other"}\n' % (i, i, i)
+        for i in range(3)
+    ) + b"not json\n"
+    report = user_import.import_users(memory_db, user_import.read_rows(io.BytesIO(lines), "jsonl"), workers=2)
+    assert (report["created"], report["failed"]) == (3, 1)
+    user = memory_db.query(models.User).filter_by(email="u2@x.com").one()
+    assert security.verify_password("pw2", user.hashed_password)
+
+def test_detect_format():
+    assert user_import.detect_format("users.CSV") == "csv"
+    assert user_import.detect_format("users.ndjson") == "jsonl"
+    assert user_import.detect_format("upload", "application/json") == "json"
@@ -0,0 +1,97 @@
+from datetime import date, time, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+import crud, models, schemas, waitlist
+
+SLOT_DATE = date.today() + timedelta(days=1)
+
+def make_user(db, email):
+    user = models.User(name=email, email=email, hashed_password="x", age=30, gender=models.GenderEnum.other)
+    db.add(user)
+    db.commit()
+    return user
+
+def request_for(user, priority=0):
+    return schemas.WaitlistCreate(
+        room_type="private", user_id=user.id, slot_date=SLOT_DATE,
+        slot_start=time(9, 0), slot_end=time(10, 0), priority=priority
+    )
+
+def test_cancellation_promotes_highest_priority_waiter(memory_db):
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"))
+    memory_db.commit()
+    holder, early, vip = (make_user(memory_db, e) for e in ("holder@x.com", "early@x.com", "vip@x.com"))
+
+    booked = waitlist.join_waitlist(memory_db, request_for(holder))
+    assert booked.status == models.WaitlistStatusEnum.promoted
+    first = waitlist.join_waitlist(memory_db, request_for(early))
+    second = waitlist.join_waitlist(memory_db, request_for(vip, priority=5))
+    assert first.status == second.status == models.WaitlistStatusEnum.waiting
+
+    crud.cancel_booking(memory_db, booked.booking_id)
+    promoted = waitlist.promote_waiters(memory_db, SLOT_DATE, "private", time(9, 0), time(10, 0))
+
+    assert [entry.user_id for entry in promoted] == [vip.id]
+    assert waitlist.get_waitlist_entry(memory_db, first.id).status == models.WaitlistStatusEnum.waiting
+    assert len(waitlist.pop_notifications(memory_db, vip.id)) == 1
+    assert waitlist.pop_notifications(memory_db, vip.id) == []
+
+def test_racing_promotions_leave_the_promoted_entry_alone(memory_db):
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"))
+    memory_db.commit()
+    holder, waiter = make_user(memory_db, "holder@x.com"), make_user(memory_db, "waiter@x.com")
+    booked = waitlist.join_waitlist(memory_db, request_for(holder))
+    entry = waitlist.join_waitlist(memory_db, request_for(waiter))
+    crud.cancel_booking(memory_db, booked.booking_id)
+
+    # A second promotion task loaded the same waiting entry before the first one promoted it
+    other = Session(bind=memory_db.get_bind())
+    stale = other.query(models.WaitlistEntry).filter(models.WaitlistEntry.id == entry.id).one()
+    assert [e.id for e in waitlist.promote_waiters(memory_db, SLOT_DATE, "private", time(9, 0), time(10, 0))] == [entry.id]
+    assert waitlist._promote(other, stale) is None
+    other.close()
+
+    memory_db.expire_all()
+    entry = waitlist.get_waitlist_entry(memory_db, entry.id)
+    assert entry.status == models.WaitlistStatusEnum.promoted
+    assert crud.get_booking(memory_db, entry.booking_id).is_active
+
+def test_booking_and_promotion_commit_together(memory_db):
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.private, capacity=1, name="Private Room 1"))
+    memory_db.commit()
+    holder, waiter = make_user(memory_db, "holder@x.com"), make_user(memory_db, "waiter@x.com")
+    booked = waitlist.join_waitlist(memory_db, request_for(holder))
+    entry = waitlist.join_waitlist(memory_db, request_for(waiter))
+    crud.cancel_booking(memory_db, booked.booking_id)
+
+    # The waiter leaves the waitlist while a promotion task is booking the entry it loaded
+    other = Session(bind=memory_db.get_bind())
+    stale = other.query(models.WaitlistEntry).filter(models.WaitlistEntry.id == entry.id).one()
+    waitlist.leave_waitlist(memory_db, entry)
+    assert waitlist._promote(other, stale) is None
+    other.close()
+
+    memory_db.expire_all()
+    assert waitlist.get_waitlist_entry(memory_db, entry.id).status == models.WaitlistStatusEnum.cancelled
+    assert crud.get_bookings(memory_db, user_id=waiter.id) == []
+
+def test_team_larger_than_every_room_is_rejected_not_queued(memory_db):
+    memory_db.add(models.Room(room_type=models.RoomTypeEnum.conference, capacity=4, name="Small"))
+    users = [make_user(memory_db, f"u{i}@x.com") for i in range(5)]
+    small, crowd = models.Team(name="small", members=users[:3]), models.Team(name="crowd", members=users)
+    memory_db.add_all([small, crowd])
+    memory_db.commit()
+
+    def request(team):
+        return schemas.WaitlistCreate(
+            room_type="conference", user_id=users[0].id, team_id=team.id, slot_date=SLOT_DATE,
+            slot_start=time(9, 0), slot_end=time(10, 0)
+        )
+    assert waitlist.join_waitlist(memory_db, request(small)).status == models.WaitlistStatusEnum.promoted
+    with pytest.raises(HTTPException) as exc:
+        waitlist.join_waitlist(memory_db, request(crowd))
+    assert not isinstance(exc.value, crud.RoomUnavailable) and exc.value.status_code == 400
+    assert memory_db.query(models.WaitlistEntry).filter(models.WaitlistEntry.team_id == crowd.id).count() == 0
@@ -0,0 +1,239 @@
+"""
+Bulk user import from CSV or JSON, for onboarding a customer in one go.
+Rows are read as a stream and handled in batches:
+- one query per batch finds emails that are already registered
+- passwords are hashed in parallel across a process pool
+- each batch is inserted with one executemany and committed
+
+Every row gets the same validation as /api/v1/auth/register. A row that
+fails is reported with its number and the reason, and the import goes on.
+
+Columns/keys: name, email, password, age, gender, is_admin (optional).
+CSV needs a header row. JSON is a list of objects, or JSON Lines.
+
+Usage:
+    python user_import.py users.csv [--format csv|json|jsonl] [--batch-size 500] [--workers N]
+"""
+import argparse
+import codecs
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models, schemas, security
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Processes hashing passwords; bcrypt is CPU bound, so one per core
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Row errors listed in the report; the counts are always complete
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+FORMATS = ("csv", "json", "jsonl")
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type:
+        return "jsonl"
+    if name.endswith(".json") or content_type.endswith("json"):
+        return "json"
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    raise ValueError("Unknown import format, expected a .csv, .json or .jsonl file.")
+
+def read_rows(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, object]]:
+    """(row number, raw row) pairs; rows are numbered from 1 and CSV rows exclude the header"""
+    if fmt == "csv":
+        text = codecs.getreader("utf-8-sig")(stream)
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            # Empty cells mean "not given", so optional fields take their defaults
+            yield number, {key: value for key, value in row.items() if key and value not in (None, "")}
+    elif fmt == "jsonl":
+        number = 0
+        for line in stream:
+            if line.strip():
+                number += 1
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, e
+    elif fmt == "json":
+        # A JSON array has to be parsed whole; use JSON Lines for very large files
+        rows = json.load(stream)
+        if not isinstance(rows, list):
+            raise ValueError("A JSON import must be a list of users.")
+        yield from enumerate(rows, start=1)
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self.started = time.perf_counter()
+
+    def error(self, row: int, email: Optional[str], message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "email": email, "error": message})
+
+    def as_dict(self, errors: bool = True) -> dict:
+        result = {
+            "rows": self.rows,
+            "created": self.created,
+            "failed": self.failed,
+            "seconds": round(time.perf_counter() - self.started, 3),
+        }
+        if errors:
+            result["errors"] = sorted(self.errors, key=lambda e: e["row"])
+            result["errors_truncated"] = self.failed > len(self.errors)
+        return result
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def _hash(password: str) -> str:
+    return security.get_password_hash(password)
+
+def _insert(db: Session, users: List[dict], numbers: List[int], report: ImportReport):
+    try:
+        db.execute(insert(models.User.__table__), users)
+        db.commit()
+        report.created += len(users)
+        return
+    except IntegrityError:
+        # Someone registered one of these emails meanwhile: find it row by row
+        db.rollback()
+    for user, number in zip(users, numbers):
+        try:
+            with db.begin_nested():
+                db.execute(insert(models.User.__table__), user)
+            report.created += 1
+        except IntegrityError:
+            report.error(number, user["email"], "Email already registered")
+    db.commit()
+
+def import_batches(db: Session, rows: Iterable[Tuple[int, object]], batch_size: int = IMPORT_BATCH_SIZE,
+                   workers: int = IMPORT_HASH_WORKERS,
+                   before_insert: Optional[Callable[[], None]] = None) -> Iterator[ImportReport]:
+    """
+    Import the rows, yielding the running report after each batch.
+    `before_insert` runs before each batch is inserted, e.g. to renew a deadline.
+    """
+    report = ImportReport()
+    seen: Dict[str, int] = {}
+    executor = None
+    try:
+        batch: List[Tuple[int, schemas.UserCreate]] = []
+        rows = iter(rows)
+        while True:
+            exhausted = True
+            for number, raw in rows:
+                report.rows += 1
+                email = raw.get("email") if isinstance(raw, dict) else None
+                if isinstance(raw, Exception):
+                    report.error(number, None, f"Invalid JSON: {raw}")
+                    continue
+                if not isinstance(raw, dict):
+                    report.error(number, None, "Expected an object with the user's fields.")
+                    continue
+                try:
+                    user = schemas.UserCreate(**raw)
+                    models.GenderEnum(user.gender)
+                except ValidationError as e:
+                    report.error(number, email, _validation_message(e))
+                    continue
+                except ValueError:
+                    report.error(number, email, "gender must be one of male, female, other")
+                    continue
+                if user.email in seen:
+                    report.error(number, user.email, f"Duplicate of row {seen[user.email]}")
+                    continue
+                seen[user.email] = number
+                batch.append((number, user))
+                if len(batch) >= batch_size:
+                    exhausted = False
+                    break
+            if batch:
+                existing = set(db.execute(select(models.User.email).where(
+                    models.User.email.in_([user.email for _, user in batch])
+                )).scalars())
+                db.rollback()  # end the read transaction before the slow part
+                for number, user in batch:
+                    if user.email in existing:
+                        report.error(number, user.email, "Email already registered")
+                batch = [(number, user) for number, user in batch if user.email not in existing]
+            if batch:
+                passwords = [user.password for _, user in batch]
+                if workers > 1 and len(batch) > 1:
+                    if executor is None:
+                        # spawn, not fork: the web worker has threads and open connections
+                        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+                    hashes = list(executor.map(_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+                else:
+                    hashes = [_hash(password) for password in passwords]
+                users = [{
+                    "name": user.name,
+                    "email": user.email,
+                    "hashed_password": hashed,
+                    "age": user.age,
+                    "gender": models.GenderEnum(user.gender),
+                    "is_admin": user.is_admin,
+                    "is_active": True,
+                } for (_, user), hashed in zip(batch, hashes)]
+                if before_insert:
+                    before_insert()
+                _insert(db, users, [number for number, _ in batch], report)
+                batch = []
+            yield report
+            if exhausted:
+                return
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def import_users(db: Session, rows: Iterable[Tuple[int, object]], batch_size: int = IMPORT_BATCH_SIZE,
+                 workers: int = IMPORT_HASH_WORKERS, progress: Optional[Callable[[ImportReport], None]] = None) -> dict:
+    report = ImportReport()
+    for report in import_batches(db, rows, batch_size, workers):
+        if progress:
+            progress(report)
+    return report.as_dict()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="CSV, JSON or JSON Lines file, '-' for stdin (needs --format)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=IMPORT_HASH_WORKERS, help="password hashing processes")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    fmt = args.format or detect_format(args.file)
+
+    def progress(report: ImportReport):
+        print(f"{report.rows} rows, {report.created} created, {report.failed} failed", file=sys.stderr)
+
+    db = SessionLocal()
+    try:
+        if args.file == "-":
+            result = import_users(db, read_rows(sys.stdin.buffer, fmt), args.batch_size, args.workers, progress)
+        else:
+            with open(args.file, "rb") as f:
+                result = import_users(db, read_rows(f, fmt), args.batch_size, args.workers, progress)
+    finally:
+        db.close()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+from datetime import date, time
+from typing import List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+import crud, models, schemas
+from database import SessionLocal
+
+# Waitlist: queued booking requests per (date, room type, slot), promoted on cancellation
+
+def waitlist_row(entry: models.WaitlistEntry) -> dict:
+    return {
+        "id": entry.id,
+        "user_id": entry.user_id,
+        "team_id": entry.team_id,
+        "room_type": entry.room_type.value if hasattr(entry.room_type, 'value') else entry.room_type,
+        "slot_date": entry.slot_date,
+        "slot_start": entry.slot_start,
+        "slot_end": entry.slot_end,
+        "priority": entry.priority,
+        "status": entry.status.value if hasattr(entry.status, 'value') else entry.status,
+        "booking_id": entry.booking_id,
+    }
+
+def _booking_request(entry: models.WaitlistEntry) -> schemas.BookingCreate:
+    return schemas.BookingCreate(
+        room_type=entry.room_type.value,
+        user_id=entry.user_id,
+        team_id=entry.team_id,
+        slot_date=entry.slot_date,
+        slot_start=entry.slot_start,
+        slot_end=entry.slot_end
+    )
+
+def join_waitlist(db: Session, request: schemas.WaitlistCreate) -> models.WaitlistEntry:
+    """
+    Book straight away when a room is free, otherwise queue the request.
+    Requests that break the booking rules are rejected rather than queued.
+    """
+    existing = db.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.user_id == request.user_id,
+        models.WaitlistEntry.slot_date == request.slot_date,
+        models.WaitlistEntry.slot_start < request.slot_end,
+        models.WaitlistEntry.slot_end > request.slot_start,
+        models.WaitlistEntry.status == models.WaitlistStatusEnum.waiting
+    ).first()
+    if existing:
+        raise HTTPException(status_code=400, detail="User is already on the waitlist for this slot.")
+    entry = models.WaitlistEntry(
+        user_id=request.user_id,
+        team_id=request.team_id,
+        room_type=request.room_type,
+        slot_date=request.slot_date,
+        slot_start=request.slot_start,
+        slot_end=request.slot_end,
+        priority=request.priority,
+        status=models.WaitlistStatusEnum.waiting
+    )
+    try:
+        booking = crud.create_booking(db, request)
+    except crud.RoomUnavailable:
+        db.rollback()
+    else:
+        entry.status = models.WaitlistStatusEnum.promoted
+        entry.booking_id = booking.id
+        entry.notified = True
+    db.add(entry)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+def get_user_waitlist(db: Session, user_id: int) -> List[models.WaitlistEntry]:
+    return db.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.user_id == user_id,
+        models.WaitlistEntry.status != models.WaitlistStatusEnum.cancelled
+    ).order_by(models.WaitlistEntry.slot_date, models.WaitlistEntry.slot_start).all()
+
+def get_waitlist_entry(db: Session, entry_id: int):
+    return db.query(models.WaitlistEntry).filter(models.WaitlistEntry.id == entry_id).first()
+
+def leave_waitlist(db: Session, entry: models.WaitlistEntry) -> models.WaitlistEntry:
+    if entry.status != models.WaitlistStatusEnum.waiting:
+        raise HTTPException(status_code=400, detail="Waitlist entry is no longer waiting.")
+    entry.status = models.WaitlistStatusEnum.cancelled
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+def promote_waiters(db: Session, slot_date: date, room_type: str, slot_start: time, slot_end: time) -> List[models.WaitlistEntry]:
+    """
+    Offer the capacity freed by a cancellation to waiters whose slot overlaps
+    it, highest priority first, then first come first served. Each waiter goes
+    through crud.create_booking, so team size and seat rules still apply.
+    """
+    if slot_date < date.today():
+        return []
+    waiters = db.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.slot_date == slot_date,
+        models.WaitlistEntry.room_type == room_type,
+        models.WaitlistEntry.status == models.WaitlistStatusEnum.waiting,
+        models.WaitlistEntry.slot_start < slot_end,
+        models.WaitlistEntry.slot_end > slot_start
+    ).order_by(models.WaitlistEntry.priority.desc(), models.WaitlistEntry.id).all()
+    promoted = []
+    for entry in waiters:
+        if _promote(db, entry):
+            promoted.append(entry)
+    return promoted
+
+def _set_status(db: Session, entry_id: int, status: models.WaitlistStatusEnum, *conditions) -> bool:
+    """Conditional status change, committed; False when the entry no longer matches"""
+    changed = db.execute(
+        update(models.WaitlistEntry).where(models.WaitlistEntry.id == entry_id, *conditions)
+        .values(status=status).execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.commit()
+    return changed
+
+class _ClaimLost(Exception):
+    """The entry stopped waiting while it was being booked"""
+
+def _promote(db: Session, entry: models.WaitlistEntry) -> Optional[models.Booking]:
+    """
+    Book a waiting entry. The booking and the entry's change to promoted
+    (conditional on it still waiting) commit in one transaction: when
+    promotion tasks for overlapping slots race, the loser's booking is rolled
+    back, and a failure never leaves a promoted entry without its booking.
+    """
+    waiting = models.WaitlistStatusEnum.waiting
+
+    def claim(booking: models.Booking):
+        claimed = db.execute(
+            update(models.WaitlistEntry).where(models.WaitlistEntry.id == entry.id, models.WaitlistEntry.status == waiting)
+            .values(status=models.WaitlistStatusEnum.promoted, booking_id=booking.id)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if not claimed:
+            raise _ClaimLost()
+    try:
+        booking = crud.create_booking(db, _booking_request(entry), before_commit=claim)
+    except (_ClaimLost, crud.RoomUnavailable):
+        db.rollback()
+        return None
+    except HTTPException:
+        # The request no longer fits the rules (e.g. the user booked elsewhere)
+        db.rollback()
+        _set_status(db, entry.id, models.WaitlistStatusEnum.cancelled, models.WaitlistEntry.status == waiting)
+        return None
+    return booking
+
+def promote_waiters_task(slot_date: date, room_type: str, slot_start: time, slot_end: time):
+    """Background task entry point, runs after the cancel response is sent"""
+    db = SessionLocal()
+    try:
+        promote_waiters(db, slot_date, room_type, slot_start, slot_end)
+    finally:
+        db.close()
+
+def promote_waiters_for_slots_task(slots: List[tuple]):
+    """Background task after a bulk cancellation: slots are (slot_date, room_type, slot_start, slot_end)"""
+    db = SessionLocal()
+    try:
+        for slot_date, room_type, slot_start, slot_end in slots:
+            promote_waiters(db, slot_date, room_type, slot_start, slot_end)
+    finally:
+        db.close()
+
+def pop_notifications(db: Session, user_id: int) -> List[str]:
+    """Messages for promotions the user has not seen yet, shown on the dashboard"""
+    entries = db.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.user_id == user_id,
+        models.WaitlistEntry.status == models.WaitlistStatusEnum.promoted,
+        models.WaitlistEntry.booking_id != None,
+        models.WaitlistEntry.notified == False
+    ).all()
+    messages = []
+    for entry in entries:
+        messages.append(
+            f"A {entry.room_type.value} room opened up on {entry.slot_date} "
+            f"{entry.slot_start.strftime('%H:%M')}-{entry.slot_end.strftime('%H:%M')} and has been booked for you."
+        )
+        entry.notified = True
+    if entries:
+        db.commit()
+    return messages